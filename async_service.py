@@ -0,0 +1,456 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import time
+from typing import Optional, Callable
+
+import protocol
+from log import get_logger
+from service import Service
+from subscription import Subscriber
+
+
+logger = get_logger(__name__)
+
+
+class AsyncService(Service):
+    """
+    Вариант базового класса Service, работающий в одном цикле событий asyncio.
+
+    Протокол (обе версии, см. `protocol`), служебные команды (`enable`, `disable`, `close`, `restart`, `stats`,
+    `subscribe`, `unsubscribe`), метрики и методы-точки расширения `_do_job`, `_request_handler`
+    и `_process_message` совпадают с `Service`. События подписок отправляются задачами цикла событий
+    вместо отдельных потоков.
+    Наследник `Service` может перейти на этот класс, заменив базовый класс.
+
+    Сервер создается через `asyncio.start_server`, поэтому ни прием подключений, ни обмен с клиентами
+    не требует отдельных потоков и опроса по таймауту, а `stop`, `close` и `restart` срабатывают сразу.
+    Блокирующие операции — `_do_job` (например, распознавание YOLO) и `_request_handler` —
+    выполняются в пуле потоков цикла событий. Запросы другим сервисам (`run_client`), как и в `Service`,
+    ставятся в очередь `client_pool` и отправляются по постоянным соединениям с каждым сервером.
+
+    :Параметры:
+    - `ip_ (str)` — IP-адрес для привязки сервиса.
+    - `port_ (int)` — Номер порта для привязки сервиса.
+    - `n_conn_ (int, необязательно)` — Максимальное количество одновременно обрабатываемых запросов; соединения,
+      ожидающие следующего запроса, не учитываются (по умолчанию - 10).
+    - `n_workers_ (int, необязательно)` — Количество потоков для `_request_handler` (по умолчанию - 4).
+
+    :Атрибуты:
+    - `server (asyncio.Server)` — Сервер asyncio, пока сервис запущен.
+    - Остальные атрибуты совпадают с атрибутами `Service`.
+
+    :Методы:
+    - `__recv_msg(self, reader) -> bytes` — Приватная сопрограмма для приема сообщения.
+    - `__send_msg(self, writer, msg) -> None` — Приватная сопрограмма для отправки сообщения.
+    - `__stream_events(self, writer, lock, subscriber, request_id) -> None` — Приватная сопрограмма для отправки
+      событий подписки клиенту.
+    - `__subscribe_v1(self, writer, request) -> Optional[Subscriber]` — Приватная сопрограмма для обработки команды
+      `subscribe` на соединении версии 1.
+    - `__serve_message(self, writer, lock, payload, subscribers) -> None` — Приватная сопрограмма для обработки
+      запроса версии 2.
+    - `__evict_idle(self) -> bool` — Приватный метод для освобождения места под новое подключение
+      сверх `max_idle_conn`.
+    - `__handle_client(self, reader, writer) -> None` — Приватная сопрограмма для обслуживания подключения.
+    - `__serve(self) -> None` — Приватная сопрограмма, выполняющая сервер и задачу сервиса.
+    - `_run_client(self, ip, port, request, response_handler) -> None` — Сопрограмма для отправки запроса на сервер
+      по отдельному соединению.
+    - `_serve_once(self) -> None` — Метод для одного запуска сервера.
+    - `stop(self) -> None` — Метод для остановки сервера.
+
+    """
+
+    def __init__(self, ip_: str, port_: int, n_conn_=10, n_workers_=4):
+        """
+        Конструктор класса.
+
+        """
+        super().__init__(ip_, port_, n_conn_, n_workers_)
+        self.__loop = None
+        self.__stopping = None
+        self.__conn_slots = None
+        self.__client_tasks = set()
+        self.__idle_tasks = {}
+
+    async def __recv_msg(self, reader) -> bytes:
+        """
+        Приватная сопрограмма для приема сообщения.
+
+        :Параметры:
+        - `reader (asyncio.StreamReader)` — Поток, из которого происходит прием сообщения.
+
+        Получает длину сообщения из первых 4 байтов, затем принимает сообщение указанной длины.
+
+        """
+        raw_msglen = await reader.readexactly(protocol.LENGTH.size)
+        msglen = protocol.LENGTH.unpack(raw_msglen)[0]
+        return await reader.readexactly(msglen)
+
+    async def __send_msg(self, writer, msg: bytes) -> None:
+        """
+        Приватная сопрограмма для отправки сообщения.
+
+        :Параметры:
+        - `writer (asyncio.StreamWriter)` — Поток, в который происходит отправка сообщения.
+        - `msg (bytes)` — Сообщение для отправки.
+
+        """
+        writer.write(protocol.pack_frame(msg))
+        await writer.drain()
+
+    async def __stream_events(self, writer, lock: Optional[asyncio.Lock], subscriber: Subscriber,
+                              request_id: Optional[int] = None, reader=None) -> None:
+        """
+        Приватная сопрограмма для отправки событий подписки клиенту.
+
+        :Параметры:
+        - `writer (asyncio.StreamWriter)` — Поток, в который отправляются события.
+        - `lock (asyncio.Lock, необязательно)` — Блокировка записи в поток соединения версии 2.
+        - `subscriber (Subscriber)` — Подписка.
+        - `request_id (int, необязательно)` — Номер запроса `subscribe` для соединения версии 2; None — соединение
+          версии 1.
+        - `reader (asyncio.StreamReader, необязательно)` — Поток соединения версии 1, который после подписки
+          читается только для того, чтобы узнать о его закрытии клиентом; входящие данные отбрасываются.
+
+        Ожидает событий без опроса: подписка пробуждает цикл событий при добавлении события в очередь
+        (`Subscriber.on_put`). Отправляет события, пока подписка не отменена, клиент не закрыл соединение
+        версии 1 или отправка не завершилась ошибкой (в том числе по таймауту `timeout` у клиента, который
+        не принимает данные), затем отменяет подписку.
+
+        """
+        loop = self.__loop
+        wake = asyncio.Event()
+
+        def on_put() -> None:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+        async def watch_reader() -> None:
+            try:
+                while await reader.read(65536):
+                    pass
+            except OSError:
+                pass
+            self.subscriptions.unsubscribe(subscriber.id)
+
+        subscriber.on_put = on_put
+        watcher = asyncio.create_task(watch_reader()) if reader is not None else None
+        try:
+            while not subscriber.closed:
+                ok, event = subscriber.queue.get(timeout=0)
+                if not ok:
+                    wake.clear()
+                    if not subscriber.queue.depth() and not subscriber.closed:
+                        await wake.wait()
+                    continue
+                body = event.encode(subscriber.binary)
+                if request_id is None:
+                    await asyncio.wait_for(self.__send_msg(writer, body), self.timeout)
+                else:
+                    async with lock:
+                        writer.write(protocol.pack_message(protocol.MSG_EVENT, request_id, body))
+                        await asyncio.wait_for(writer.drain(), self.timeout)
+                subscriber.n_sent += 1
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.info("Subscription %s closed: %r", subscriber.id, e)
+        finally:
+            subscriber.on_put = None
+            self.subscriptions.unsubscribe(subscriber.id)
+            if watcher is not None:
+                watcher.cancel()
+
+    async def __subscribe_v1(self, writer, request: str) -> Optional[Subscriber]:
+        """
+        Приватная сопрограмма для обработки команды `subscribe` на соединении версии 1.
+
+        :Параметры:
+        - `writer (asyncio.StreamWriter)` — Поток, в который отправляется ответ.
+        - `request (str)` — Команда `subscribe`.
+
+        Создает подписку и подтверждает ее ответом `subscribed <номер подписки>`. Если команда записана неверно,
+        отвечает `subscribe error: ...` и возвращает None — соединение можно использовать для следующего запроса.
+
+        """
+        try:
+            subscriber = self._subscribe(request)
+        except (ValueError, RuntimeError) as e:
+            await asyncio.wait_for(self.__send_msg(writer, f"subscribe error: {e}".encode("utf-8")), self.timeout)
+            return None
+        try:
+            await asyncio.wait_for(self.__send_msg(writer, f"subscribed {subscriber.id}".encode("utf-8")),
+                                   self.timeout)
+        except BaseException:
+            self.subscriptions.unsubscribe(subscriber.id)
+            raise
+        self._requests_total.inc()
+        return subscriber
+
+    async def __serve_message(self, writer, lock: asyncio.Lock, payload: bytes, subscribers: set) -> None:
+        """
+        Приватная сопрограмма для обработки запроса версии 2.
+
+        :Параметры:
+        - `writer (asyncio.StreamWriter)` — Поток, в который отправляется ответ.
+        - `lock (asyncio.Lock)` — Блокировка записи в поток соединения.
+        - `payload (bytes)` — Полученное сообщение.
+        - `subscribers (set)` — Подписки соединения, отменяемые при его закрытии.
+
+        Обрабатывает запрос методом `_process_message` в пуле потоков и отправляет ответ с номером запроса,
+        занимая на это время одно из `n_conn` мест обработки. После ответа на команду `subscribe` отправляет события подписки с номером этого запроса
+        (`__stream_events`). Ошибка обработки отправляется клиенту сообщением `MSG_ERROR`. Если сообщение
+        не удалось разобрать или ответ не удалось отправить, соединение закрывается.
+
+        """
+        start = time.perf_counter()
+        try:
+            message = protocol.unpack_message(payload)
+            if message.msg_type != protocol.MSG_REQUEST:
+                raise ValueError(f"unexpected message type {message.msg_type}")
+            request = message.body.decode("utf-8")
+            logger.debug("Received #%s: %s", message.request_id, request)
+            subscriber = None
+            async with self.__conn_slots:
+                try:
+                    if request.split(" ", 1)[0].lower() == "subscribe":
+                        subscriber = self._subscribe(request, bool(message.flags & protocol.FLAG_BINARY))
+                        subscribers.add(subscriber)
+                        msg_type, body = protocol.MSG_RESPONSE, f"subscribed {subscriber.id}".encode("utf-8")
+                    else:
+                        msg_type, body = await self.__loop.run_in_executor(None, self._process_message, request,
+                                                                           message.flags)
+                except Exception as e:
+                    self._request_errors_total.inc()
+                    logger.warning("Server error when handling request: %r", e)
+                    msg_type, body = protocol.MSG_ERROR, str(e).encode("utf-8")
+                async with lock:
+                    writer.write(protocol.pack_message(msg_type, message.request_id, body))
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+            self._requests_total.inc()
+            self._request_seconds.observe(time.perf_counter() - start)
+            if subscriber is not None:
+                await self.__stream_events(writer, lock, subscriber, message.request_id)
+        except Exception as e:
+            self._request_errors_total.inc()
+            logger.warning("Server error when handling client: %r", e)
+            writer.close()
+
+    async def __handle_client(self, reader, writer) -> None:
+        """
+        Приватная сопрограмма для обслуживания подключения.
+
+        Первый запрос должен быть получен целиком не позднее чем через `timeout` секунд. Запрос
+        обрабатывается методом `_process_request` в пуле потоков, результат отправляется клиенту.
+        После ответа соединение ожидает следующего запроса не дольше `keepalive_timeout` секунд (соединение
+        версии 2 с действующими подписками — без ограничения); истечение этого срока — обычное закрытие
+        простаивающего соединения, а не ошибка.
+        Если первый запрос соединения относится к версии 2 протокола, каждый запрос обрабатывается
+        в отдельной задаче (`__serve_message`), и следующий запрос принимается, не дожидаясь ответа
+        на предыдущий; перед закрытием соединения отменяет его подписки и дожидается отправки всех ответов.
+        После команды `subscribe` соединение версии 1 используется только для событий подписки
+        (`__stream_events`), пока клиент его не закроет, и, как и в `Service`, не учитывается в `n_conn`.
+        Одновременно обрабатывается не более `n_conn` запросов: место занимается, когда получен заголовок
+        запроса, и освобождается после ответа, поэтому соединения, ожидающие следующего запроса, не мешают
+        обслуживать другие подключения. При остановке сервера соединения, ожидающие запроса, закрываются.
+        Если простаивающих соединений уже `max_idle_conn`, новое подключение закрывается, когда освободить
+        для него место нельзя (`__evict_idle`).
+
+        """
+        task = asyncio.current_task()
+        client_address = writer.get_extra_info("peername")
+        logger.debug("Accepted connection from %s:%s", client_address[0], client_address[1])
+        self._connections_total.inc()
+        if not self.__evict_idle():
+            self._idle_evicted_total.inc()
+            logger.warning("Too many idle connections, closing new connection from %s:%s",
+                           client_address[0], client_address[1])
+            writer.close()
+            return
+        self.__client_tasks.add(task)
+        message_tasks = set()
+        subscribers = set()
+        subscriber = None
+        write_lock = None
+        slot_held = False
+        try:
+            timeout = self.timeout
+            while self.server_is_open:
+                if slot_held:
+                    self.__conn_slots.release()
+                    slot_held = False
+                # Соединение с запросами в обработке или действующими подписками не простаивает.
+                busy = bool(message_tasks) or any(not subscriber.closed for subscriber in subscribers)
+                self.__idle_tasks[task] = None if busy else writer
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(protocol.LENGTH.size), timeout)
+                except asyncio.IncompleteReadError as e:
+                    if not e.partial:
+                        break
+                    raise
+                except asyncio.TimeoutError:
+                    # Непрочитанные байты остаются в `reader`, поэтому ожидание можно продолжить.
+                    if any(not subscriber.closed for subscriber in subscribers):
+                        continue
+                    logger.debug("Closing idle connection")
+                    break
+                except asyncio.CancelledError:
+                    # Ожидание запроса прервано остановкой сервера (`__serve`).
+                    if self.server_is_open:
+                        raise
+                    break
+                finally:
+                    self.__idle_tasks.pop(task, None)
+                await self.__conn_slots.acquire()
+                slot_held = True
+                request = await asyncio.wait_for(reader.readexactly(protocol.LENGTH.unpack(header)[0]),
+                                                 self.timeout)
+                if write_lock is not None or protocol.is_v2(request):
+                    # Запросы версии 2 занимают места обработки сами (`__serve_message`).
+                    write_lock = write_lock or asyncio.Lock()
+                    message_task = asyncio.create_task(
+                        self.__serve_message(writer, write_lock, request, subscribers))
+                    message_tasks.add(message_task)
+                    message_task.add_done_callback(message_tasks.discard)
+                    timeout = self.keepalive_timeout
+                    continue
+                start = time.perf_counter()
+                request = request.decode("utf-8")
+                logger.debug("Received: %s", request)
+                if request.split(" ", 1)[0].lower() == "subscribe":
+                    subscriber = await self.__subscribe_v1(writer, request)
+                    if subscriber is not None:
+                        break
+                    timeout = self.keepalive_timeout
+                    continue
+                result = await self.__loop.run_in_executor(None, self._process_request, request)
+                await asyncio.wait_for(self.__send_msg(writer, result.encode("utf-8")), self.timeout)
+                self._requests_total.inc()
+                self._request_seconds.observe(time.perf_counter() - start)
+                timeout = self.keepalive_timeout
+            if slot_held:
+                self.__conn_slots.release()
+                slot_held = False
+            if subscriber is not None:
+                await self.__stream_events(writer, None, subscriber, reader=reader)
+        except Exception as e:
+            self._request_errors_total.inc()
+            logger.warning("Server error when handling client: %r", e)
+        finally:
+            if slot_held:
+                self.__conn_slots.release()
+            for subscriber in subscribers:
+                self.subscriptions.unsubscribe(subscriber.id)
+            if message_tasks:
+                await asyncio.gather(*message_tasks, return_exceptions=True)
+            writer.close()
+            self.__client_tasks.discard(task)
+
+    def __evict_idle(self) -> bool:
+        """
+        Приватный метод для освобождения места под новое подключение сверх `max_idle_conn`.
+
+        Пока простаивающих соединений (ожидающих запроса без запросов в обработке и действующих подписок)
+        не меньше `max_idle_conn`, закрывает те из них, которые простаивают дольше всех: их задачи
+        завершаются, как при закрытии соединения клиентом. Возвращает False, если место нужно, но закрыть нечего.
+
+        """
+        idle = [(task, writer) for task, writer in self.__idle_tasks.items() if writer is not None]
+        n_evict = len(idle) - self.max_idle_conn + 1
+        for task, writer in idle[:max(0, n_evict)]:
+            self.__idle_tasks[task] = None
+            self._idle_evicted_total.inc()
+            logger.debug("Too many idle connections, closing the oldest one")
+            writer.close()
+        return n_evict <= len(idle)
+
+    async def __serve(self) -> None:
+        """
+        Приватная сопрограмма, выполняющая сервер и задачу сервиса.
+
+        Запускает сервер и `_do_job` в пуле потоков, ожидает вызова `stop`, после чего перестает принимать
+        подключения, закрывает соединения, ожидающие запроса, и дожидается обработки уже полученных запросов.
+
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=self.n_workers + 1, thread_name_prefix="async_service_worker"))
+        self.__stopping = asyncio.Event()
+        self.__conn_slots = asyncio.Semaphore(self.n_conn)
+        self.__client_tasks = set()
+        self.__idle_tasks = {}
+        try:
+            self.server = await asyncio.start_server(self.__handle_client, self.ip, self.port,
+                                                     backlog=max(self.n_conn, socket.SOMAXCONN), reuse_address=True)
+            logger.info("Listening on %s:%s", self.ip, self.port)
+            job = self.__loop.run_in_executor(None, self._do_job)
+            async with self.server:
+                await self.__stopping.wait()
+            for task in self.__idle_tasks:
+                task.cancel()
+            if self.__client_tasks:
+                await asyncio.gather(*self.__client_tasks, return_exceptions=True)
+            await job
+        finally:
+            self.__loop = None
+
+    async def _run_client(self, ip: str, port: int, request: str,
+                          response_handler: Optional[Callable[[str], None]] = None) -> None:
+        """
+        Сопрограмма для отправки запроса на сервер.
+
+        :Параметры:
+        - `ip (str)` — IP-адрес сервера.
+        - `port (int)` — Порт сервера.
+        - `request (str)` — Запрос для отправки на сервер.
+        - `response_handler (Callable[[str], None], необязательно)` — Обработчик ответа от сервера.
+
+        Подключается к серверу, отправляет запрос и ожидает ответа.
+        Если предоставлен обработчик ответа, вызывает его с полученным ответом. Для отправки запросов
+        другим сервисам используется `run_client` (унаследован от `Service`): он не блокирует цикл событий
+        и отправляет запросы по постоянным соединениям `client_pool`.
+
+        """
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.timeout)
+            await self.__send_msg(writer, request.encode("utf-8"))
+            response = await asyncio.wait_for(self.__recv_msg(reader), self.timeout)
+            response = response.decode("utf-8")
+            logger.debug("Received: %s", response)
+            if response_handler is not None:
+                response_handler(response)
+        except Exception as e:
+            logger.warning("Client error when handling client: %r", e)
+        finally:
+            if writer is not None:
+                writer.close()
+                logger.debug("Connection to server closed")
+
+    # public:
+    def _serve_once(self) -> None:
+        """
+        Метод для одного запуска сервера.
+
+        Выполняет цикл событий сервера до вызова `stop` и завершения `_do_job`. Повторный запуск по команде
+        `restart`, освобождение ресурсов и `shutdown` выполняются базовым классом (см. `Service.start`).
+
+        """
+        asyncio.run(self.__serve())
+        self.client_pool.close()
+
+    def stop(self) -> None:
+        """
+        Метод для остановки сервера.
+
+        Устанавливает флаги остановки и пробуждает цикл событий. Может вызываться из любого потока.
+
+        """
+        super().stop()
+        loop, stopping = self.__loop, self.__stopping
+        if loop is None or stopping is None:
+            return
+        try:
+            loop.call_soon_threadsafe(stopping.set)
+        except RuntimeError:
+            pass
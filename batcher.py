@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Optional, Sequence
+
+from cam import Camera
+
+
+class FrameBatcher:
+    """
+    Класс для сбора кадров нескольких камер в пакеты для совместного распознавания.
+
+    Пакет начинает собираться, когда хотя бы у одной камеры появился новый кадр, и отдается, как только
+    новые кадры есть у `max_batch` камер или с момента появления первого кадра прошло `max_wait` секунд.
+    От каждой камеры в пакет попадает ее последний еще не обработанный кадр (без копирования, см. `Camera`).
+    Если камер больше, чем `max_batch`, очередность камер в пакетах меняется по кругу.
+
+    :Параметры:
+    - `sources (Sequence)` — Ссылки на RTSP-потоки или номера устройств камер.
+    - `max_batch (int, необязательно)` — Максимальное количество кадров в пакете (по умолчанию - 4).
+    - `max_wait (float, необязательно)` — Максимальное время в секундах, на которое откладывается
+      распознавание ради заполнения пакета (по умолчанию - 0.01).
+    - `buffer_size (int, необязательно)` — Размер кольцевого буфера каждой камеры (по умолчанию - 8).
+    - `shared_name (str, необязательно)` — Префикс имен общей памяти, в которую камеры публикуют кадры:
+      камера с номером `i` публикует в `{shared_name}_{i}` (см. `Camera`); None — не публиковать
+      (по умолчанию - None).
+
+    :Атрибуты:
+    - `cameras (list)` — Объекты `Camera` в порядке `sources`.
+    - `n_batches (int)` — Количество отданных пакетов.
+    - `n_frames (list)` — Количество отданных кадров каждой камеры.
+
+    :Методы:
+    - `next_batch(self, timeout) -> list` — Метод для получения очередного пакета кадров.
+    - `stats(self) -> dict` — Метод для получения частоты кадров по камерам и эффективности пакетирования.
+    - `interrupt(self) -> None` — Метод для прерывания ожидания в `next_batch`.
+    - `release(self) -> None` — Метод для освобождения всех камер.
+
+    """
+    def __init__(self, sources: Sequence, max_batch: int = 4, max_wait: float = 0.01, buffer_size: int = 8,
+                 shared_name: Optional[str] = None):
+        """
+        Конструктор класса.
+
+        Открывает все камеры.
+
+        """
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.__new_frame = threading.Condition(threading.Lock())
+        self.__consumed = [0] * len(sources)
+        self.__next_stream = 0
+        self.__interrupted = False
+        self.n_batches = 0
+        self.n_frames = [0] * len(sources)
+        self.__started_at = time.monotonic()
+        self.cameras = [Camera(source, buffer_size=buffer_size, on_frame=self.__notify,
+                               shared_name=f"{shared_name}_{i}" if shared_name is not None else None)
+                        for i, source in enumerate(sources)]
+
+    def __notify(self, seq: int) -> None:
+        """
+        Приватный метод, вызываемый потоками чтения камер при появлении нового кадра.
+
+        """
+        with self.__new_frame:
+            self.__new_frame.notify()
+
+    def __ready(self) -> list:
+        """
+        Приватный метод, возвращающий номера камер с необработанными кадрами.
+
+        """
+        return [i for i, camera in enumerate(self.cameras) if camera.seq > self.__consumed[i]]
+
+    def next_batch(self, timeout=None) -> list:
+        """
+        Метод для получения очередного пакета кадров.
+
+        :Параметры:
+        - `timeout (float, необязательно)` — Максимальное время ожидания первого кадра в секундах
+          (по умолчанию - без ограничения).
+
+        Возвращает список кортежей `(stream, seq, frame, timestamp)`, где `stream` — номер камеры в `sources`.
+        Если за `timeout` секунд новых кадров не появилось или ожидание прервано методом `interrupt`,
+        возвращает пустой список.
+
+        """
+        target = min(self.max_batch, len(self.cameras))
+        with self.__new_frame:
+            if not self.__new_frame.wait_for(lambda: self.__interrupted or self.__ready(), timeout) \
+                    or self.__interrupted:
+                self.__interrupted = False
+                return []
+            deadline = time.monotonic() + self.max_wait
+            while len(self.__ready()) < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__new_frame.wait(remaining)
+            ready = self.__ready()
+
+        n_streams = len(self.cameras)
+        ready.sort(key=lambda i: (i - self.__next_stream) % n_streams)
+        batch = []
+        for stream in ready[:self.max_batch]:
+            seq, frame, timestamp = self.cameras[stream].next_frame(timeout=0)
+            if frame is None:
+                continue
+            self.__consumed[stream] = seq
+            self.n_frames[stream] += 1
+            batch.append((stream, seq, frame, timestamp))
+        if batch:
+            self.__next_stream = (batch[-1][0] + 1) % n_streams
+            self.n_batches += 1
+        return batch
+
+    def stats(self) -> dict:
+        """
+        Метод для получения частоты кадров по камерам и эффективности пакетирования.
+
+        Возвращает словарь:
+        - `fps` — количество обработанных кадров в секунду для каждой камеры;
+        - `batches` — количество пакетов;
+        - `mean_batch` — средний размер пакета;
+        - `efficiency` — средняя заполненность пакета относительно `min(max_batch, число камер)`;
+        - `finished` — для каждой камеры флаг, что кадры ее конечного источника закончились (`Camera.finished`).
+
+        """
+        elapsed = max(time.monotonic() - self.__started_at, 1e-9)
+        total = sum(self.n_frames)
+        mean_batch = total / self.n_batches if self.n_batches else 0.0
+        return {
+            "fps": [round(n / elapsed, 2) for n in self.n_frames],
+            "batches": self.n_batches,
+            "mean_batch": round(mean_batch, 3),
+            "efficiency": round(mean_batch / min(self.max_batch, len(self.cameras)), 3),
+            "finished": [camera.finished for camera in self.cameras],
+        }
+
+    def interrupt(self) -> None:
+        """
+        Метод для прерывания ожидания в `next_batch`.
+
+        Текущий или, если никто не ждет, следующий вызов `next_batch` сразу возвращает пустой список.
+        Позволяет остановить поток работы, не дожидаясь кадров или истечения таймаута.
+
+        """
+        with self.__new_frame:
+            self.__interrupted = True
+            self.__new_frame.notify_all()
+
+    def release(self) -> None:
+        """
+        Метод для освобождения всех камер.
+
+        """
+        for camera in self.cameras:
+            camera.release()
@@ -0,0 +1,100 @@
+"""
+Общие средства бенчмарков и нагрузочных тестов сервисов (`bench_service.py`, `bench_pipeline.py`, `loadtest.py`).
+
+- `StubService`, `AsyncStubService` — заглушки `Service` и `AsyncService` с пустым `_do_job`
+  и эхо-обработчиком запросов;
+- `free_port` — свободный TCP-порт на 127.0.0.1;
+- `send_request` — один запрос по протоколу сервиса в отдельном соединении;
+- `wait_listening` — ожидание, пока сервис не начнет принимать подключения;
+- `percentile` — перцентиль списка значений.
+"""
+import socket
+import time
+
+from async_service import AsyncService
+from protocol import LENGTH, pack_frame
+from service import Service
+
+
+class StubService(Service):
+    """
+    Заглушка сервиса с пустой задачей и эхо-обработчиком запросов.
+
+    """
+    def _do_job(self):
+        pass
+
+    def _request_handler(self, request):
+        return request
+
+
+class AsyncStubService(AsyncService):
+    """
+    Заглушка асинхронного сервиса с пустой задачей и эхо-обработчиком запросов.
+
+    """
+    def _do_job(self):
+        pass
+
+    def _request_handler(self, request):
+        return request
+
+
+def free_port() -> int:
+    """
+    Возвращает номер свободного TCP-порта на 127.0.0.1.
+
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def send_request(ip: str, port: int, request: str) -> str:
+    """
+    Отправляет один запрос по протоколу сервиса (4 байта длины + UTF-8) и возвращает ответ.
+
+    """
+    with socket.create_connection((ip, port)) as sock:
+        payload = request.encode("utf-8")
+        sock.sendall(pack_frame(payload))
+        raw = b""
+        while len(raw) < 4:
+            chunk = sock.recv(4 - len(raw))
+            if not chunk:
+                return ""
+            raw += chunk
+        msglen = LENGTH.unpack(raw)[0]
+        data = b""
+        while len(data) < msglen:
+            chunk = sock.recv(msglen - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data.decode("utf-8")
+
+
+def wait_listening(ip: str, port: int, timeout: float = 10.0) -> None:
+    """
+    Ждет, пока сервис не начнет принимать подключения на `ip:port`; по истечении `timeout` секунд
+    выбрасывает RuntimeError.
+
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((ip, port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Service is not listening on {ip}:{port}")
+
+
+def percentile(values, q: float) -> float:
+    """
+    Возвращает перцентиль `q` (от 0 до 1) значений `values` (ближайшее значение без интерполяции).
+
+    """
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[idx]
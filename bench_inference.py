@@ -0,0 +1,229 @@
+"""
+Бенчмарк механизмов выполнения модели (`inference.py`).
+
+Каждый механизм замеряется в отдельном процессе, чтобы время запуска и память не зависели друг от друга:
+
+- время запуска — импорт модуля механизма (для ultralytics — вместе с torch) и загрузка модели;
+- пиковое потребление памяти процессом (RSS);
+- задержка распознавания одного кадра — p50/p95/p99 — на изображениях из каталога `images/`;
+- совпадение результатов: для каждого изображения сравниваются класс и уверенность лучшего объекта
+  и IoU его рамки с результатом первого (эталонного) механизма.
+
+С `--imgsz` кадры масштабируются до указанного размера входа (только для моделей с произвольным размером
+входа): так подбирается наименьший размер, при котором результаты еще совпадают, — параметр `min_input`
+класса `RegionOfInterest`.
+
+С `--models` каждый механизм выполняет свою модель (по одной на механизм): так сравнивается исходная модель
+с квантованной (см. `quantize.py`).
+
+С `--scaling` замеряется пул процессов распознавания (`InferenceProcessPool`) с разным количеством процессов:
+пропускная способность (кадров в секунду) при `2 * N` кадрах в обработке, задержка кадра и совпадение
+результатов, собранных в порядке кадров, с результатами первого прохода.
+
+Пример запуска:
+```
+python bench_inference.py
+python bench_inference.py --backends onnxruntime --threads 1 --repeat 50
+python bench_inference.py --backends onnxruntime onnxruntime --imgsz 320
+python bench_inference.py --backends onnxruntime onnxruntime --models best.onnx best.int8.onnx
+python bench_inference.py --backends onnxruntime --scaling 1 2 4 8 --repeat 50
+```
+"""
+import argparse
+import collections
+import glob
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def _iou(a, b) -> float:
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def measure(backend: str, model_path: str, images: list, repeat: int, threads, imgsz=None) -> dict:
+    """
+    Замеряет один механизм в текущем процессе.
+
+    """
+    start = time.perf_counter()
+    import cv2
+    from inference import create_backend
+    model = create_backend(backend, model_path, intra_op_threads=threads)
+    frames = {os.path.basename(path): cv2.imread(path) for path in images}
+    first = {name: model.predict(frame, imgsz) for name, frame in frames.items()}
+    startup = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for frame in frames.values():
+            frame_start = time.perf_counter()
+            model.predict(frame, imgsz)
+            latencies.append((time.perf_counter() - frame_start) * 1000)
+
+    return {
+        "backend": backend,
+        "imgsz": imgsz if model.dynamic_shape else None,
+        "startup_s": round(startup, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 3),
+            "p50": round(_percentile(latencies, 0.50), 3),
+            "p95": round(_percentile(latencies, 0.95), 3),
+            "p99": round(_percentile(latencies, 0.99), 3),
+        },
+        "detections": {name: [d._asdict() for d in detections] for name, detections in first.items()},
+    }
+
+
+def compare(reference: dict, other: dict) -> dict:
+    """
+    Сравнивает лучший объект на каждом изображении с результатом эталонного механизма.
+
+    """
+    result = {}
+    for name, expected in reference["detections"].items():
+        actual = other["detections"].get(name, [])
+        if not expected or not actual:
+            result[name] = {"same_class": not expected and not actual}
+            continue
+        result[name] = {
+            "same_class": expected[0]["class_id"] == actual[0]["class_id"],
+            "confidence_diff": round(abs(expected[0]["confidence"] - actual[0]["confidence"]), 4),
+            "box_iou": round(_iou(expected[0]["box"], actual[0]["box"]), 4),
+        }
+    return result
+
+
+def summarize(agreement: dict) -> dict:
+    """
+    Сводит совпадение результатов по изображениям: доля изображений с тем же классом лучшего объекта,
+    наибольшее отличие уверенности и наименьший IoU рамки.
+
+    """
+    matched = [item for item in agreement.values() if "box_iou" in item]
+    return {
+        "same_class": round(sum(item["same_class"] for item in agreement.values()) / max(1, len(agreement)), 4),
+        "max_confidence_diff": max((item["confidence_diff"] for item in matched), default=None),
+        "min_box_iou": min((item["box_iou"] for item in matched), default=None),
+    }
+
+
+def run(backends: list, model_path: str, images_dir: str, repeat: int, threads, imgsz=None,
+        models: Optional[list] = None) -> dict:
+    images = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))
+    models = models or [model_path] * len(backends)
+    if len(models) != len(backends):
+        raise ValueError("models must contain one model per backend")
+    reports = []
+    for i, (backend, model) in enumerate(zip(backends, models)):
+        command = [sys.executable, __file__, "--child", backend, "--model", model,
+                   "--images", images_dir, "--repeat", str(repeat)]
+        if threads is not None:
+            command += ["--threads", str(threads)]
+        if imgsz is not None and i > 0:
+            command += ["--imgsz", str(imgsz)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        reports.append(dict(json.loads(output.strip().splitlines()[-1]), model=model))
+
+    result = {"images": len(images), "repeat": repeat, "threads": threads, "backends": {}}
+    for i, report in enumerate(reports):
+        key = f"{i}:{report['backend']}"
+        result["backends"][key] = {k: v for k, v in report.items() if k not in ("backend", "detections")}
+    if len(reports) > 1:
+        result["agreement"] = {f"{i}:{report['backend']}": compare(reports[0], report)
+                               for i, report in enumerate(reports) if i > 0}
+        result["agreement_summary"] = {key: summarize(agreement) for key, agreement in result["agreement"].items()}
+    return result
+
+
+def run_scaling(backend: str, model_path: str, images_dir: str, repeat: int, threads, workers: list) -> dict:
+    import cv2
+    from process_pool import InferenceProcessPool
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(os.path.join(images_dir, "*.jpg")))]
+    result = {"backend": backend, "images": len(frames), "repeat": repeat, "threads_per_worker": threads or 1}
+    for n_workers in workers:
+        pool = InferenceProcessPool(backend, model_path, n_workers, intra_op_threads=threads or 1,
+                                    max_frame_bytes=max(frame.nbytes for frame in frames))
+        start = time.perf_counter()
+        expected = [pool.submit([frame]).get(timeout=120)[0] for frame in frames]
+        for _ in range(n_workers):
+            pool.predict_batch(frames)
+        startup = time.perf_counter() - start
+
+        latencies = []
+        mismatches = 0
+        in_flight = collections.deque()
+
+        def complete() -> None:
+            nonlocal mismatches
+            index, submitted_at, pending = in_flight.popleft()
+            detections = pending.get(timeout=60)[0]
+            latencies.append((time.perf_counter() - submitted_at) * 1000)
+            if [d.class_id for d in detections] != [d.class_id for d in expected[index]]:
+                mismatches += 1
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for index, frame in enumerate(frames):
+                if len(in_flight) >= 2 * n_workers:
+                    complete()
+                in_flight.append((index, time.perf_counter(), pool.submit([frame])))
+        while in_flight:
+            complete()
+        elapsed = time.perf_counter() - start
+        pool.close()
+
+        result[str(n_workers)] = {
+            "startup_s": round(startup, 3),
+            "fps": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                "p50": round(_percentile(latencies, 0.50), 3),
+                "p95": round(_percentile(latencies, 0.95), 3),
+            },
+            "order_mismatches": mismatches,
+        }
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup, memory and latency benchmark for inference backends")
+    parser.add_argument("--backends", nargs="+", default=["ultralytics", "onnxruntime"], help="механизмы для сравнения")
+    parser.add_argument("--model", default="best.onnx", help="путь к файлу модели")
+    parser.add_argument("--models", nargs="+", default=None,
+                        help="модели для каждого из механизмов (вместо --model), например best.onnx best.int8.onnx")
+    parser.add_argument("--images", default="images", help="каталог с изображениями *.jpg")
+    parser.add_argument("--repeat", type=int, default=20, help="количество проходов по изображениям")
+    parser.add_argument("--threads", type=int, default=None, help="intra_op_threads для onnxruntime")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help="размер входа модели для всех механизмов, кроме первого (эталонного)")
+    parser.add_argument("--scaling", type=int, nargs="+", default=None,
+                        help="замерить пул процессов с указанным количеством процессов, например 1 2 4 8")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        images = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+        print(json.dumps(measure(args.child, args.model, images, args.repeat, args.threads, args.imgsz)))
+        raise SystemExit
+    if args.scaling:
+        print(json.dumps(run_scaling(args.backends[0], args.model, args.images, args.repeat, args.threads,
+                                     args.scaling), indent=2))
+        raise SystemExit
+    print(json.dumps(run(args.backends, args.model, args.images, args.repeat, args.threads, args.imgsz,
+                         args.models), indent=2))
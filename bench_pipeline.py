@@ -0,0 +1,140 @@
+"""
+Бенчмарк всего конвейера распознавания `ServiceGR` без камеры.
+
+Вместо камер используются каталоги изображений (например, `images/`) или видеофайлы (`ReplayCapture`):
+кадры выдаются с частотой `--fps` (по умолчанию — частота видеофайла или 30 кадров/с для каталога) или,
+с `--max-speed`, так быстро, как их успевают прочитать. Сервис запускается на свободном порту без окна
+просмотра, включается командой `enable` и работает (`_do_job`), пока не закончатся кадры всех источников
+(или не пройдет `--duration` секунд) и конвейер не обработает оставшиеся пакеты. В отчет (JSON) попадают:
+
+- пропускная способность — количество обработанных кадров в секунду от первого кадра до последнего
+  обработанного;
+- количество кадров: выданных источниками, обработанных, распознанных моделью и пропущенных проверкой
+  движения, а также кадров, которые камера перезаписала раньше, чем их взял конвейер, и пакетов,
+  выброшенных из очередей конвейера;
+- задержка — p50/p95/p99 (оценка по корзинам гистограмм `metrics`) — ожидания кадра до подготовки,
+  каждой стадии конвейера, распознавания пакета и от захвата кадра до решения об отправке команды;
+- пиковое потребление памяти (RSS) процессом сервиса и процессами распознавания;
+- количество найденных объектов каждого класса и отправленных команд.
+
+В режиме `--max-speed` кадры, которые конвейер не успевает обработать, пропускаются, поэтому пропускная
+способность равна возможностям конвейера, а количество объектов зависит от скорости машины. Для сравнимых
+между запусками количеств объектов следует задать `--fps`, с которой конвейер справляется.
+
+Пример запуска:
+```
+python bench_pipeline.py images --fps 10 --loop --duration 30
+python bench_pipeline.py video.mp4 --max-speed --backend onnxruntime --model best.onnx
+python bench_pipeline.py video.mp4 video.mp4 --max-batch 2 --workers 2 --output report.json
+```
+"""
+import argparse
+import json
+import logging
+import resource
+import threading
+import time
+
+from bench_common import free_port, send_request, wait_listening
+from replay import ReplayCapture
+from service_gr import ServiceGR
+
+
+def _latency(histogram) -> dict:
+    snapshot = histogram.snapshot()
+    return {key[:-3]: value for key, value in snapshot.items() if key.endswith("_ms")}
+
+
+def run(sources: list, realtime: bool, fps, loop: bool, duration, backend: str, model_path: str,
+        max_batch: int, max_wait: float, workers: int, threads) -> dict:
+    replays = [ReplayCapture(source, realtime=realtime, fps=fps, loop=loop) for source in sources]
+    ip, port = "127.0.0.1", free_port()
+    service = ServiceGR(ip_=ip, port_=port, preview_every_=None, backend_=backend, model_path_=model_path,
+                        intra_op_threads_=threads, inference_workers_=workers, sources_=replays,
+                        max_batch_=max_batch, max_wait_=max_wait)
+    server_thread = threading.Thread(target=service.start, daemon=True)
+    server_thread.start()
+    wait_listening(ip, port)
+    send_request(ip, port, "enable")
+
+    metrics = service.metrics
+    handled = metrics.histogram("frame_latency_seconds")
+    deadline = time.perf_counter() + duration if duration is not None else None
+    last_count, last_change = 0, time.perf_counter()
+    while True:
+        time.sleep(0.1)
+        now = time.perf_counter()
+        if handled.count != last_count:
+            last_count, last_change = handled.count, now
+        sources_done = all(replay.finished for replay in replays)
+        if deadline is not None and now >= deadline:
+            break
+        if sources_done and now - last_change > max(1.0, 2 * max_wait):
+            break
+    stats = service.stats()
+    streams = stats.get("streams", {})
+
+    service.shutdown(timeout=30)
+    server_thread.join(timeout=30)
+
+    started_at = min((replay.started_at for replay in replays if replay.started_at is not None), default=last_change)
+    elapsed = max(last_change - started_at, 1e-9)
+    stages = ("preprocess", "infer", "dispatch")
+    return {
+        "sources": sources,
+        "mode": "realtime" if realtime else "max_speed",
+        "fps": [replay.fps if realtime else None for replay in replays],
+        "backend": backend,
+        "max_batch": max_batch,
+        "inference_workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_fps": round(handled.count / elapsed, 1),
+        "frames": {
+            "read": sum(replay.n_frames for replay in replays),
+            "handled": handled.count,
+            "inferred": stats.get("frames_inferred_total", 0),
+            "skipped": stats.get("frames_skipped_total", 0),
+            "camera_dropped": sum(stats.get("camera_dropped", {}).values()),
+            "dropped_batches": sum(stats.get("pipeline_dropped", {}).values()),
+        },
+        "batch_efficiency": streams.get("efficiency"),
+        "latency_ms": {
+            "capture_age": _latency(metrics.histogram("capture_age_seconds")),
+            **{stage: _latency(metrics.histogram("pipeline_stage_seconds", stage=stage)) for stage in stages},
+            "inference": _latency(metrics.histogram("inference_seconds")),
+            "end_to_end": _latency(handled),
+        },
+        "peak_rss_mb": {
+            "service": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "inference_workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        },
+        "detections": {key.split("=", 1)[1]: value for key, value in stats.get("detections_total", {}).items()},
+        "commands": {key.split("=", 1)[1]: value for key, value in stats.get("commands_total", {}).items()},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the gesture recognition pipeline")
+    parser.add_argument("sources", nargs="+", help="каталоги изображений или видеофайлы, по одному на камеру")
+    parser.add_argument("--fps", type=float, default=None, help="частота выдачи кадров в реальном времени")
+    parser.add_argument("--max-speed", action="store_true", help="выдавать кадры без ожидания")
+    parser.add_argument("--loop", action="store_true", help="повторять источники по кругу (нужен --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="наибольшая длительность замера, с")
+    parser.add_argument("--backend", default="ultralytics", help="механизм выполнения модели")
+    parser.add_argument("--model", default="best.onnx", help="путь к файлу модели")
+    parser.add_argument("--max-batch", type=int, default=4, help="параметр max_batch_ сервиса")
+    parser.add_argument("--max-wait", type=float, default=0.01, help="параметр max_wait_ сервиса")
+    parser.add_argument("--workers", type=int, default=0, help="количество процессов распознавания")
+    parser.add_argument("--threads", type=int, default=None, help="intra_op_threads для onnxruntime")
+    parser.add_argument("--output", default=None, help="файл для сохранения отчета")
+    args = parser.parse_args()
+    if args.loop and args.duration is None:
+        parser.error("--loop requires --duration")
+    logging.basicConfig(level=logging.ERROR)
+    report = run(args.sources, not args.max_speed, args.fps, args.loop, args.duration, args.backend, args.model,
+                 args.max_batch, args.max_wait, args.workers, args.threads)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    print(text)
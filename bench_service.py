@@ -0,0 +1,290 @@
+"""
+Бенчмарк серверной части классов Service и AsyncService.
+
+Запускает заглушку сервиса (пустой `_do_job`) на свободном порту и измеряет:
+
+- потребление CPU процессом в простое (доля одного ядра);
+- задержку обработки запроса (подключение, отправка, прием ответа) — p50/p95/p99 —
+  при `--clients` одновременных клиентах и `--stalled` зависших соединениях,
+  отправивших только часть заголовка;
+- время остановки сервиса по команде `close`;
+- при `--dispatch N` — стоимость вызова `run_client` и время доставки N запросов другому сервису
+  через пул постоянных соединений в сравнении с потоком и соединением на каждый запрос (`_run_client`);
+- с `--baseline` — те же замеры для исходной реализации `Service` (`_BaselineService`): поток приема
+  подключений с таймаутом `accept` и поток обработки, который в холостую опрашивает список подключений
+  и обслуживает клиентов по одному. Зависшие соединения (`--stalled`) навсегда блокируют ее обработку,
+  поэтому вместе с `--baseline` не поддерживаются;
+- при `--keepalive N` — проверку того, что N постоянных клиентов, простаивающих после ответа, не занимают
+  места `n_conn`: новые подключения со служебными командами (`stats`) обслуживаются без ожидания.
+  Если служебная команда не обслужена за `timeout` сервиса, скрипт завершается с кодом 1.
+
+Пример запуска:
+```
+python bench_service.py --idle 5 --requests 500
+python bench_service.py --idle 0 --requests 2000 --clients 200 --stalled 20 --n-conn 256 --workers 8
+python bench_service.py --async --idle 5 --requests 500
+python bench_service.py --baseline --idle 5 --requests 500
+python bench_service.py --dispatch 3000
+python bench_service.py --keepalive 8 --n-conn 4
+python bench_service.py --keepalive 8 --n-conn 4 --async
+```
+"""
+import argparse
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import json
+import socket
+import statistics
+import threading
+import time
+
+from bench_common import AsyncStubService, StubService, free_port, percentile, send_request, wait_listening
+from client import MultiplexClient, ServiceClient
+from client_pool import ClientPool
+from protocol import LENGTH, pack_frame
+
+
+class _BaselineService:
+    """
+    Исходная реализация цикла `Service` для сравнения: поток приема подключений с таймаутом `accept`
+    и поток обработки, который в холостую опрашивает список подключений и обслуживает их по одному
+    (чтение запроса, эхо-ответ, закрытие соединения). Команда `close` останавливает сервис.
+
+    """
+    def __init__(self, ip_: str, port_: int, n_conn_: int = 10, n_workers_: int = 0):
+        self.ip = ip_
+        self.port = port_
+        self.n_conn = n_conn_
+        self.timeout = 3
+        self.server_is_open = True
+        self.connected_clients = []
+
+    @staticmethod
+    def __recvall(sock, n: int) -> bytearray:
+        data = bytearray()
+        while len(data) < n:
+            packet = sock.recv(n - len(data))
+            if not packet:
+                break
+            data.extend(packet)
+        return data
+
+    def __manage_clients(self) -> None:
+        while True:
+            if len(self.connected_clients) == 0 and not self.server_is_open:
+                break
+            if len(self.connected_clients) == 0:
+                continue
+            while len(self.connected_clients) > 0:
+                client_socket = self.connected_clients.pop(0)
+                try:
+                    raw_msglen = self.__recvall(client_socket, 4)
+                    if len(raw_msglen) < 4:
+                        continue
+                    request = self.__recvall(client_socket, LENGTH.unpack(raw_msglen)[0]).decode("utf-8")
+                    if request.lower() == "close":
+                        self.server_is_open = False
+                        request = "beginning close"
+                    client_socket.sendall(pack_frame(request.encode("utf-8")))
+                except OSError:
+                    pass
+                finally:
+                    client_socket.close()
+
+    def start(self) -> None:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.settimeout(self.timeout)
+        server.bind((self.ip, self.port))
+        server.listen(self.n_conn)
+        client_managing_thread = threading.Thread(target=self.__manage_clients)
+        client_managing_thread.start()
+        while self.server_is_open:
+            try:
+                client_socket, _ = server.accept()
+                self.connected_clients.append(client_socket)
+            except socket.timeout:
+                pass
+        client_managing_thread.join()
+        server.close()
+
+
+def run(idle_seconds: float, n_requests: int, n_clients: int = 1, n_stalled: int = 0,
+        n_conn: int = 10, n_workers: int = 4, use_async: bool = False, baseline: bool = False) -> dict:
+    ip, port = "127.0.0.1", free_port()
+    if baseline:
+        service_cls = _BaselineService
+    else:
+        service_cls = AsyncStubService if use_async else StubService
+    service = service_cls(ip_=ip, port_=port, n_conn_=n_conn, n_workers_=n_workers)
+    server_thread = threading.Thread(target=service.start, daemon=True)
+    server_thread.start()
+    wait_listening(ip, port)
+    # Первое подключение из _wait_listening тоже должно быть обработано.
+    time.sleep(0.2)
+
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_start) / (time.monotonic() - wall_start)
+
+    stalled = []
+    for _ in range(n_stalled):
+        sock = socket.create_connection((ip, port))
+        sock.sendall(b"\0\0")
+        stalled.append(sock)
+
+    latencies = []
+    errors = []
+
+    def client(client_id: int) -> None:
+        for i in range(client_id, n_requests, n_clients):
+            start = time.perf_counter()
+            try:
+                send_request(ip, port, f"ping {i}")
+            except OSError as e:
+                errors.append(str(e))
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.monotonic()
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.monotonic() - wall_start
+
+    for sock in stalled:
+        sock.close()
+
+    stop_start = time.monotonic()
+    send_request(ip, port, "close")
+    server_thread.join(timeout=30)
+    stop_seconds = time.monotonic() - stop_start
+
+    return {
+        "service": "baseline" if baseline else service_cls.__base__.__name__,
+        "idle_cpu_cores": round(idle_cpu, 4),
+        "requests": n_requests,
+        "clients": n_clients,
+        "stalled": n_stalled,
+        "errors": len(errors),
+        "rps": round(len(latencies) / wall, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 3),
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+        },
+        "stop_seconds": round(stop_seconds, 3),
+    }
+
+
+def run_dispatch(n_requests: int) -> dict:
+    ip, port = "127.0.0.1", free_port()
+    downstream = StubService(ip_=ip, port_=port, n_conn_=64)
+    downstream_thread = threading.Thread(target=downstream.start, daemon=True)
+    downstream_thread.start()
+    wait_listening(ip, port)
+    sender = StubService(ip_=ip, port_=free_port())
+    sender.client_pool = ClientPool(max_queue=n_requests)
+
+    result = {}
+    for mode in ("thread_per_request", "pool"):
+        done = threading.Semaphore(0)
+
+        def on_response(response):
+            done.release()
+
+        start = time.perf_counter()
+        for i in range(n_requests):
+            if mode == "pool":
+                sender.run_client(ip, port, f"Forward {i}", on_response)
+            else:
+                threading.Thread(target=sender._run_client, args=(ip, port, f"Forward {i}", on_response)).start()
+        call_us = (time.perf_counter() - start) / n_requests * 1e6
+        deadline = time.monotonic() + 30
+        delivered = 0
+        while delivered < n_requests and done.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            delivered += 1
+        total = time.perf_counter() - start
+        result[mode] = {
+            "call_us": round(call_us, 2),
+            "delivered": delivered,
+            "total_s": round(total, 3),
+            "rps": round(delivered / total, 1),
+        }
+
+    sender.client_pool.close()
+    send_request(ip, port, "close")
+    downstream_thread.join(timeout=30)
+    return result
+
+
+def run_keepalive(n_idle: int, n_conn: int = 4, use_async: bool = False) -> dict:
+    ip, port = "127.0.0.1", free_port()
+    service_cls = AsyncStubService if use_async else StubService
+    service = service_cls(ip_=ip, port_=port, n_conn_=n_conn)
+    server_thread = threading.Thread(target=service.start, daemon=True)
+    server_thread.start()
+    wait_listening(ip, port)
+
+    # Постоянные клиенты обеих версий протокола получают по ответу и остаются подключенными.
+    idle = []
+    errors = []
+    for i in range(n_idle):
+        client = ServiceClient(ip, port) if i % 2 == 0 else MultiplexClient(ip, port)
+        idle.append(client)
+        try:
+            client.request(f"ping {i}")
+        except (OSError, FutureTimeoutError) as e:
+            errors.append(repr(e))
+
+    latencies = []
+    for request in ("stats", "ping", "stats"):
+        start = time.perf_counter()
+        try:
+            with ServiceClient(ip, port, timeout=service.timeout) as client:
+                client.request(request)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except OSError as e:
+            errors.append(repr(e))
+
+    for client in idle:
+        client.close()
+    service.shutdown(timeout=30)
+    server_thread.join(timeout=5)
+    return {
+        "service": service_cls.__base__.__name__,
+        "n_conn": n_conn,
+        "idle_clients": n_idle,
+        "errors": errors,
+        "latency_ms": [round(latency, 3) for latency in latencies],
+        "ok": not errors,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Idle CPU and request latency benchmark for Service")
+    parser.add_argument("--idle", type=float, default=5.0, help="длительность замера простоя, с")
+    parser.add_argument("--requests", type=int, default=500, help="количество запросов для замера задержки")
+    parser.add_argument("--clients", type=int, default=1, help="количество одновременных клиентов")
+    parser.add_argument("--stalled", type=int, default=0, help="количество зависших соединений")
+    parser.add_argument("--n-conn", type=int, default=10, help="параметр n_conn сервиса")
+    parser.add_argument("--workers", type=int, default=4, help="параметр n_workers сервиса")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="замерить AsyncService")
+    parser.add_argument("--baseline", action="store_true",
+                        help="замерить исходную реализацию Service с холостым опросом подключений")
+    parser.add_argument("--dispatch", type=int, default=0, help="замерить отправку N запросов через run_client")
+    parser.add_argument("--keepalive", type=int, default=0,
+                        help="проверить обслуживание новых подключений при N простаивающих постоянных клиентах")
+    args = parser.parse_args()
+    if args.baseline and args.stalled:
+        parser.error("--stalled is not supported with --baseline: stalled connections block it forever")
+    if args.keepalive:
+        result = run_keepalive(args.keepalive, args.n_conn, args.use_async)
+        print(json.dumps(result, indent=2))
+        raise SystemExit(0 if result["ok"] else 1)
+    if args.dispatch:
+        print(json.dumps(run_dispatch(args.dispatch), indent=2))
+        raise SystemExit
+    print(json.dumps(run(args.idle, args.requests, args.clients, args.stalled, args.n_conn, args.workers,
+                         args.use_async, args.baseline), indent=2))
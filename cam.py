@@ -1,54 +1,304 @@
+import os
 import threading
-from threading import Lock
+import time
 import cv2
 
+from log import get_logger
+from replay import ReplayCapture
+from shared_frames import SharedFramePublisher
+
+logger = get_logger(__name__)
+
 class Camera:
     """
     Класс для работы с камерой и получения изображений.
 
+    Кадры декодируются потоком чтения в кольцевой буфер из `buffer_size` массивов, которые выделяются
+    при первом проходе по кольцу и затем переиспользуются (`capture.read(image=...)`). Каждому кадру
+    присваивается порядковый номер `seq`; потребитель получает кадр по номеру без копирования и может
+    дождаться кадра новее уже обработанного.
+
+    Кадр, полученный без копирования, остается неизменным, пока поток чтения не запишет еще
+    `buffer_size - 1` кадров. Проверить это можно методом `is_valid(seq)`; если кадр нужно хранить
+    дольше, его следует скопировать (как делает `getFrame`).
+
+    Если кадр не читается, поток чтения делает паузу, которая растет с каждой неудачей подряд (до 0,5 с),
+    а после `reopen_after` неудач подряд заново открывает устройство захвата (RTSP-поток или камеру). Конечный
+    источник — видеофайл или `ReplayCapture` без `loop` — не переоткрывается: когда кадры заканчиваются,
+    поток чтения завершается и `finished` становится True.
+
+    С `shared_name` каждый кадр и результаты его распознавания (`publish_detections`) публикуются в именованной
+    общей памяти (`SharedFramePublisher`), из которой их без копирования читают другие процессы узла
+    (`SharedFrameReader`), не открывая камеру повторно.
+
+    :Параметры:
+    - `rtsp_link` — Ссылка на RTSP-поток, номер устройства камеры, путь к видеофайлу или каталогу изображений
+      (читается по кругу в реальном времени, см. `ReplayCapture`) либо готовый объект захвата кадров
+      с методами `read` и `release` (например, `ReplayCapture` с нужными параметрами).
+    - `buffer_size (int, необязательно)` — Количество кадров в кольцевом буфере (по умолчанию - 4).
+    - `on_frame (Callable[[int], None], необязательно)` — Функция, которая вызывается из потока чтения
+      с номером каждого нового кадра, например чтобы один потребитель мог ждать кадров нескольких камер.
+    - `shared_name (str, необязательно)` — Имя общей памяти для публикации кадров; None — не публиковать
+      (по умолчанию - None).
+    - `shared_frame_bytes (int, необязательно)` — Наибольший размер публикуемого кадра в байтах; большие кадры
+      не публикуются (по умолчанию - 1920x1080x3).
+    - `reopen_after (int, необязательно)` — Количество неудачных чтений подряд, после которого устройство
+      захвата открывается заново (по умолчанию - 10).
+
     :Атрибуты:
-    - `last_frame` — Последний захваченный кадр с камеры.
-    - `last_ready` — Флаг, указывающий, что последний кадр готов для использования.
-    - `lock` — Объект блокировки для обеспечения безопасности многопоточного доступа.
+    - `seq (int)` — Номер последнего записанного кадра (0 — кадров еще не было).
+    - `buffer_size (int)` — Количество кадров в кольцевом буфере.
+    - `n_dropped (int)` — Количество кадров, пропущенных потребителем `next_frame` (камера записала более новый
+      кадр раньше, чем потребитель их запросил).
+    - `n_read_errors (int)` — Количество неудачных попыток чтения кадра.
+    - `n_reopens (int)` — Количество повторных открытий устройства захвата.
+    - `finished (bool)` — Флаг, указывающий, что кадры конечного источника закончились и поток чтения завершен.
+    - `started_at (float)` — Время открытия камеры (`time.monotonic()`).
+    - `publisher (Optional[SharedFramePublisher])` — Писатель кадров в общую память или None.
 
     :Методы:
-    - `__init__(self, rtsp_link)` — Конструктор класса, инициализирует объект камеры и запускает поток для чтения RTSP-потока.
+    - `__init__(self, rtsp_link, buffer_size, on_frame, shared_name, shared_frame_bytes, reopen_after)` — Конструктор класса, инициализирует объект камеры и запускает поток для чтения RTSP-потока.
     - `rtsp_cam_buffer(self, capture)` — Приватный метод для буферизации кадров из RTSP-потока.
-    - `getFrame(self)` — Метод для получения последнего готового кадра из камеры.
+    - `latest(self) -> tuple` — Метод для получения последнего кадра без копирования.
+    - `wait_frame(self, after_seq, timeout) -> tuple` — Метод для ожидания кадра новее указанного.
+    - `is_valid(self, seq) -> bool` — Метод для проверки, что кадр с номером `seq` еще не перезаписан.
+    - `next_frame(self, timeout) -> tuple` — Метод для получения следующего еще не выданного кадра.
+    - `frames(self, timeout)` — Генератор, выдающий каждый новый кадр один раз.
+    - `getFrame(self)` — Метод для получения копии последнего готового кадра из камеры.
+    - `publish_detections(self, seq, detections) -> bool` — Метод для публикации результатов распознавания кадра.
+    - `release(self) -> None` — Метод для остановки потока чтения и освобождения камеры.
 
     """
-    last_frame = None
-    last_ready = None
-    lock = Lock()
 
-    def __init__(self, rtsp_link):
+    def __init__(self, rtsp_link, buffer_size: int = 4, on_frame=None, shared_name=None,
+                 shared_frame_bytes: int = 1920 * 1080 * 3, reopen_after: int = 10):
         """
         Конструктор класса.
 
         Параметры:
-        - `rtsp_link` (str) — Ссылка на RTSP-поток.
+        - `rtsp_link` (str) — Ссылка на RTSP-поток, путь к видеофайлу или каталогу изображений или объект захвата кадров.
+        - `buffer_size` (int) — Количество кадров в кольцевом буфере.
+        - `on_frame` (Callable[[int], None]) — Функция, вызываемая с номером каждого нового кадра.
+        - `shared_name` (str) — Имя общей памяти для публикации кадров.
+        - `shared_frame_bytes` (int) — Наибольший размер публикуемого кадра в байтах.
+        - `reopen_after` (int) — Количество неудачных чтений подряд до повторного открытия устройства захвата.
 
-        Инициализирует объект камеры, создает объект захвата кадров и запускает поток чтения RTSP-потока.
+        Инициализирует объект камеры, создает общую память (если задано `shared_name`) и объект захвата кадров
+        и запускает поток чтения RTSP-потока.
 
         """
-        capture = cv2.VideoCapture(rtsp_link)
-        thread = threading.Thread(target=self.rtsp_cam_buffer, args=(capture,), name="rtsp_read_thread")
-        thread.daemon = True
-        thread.start()
+        self.buffer_size = max(2, buffer_size)
+        self.seq = 0
+        self.n_dropped = 0
+        self.n_read_errors = 0
+        self.n_reopens = 0
+        self.finished = False
+        self.reopen_after = reopen_after
+        self.started_at = time.monotonic()
+        self.__consumed_seq = 0
+        self.__frames = [None] * self.buffer_size
+        self.__timestamps = [0.0] * self.buffer_size
+        self.__new_frame = threading.Condition(threading.Lock())
+        self.__running = True
+        self.__on_frame = on_frame
+        self.publisher = SharedFramePublisher(shared_name, shared_frame_bytes, self.buffer_size) \
+            if shared_name is not None else None
+        self.__rtsp_link = rtsp_link
+        if hasattr(rtsp_link, "read"):
+            capture = rtsp_link
+        elif isinstance(rtsp_link, str) and os.path.isdir(rtsp_link):
+            capture = ReplayCapture(rtsp_link, loop=True)
+        else:
+            capture = cv2.VideoCapture(rtsp_link)
+        self.__thread = threading.Thread(target=self.rtsp_cam_buffer, args=(capture,), name="rtsp_read_thread")
+        self.__thread.daemon = True
+        self.__thread.start()
 
     def rtsp_cam_buffer(self, capture):
         """
         Приватный метод для буферизации кадров из RTSP-потока.
 
         Параметры:
-        - `capture` (cv2.VideoCapture) — Объект захвата кадров.
+        - `capture` (cv2.VideoCapture или ReplayCapture) — Объект захвата кадров.
+
+        В бесконечном цикле декодирует очередной кадр в следующую ячейку кольцевого буфера без блокировки:
+        потребители в это время читают другие ячейки. После декодирования под блокировкой увеличивает `seq`
+        и оповещает ожидающих потребителей. Если включена публикация, кадр до этого копируется в общую память,
+        чтобы результаты его распознавания было куда записать. При ошибке чтения делает паузу, которая
+        удваивается с каждой неудачей подряд (от 0,01 до 0,5 с), чтобы не занимать ядро, и после `reopen_after`
+        неудач подряд открывает устройство захвата заново (см. `__reopen`). Если закончились кадры конечного
+        источника (см. `__source_finished`), устанавливает `finished` и пробуждает ожидающих потребителей.
+        Цикл завершается после вызова `release` или окончания кадров, после чего устройство захвата освобождается и общая память
+        удаляется: это делает сам поток, чтобы память не удалялась во время записи кадра.
+
+        """
+        failures = 0
+        while self.__running:
+            slot = (self.seq + 1) % self.buffer_size
+            ready, frame = capture.read(self.__frames[slot])
+            if not ready or frame is None:
+                if self.__source_finished(capture):
+                    with self.__new_frame:
+                        self.finished = True
+                        self.__new_frame.notify_all()
+                    break
+                self.n_read_errors += 1
+                failures += 1
+                time.sleep(min(0.5, 0.01 * 2 ** min(failures - 1, 6)))
+                if failures % self.reopen_after == 0:
+                    capture = self.__reopen(capture, failures)
+                continue
+            failures = 0
+            timestamp = time.time()
+            self.__frames[slot] = frame
+            if self.publisher is not None:
+                self.publisher.publish_frame(self.seq + 1, frame, timestamp)
+            with self.__new_frame:
+                self.__timestamps[slot] = timestamp
+                self.seq += 1
+                self.__new_frame.notify_all()
+            if self.__on_frame is not None:
+                self.__on_frame(self.seq)
+        capture.release()
+        if self.publisher is not None:
+            self.publisher.close()
+
+    def __source_finished(self, capture) -> bool:
+        """
+        Приватный метод для проверки, что неудачное чтение означает конец конечного источника.
+
+        Источник конечен, если это `ReplayCapture` (или другой объект захвата с атрибутом `finished`), у которого
+        закончились кадры, или видеофайл, прочитанный до последнего кадра.
+
+        """
+        if hasattr(capture, "finished"):
+            return bool(capture.finished)
+        if not (isinstance(self.__rtsp_link, str) and os.path.isfile(self.__rtsp_link)):
+            return False
+        n_frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        return n_frames <= 0 or capture.get(cv2.CAP_PROP_POS_FRAMES) >= n_frames
+
+    def __reopen(self, capture, failures: int):
+        """
+        Приватный метод для повторного открытия устройства захвата после `failures` неудачных чтений подряд.
+
+        Открывает заново RTSP-поток, камеру или видеофайл, заданные ссылкой; готовый объект захвата, переданный
+        в конструктор, переоткрыть нельзя, и он возвращается без изменений. Возвращает объект захвата,
+        из которого следует читать дальше.
+
+        """
+        if hasattr(self.__rtsp_link, "read") or not isinstance(capture, cv2.VideoCapture):
+            return capture
+        logger.warning("Camera %s: %s reads failed in a row, reopening", self.__rtsp_link, failures)
+        capture.release()
+        self.n_reopens += 1
+        return cv2.VideoCapture(self.__rtsp_link)
+
+    def latest(self) -> tuple:
+        """
+        Метод для получения последнего кадра без копирования.
+
+        Возвращает кортеж `(seq, frame, timestamp)`, где `timestamp` — время захвата кадра (`time.time()`).
+        Если кадров еще не было, возвращает `(0, None, 0.0)`.
+
+        """
+        seq = self.seq
+        if seq == 0:
+            return 0, None, 0.0
+        slot = seq % self.buffer_size
+        return seq, self.__frames[slot], self.__timestamps[slot]
+
+    def wait_frame(self, after_seq: int, timeout=None) -> tuple:
+        """
+        Метод для ожидания кадра новее указанного.
+
+        Параметры:
+        - `after_seq` (int) — Номер последнего обработанного потребителем кадра.
+        - `timeout` (float, необязательно) — Максимальное время ожидания в секундах (по умолчанию - без ограничения).
 
-        В бесконечном цикле с использованием блокировки обновляет последний готовый кадр и последний кадр с камеры.
+        Блокирует вызывающий поток, пока не появится кадр с номером больше `after_seq`, и возвращает
+        последний кадр без копирования в виде `(seq, frame, timestamp)`. Промежуточные кадры, которые
+        потребитель не успел обработать, пропускаются. По истечении времени ожидания, а также сразу, если
+        кадры источника закончились (`finished`), возвращает `(after_seq, None, 0.0)`.
+
+        """
+        with self.__new_frame:
+            if not self.__new_frame.wait_for(lambda: self.seq > after_seq or self.finished, timeout) \
+                    or self.seq <= after_seq:
+                return after_seq, None, 0.0
+        return self.latest()
+
+    def is_valid(self, seq: int) -> bool:
+        """
+        Метод для проверки, что кадр с номером `seq`, полученный без копирования, еще не перезаписан.
+
+        """
+        return 0 < seq and self.seq - seq < self.buffer_size - 1
+
+    def next_frame(self, timeout=None) -> tuple:
+        """
+        Метод для получения следующего еще не выданного кадра.
+
+        Параметры:
+        - `timeout` (float, необязательно) — Максимальное время ожидания в секундах (по умолчанию - без ограничения).
+
+        Блокирует вызывающий поток до появления кадра, который еще не выдавался этим методом, и возвращает
+        его без копирования в виде `(seq, frame, timestamp)`. Один и тот же кадр не выдается дважды; если
+        потребитель медленнее камеры, выдается самый свежий кадр, а пропущенные кадры учитываются в `n_dropped`.
+        По истечении времени ожидания возвращает `(seq, None, 0.0)` с номером последнего выданного кадра.
+
+        """
+        seq, frame, timestamp = self.wait_frame(self.__consumed_seq, timeout)
+        if frame is not None:
+            self.n_dropped += max(0, seq - self.__consumed_seq - 1)
+            self.__consumed_seq = seq
+        return seq, frame, timestamp
+
+    def frames(self, timeout=None):
+        """
+        Генератор, выдающий каждый новый кадр один раз.
+
+        Параметры:
+        - `timeout` (float, необязательно) — Максимальное время ожидания очередного кадра в секундах.
+
+        Выдает кортежи `(seq, frame, timestamp)` (см. `next_frame`). Завершается, если очередной кадр
+        не появился за `timeout` секунд или кадры источника закончились.
 
         """
         while True:
-            with self.lock:
-                self.last_ready, self.last_frame = capture.read()
+            seq, frame, timestamp = self.next_frame(timeout)
+            if frame is None:
+                return
+            yield seq, frame, timestamp
+
+    def release(self) -> None:
+        """
+        Метод для остановки потока чтения и освобождения камеры.
+
+        Останавливает поток чтения и дожидается его завершения (не более секунды); поток освобождает
+        устройство захвата и удаляет общую память, чтобы камеру можно было открыть снова. Если поток завис
+        на чтении кадра, он сделает это, когда чтение завершится. Кадры, полученные до вызова, остаются доступными.
+
+        """
+        self.__running = False
+        self.__thread.join(timeout=1)
+
+    def publish_detections(self, seq: int, detections) -> bool:
+        """
+        Метод для публикации результатов распознавания кадра.
+
+        Параметры:
+        - `seq` (int) — Номер кадра.
+        - `detections` (list) — Найденные объекты (`Detection`) в координатах кадра.
+
+        Записывает результаты в общую память рядом с кадром (см. `SharedFramePublisher.publish_detections`).
+        Возвращает False, если публикация не включена или кадр в общей памяти уже перезаписан.
+
+        """
+        publisher = self.publisher
+        if publisher is None:
+            return False
+        return publisher.publish_detections(seq, detections)
 
     def getFrame(self):
         """
@@ -57,11 +307,8 @@ class Camera:
         Возвращает копию последнего готового кадра, если он доступен, иначе возвращает None.
 
         """
-        if (self.last_ready is not None) and (self.last_frame is not None):
-            return self.last_frame.copy()
+        _, frame, _ = self.latest()
+        if frame is not None:
+            return frame.copy()
         else:
             return None
-
-
-
-        
\ No newline at end of file
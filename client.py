@@ -0,0 +1,454 @@
+import json
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Callable, Iterable, Optional
+
+from log import get_logger
+from protocol import (FLAG_BINARY, MSG_DETECTIONS, MSG_ERROR, MSG_EVENT, MSG_REQUEST, pack_frame, pack_message,
+                      pop_frame, unpack_detections, unpack_event, unpack_message)
+
+
+logger = get_logger(__name__)
+
+
+def _subscription_id(response: str) -> int:
+    """
+    Возвращает номер подписки из ответа `subscribed <номер>` на команду `subscribe` или вызывает RuntimeError.
+
+    """
+    words = response.split()
+    if len(words) != 2 or words[0] != "subscribed" or not words[1].isdigit():
+        raise RuntimeError(f"Subscription failed: {response}")
+    return int(words[1])
+
+
+class ServiceClient:
+    """
+    Класс блокирующего клиента версии 1 протокола сервиса (4 байта длины + сообщение в UTF-8).
+
+    Держит одно постоянное соединение с сервисом и отправляет по нему сколько угодно запросов. Запросы
+    можно отправлять, не дожидаясь ответов на предыдущие (`send`), — сервис отвечает на них в порядке
+    получения, а `receive` возвращает ответы в том же порядке. Соединение устанавливается при первом
+    запросе; после ошибки оно закрывается и устанавливается заново при следующем запросе. Объект
+    не потокобезопасен: для одновременных запросов из нескольких потоков нужен клиент на каждый поток.
+
+    :Параметры:
+    - `ip (str)` — IP-адрес сервиса.
+    - `port (int)` — Порт сервиса.
+    - `timeout (float, необязательно)` — Время ожидания подключения, отправки и ответа (по умолчанию - 3 секунды).
+
+    :Атрибуты:
+    - `in_flight (int)` — Количество отправленных запросов, ответы на которые еще не получены.
+
+    :Методы:
+    - `send(self, request) -> None` — Метод для отправки запроса без ожидания ответа.
+    - `receive(self) -> str` — Метод для получения ответа на самый ранний из отправленных запросов.
+    - `request(self, request) -> str` — Метод для отправки запроса и ожидания ответа на него.
+    - `pipeline(self, requests, depth) -> list` — Метод для отправки нескольких запросов подряд и получения всех ответов.
+    - `subscribe(self, request) -> int` — Метод для подписки на события распознавания.
+    - `next_event(self, timeout) -> dict` — Метод для получения следующего события подписки.
+    - `close(self) -> None` — Метод для закрытия соединения.
+
+    После `subscribe` соединение используется только для событий: запросы по нему не отправляются,
+    а подписка отменяется закрытием соединения (`close`).
+
+    Использование:
+    ```python
+    with ServiceClient("127.0.0.2", 5505) as client:
+        print(client.request("stats"))
+        print(client.pipeline(["disable", "enable"]))
+
+    with ServiceClient("127.0.0.2", 5505) as client:
+        client.subscribe("subscribe commands rate=5")
+        while True:
+            print(client.next_event(timeout=None))
+    ```
+
+    """
+    def __init__(self, ip: str, port: int, timeout: float = 3.0):
+        """
+        Конструктор класса.
+
+        """
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.in_flight = 0
+        self.__sock = None
+        self.__buffer = bytearray()
+
+    def __enter__(self) -> "ServiceClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __connect(self) -> socket.socket:
+        """
+        Приватный метод для получения соединения, устанавливающий его при необходимости.
+
+        """
+        if self.__sock is None:
+            sock = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__sock = sock
+            self.__buffer.clear()
+            self.in_flight = 0
+        return self.__sock
+
+    def send(self, request: str) -> None:
+        """
+        Метод для отправки запроса без ожидания ответа.
+
+        При ошибке соединение закрывается, а исключение OSError передается вызывающему.
+
+        """
+        sock = self.__connect()
+        payload = request.encode("utf-8")
+        try:
+            sock.sendall(pack_frame(payload))
+        except OSError:
+            self.close()
+            raise
+        self.in_flight += 1
+
+    def receive(self) -> str:
+        """
+        Метод для получения ответа на самый ранний из отправленных запросов.
+
+        Если сервис закрыл соединение или ответ не пришел за `timeout` секунд, закрывает соединение
+        и вызывает ConnectionError (или socket.timeout).
+
+        """
+        if self.__sock is None or self.in_flight == 0:
+            raise RuntimeError("No requests are waiting for a response")
+        msg = self.__read_frame()
+        self.in_flight -= 1
+        return msg.decode("utf-8")
+
+    def __read_frame(self) -> bytes:
+        """
+        Приватный метод для получения следующего сообщения соединения.
+
+        """
+        while True:
+            msg = pop_frame(self.__buffer)
+            if msg is not None:
+                return msg
+            try:
+                packet = self.__sock.recv(65536)
+            except OSError:
+                self.close()
+                raise
+            if not packet:
+                self.close()
+                raise ConnectionError(f"Connection to {self.ip}:{self.port} closed by the service")
+            self.__buffer.extend(packet)
+
+    def request(self, request: str) -> str:
+        """
+        Метод для отправки запроса и ожидания ответа на него.
+
+        """
+        self.send(request)
+        return self.receive()
+
+    def pipeline(self, requests: Iterable[str], depth: Optional[int] = None) -> list:
+        """
+        Метод для отправки нескольких запросов подряд и получения всех ответов.
+
+        :Параметры:
+        - `requests (Iterable[str])` — Запросы.
+        - `depth (int, необязательно)` — Сколько запросов может ожидать ответа одновременно; None — без
+          ограничения (по умолчанию - None).
+
+        Возвращает ответы в порядке запросов. Ответы на запросы, отправленные ранее методом `send`, должны быть
+        получены до вызова.
+
+        """
+        responses = []
+        waiting = 0
+        for request in requests:
+            if depth is not None and waiting >= depth:
+                responses.append(self.receive())
+                waiting -= 1
+            self.send(request)
+            waiting += 1
+        for _ in range(waiting):
+            responses.append(self.receive())
+        return responses
+
+    def subscribe(self, request: str = "subscribe") -> int:
+        """
+        Метод для подписки на события распознавания.
+
+        :Параметры:
+        - `request (str, необязательно)` — Команда `subscribe` с фильтром (см. `subscription.Subscriber.parse`),
+          например `subscribe commands Forward Stop rate=2` (по умолчанию - все найденные объекты).
+
+        Возвращает номер подписки. Если сервис отказал в подписке, вызывает RuntimeError.
+
+        """
+        return _subscription_id(self.request(request))
+
+    def next_event(self, timeout: Optional[float] = -1) -> dict:
+        """
+        Метод для получения следующего события подписки.
+
+        :Параметры:
+        - `timeout (float, необязательно)` — Время ожидания события; None — без ограничения
+          (по умолчанию - `timeout` клиента).
+
+        Возвращает событие — словарь с ключами `event`, `stream`, `seq`, `timestamp`, `class`, `confidence`
+        и `box`. Если событие не пришло за время ожидания, вызывает socket.timeout и закрывает соединение.
+
+        """
+        if self.__sock is None:
+            raise RuntimeError("Not subscribed")
+        self.__sock.settimeout(self.timeout if timeout == -1 else timeout)
+        try:
+            return json.loads(self.__read_frame())
+        finally:
+            if self.__sock is not None:
+                self.__sock.settimeout(self.timeout)
+
+    def close(self) -> None:
+        """
+        Метод для закрытия соединения.
+
+        Ответы на отправленные запросы, которые еще не получены, теряются.
+
+        """
+        sock, self.__sock = self.__sock, None
+        self.in_flight = 0
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class MultiplexClient:
+    """
+    Класс клиента версии 2 протокола сервиса (см. `protocol`) с несколькими запросами на одном соединении.
+
+    Держит одно постоянное соединение, по которому запросы из любых потоков отправляются, не дожидаясь
+    ответов на предыдущие. Каждому запросу присваивается номер; ответы принимает отдельный поток и по номеру
+    передает их в объекты `concurrent.futures.Future`, поэтому ответы могут приходить в любом порядке.
+    Соединение устанавливается при первом запросе и после обрыва — при следующем запросе; запросы,
+    ожидавшие ответа на оборванном соединении, завершаются ошибкой ConnectionError, а подписки отменяются.
+
+    :Параметры:
+    - `ip (str)` — IP-адрес сервиса.
+    - `port (int)` — Порт сервиса.
+    - `timeout (float, необязательно)` — Время ожидания подключения, отправки и ответа (по умолчанию - 3 секунды).
+
+    :Методы:
+    - `submit(self, request, flags) -> Future` — Метод для отправки запроса без ожидания ответа.
+    - `request(self, request, timeout) -> str` — Метод для отправки запроса и ожидания ответа.
+    - `detections(self, stream, timeout) -> tuple` — Метод для получения последних результатов распознавания камеры.
+    - `subscribe(self, request, handler, binary, timeout) -> int` — Метод для подписки на события распознавания.
+    - `close(self) -> None` — Метод для закрытия соединения.
+
+    Использование:
+    ```python
+    with MultiplexClient("127.0.0.2", 5505) as client:
+        futures = [client.submit("stats") for _ in range(10)]
+        print([future.result().body for future in futures])
+        stream, timestamp, detections = client.detections(0)
+        subscription_id = client.subscribe("subscribe Forward Stop", print)
+        ...
+        client.request(f"unsubscribe {subscription_id}")
+    ```
+
+    """
+    def __init__(self, ip: str, port: int, timeout: float = 3.0):
+        """
+        Конструктор класса.
+
+        """
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.__sock = None
+        self.__pending = {}
+        self.__handlers = {}
+        self.__next_id = 0
+        self.__lock = threading.Lock()
+        self.__send_lock = threading.Lock()
+
+    def __enter__(self) -> "MultiplexClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __receive_loop(self, sock) -> None:
+        """
+        Приватный метод потока приема ответов.
+
+        """
+        buffer = bytearray()
+        while True:
+            try:
+                packet = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not packet:
+                break
+            buffer.extend(packet)
+            while True:
+                payload = pop_frame(buffer)
+                if payload is None:
+                    break
+                message = unpack_message(payload)
+                if message.msg_type == MSG_EVENT:
+                    handler = self.__handlers.get(message.request_id)
+                    if handler is not None:
+                        try:
+                            handler(message.body)
+                        except Exception as e:
+                            logger.warning("Client error in event handler: %s", e)
+                    continue
+                with self.__lock:
+                    future = self.__pending.pop(message.request_id, None)
+                if future is not None:
+                    future.set_result(message)
+        self.__reset(sock)
+
+    def __reset(self, sock) -> None:
+        """
+        Приватный метод для закрытия оборванного соединения и завершения ожидающих запросов ошибкой.
+
+        """
+        with self.__lock:
+            if self.__sock is not sock:
+                return
+            self.__sock = None
+            pending, self.__pending = self.__pending, {}
+            self.__handlers = {}
+        for future in pending.values():
+            future.set_exception(ConnectionError(f"Connection to {self.ip}:{self.port} lost"))
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def submit(self, request: str, flags: int = 0) -> Future:
+        """
+        Метод для отправки запроса без ожидания ответа.
+
+        :Параметры:
+        - `request (str)` — Запрос.
+        - `flags (int, необязательно)` — Флаги запроса, например `protocol.FLAG_BINARY` (по умолчанию - 0).
+
+        Возвращает объект `Future`, результатом которого будет ответ — объект `protocol.Message`. Потокобезопасен.
+        Если соединение установить не удалось, вызывает OSError.
+
+        """
+        return self.__submit(request, flags)[1]
+
+    def __submit(self, request: str, flags: int = 0, handler: Optional[Callable[[bytes], None]] = None) -> tuple:
+        """
+        Приватный метод для отправки запроса, возвращающий номер запроса и объект `Future`.
+
+        Обработчик событий `handler`, если он указан, регистрируется под номером запроса до отправки,
+        чтобы не пропустить события, пришедшие сразу после ответа.
+
+        """
+        future = Future()
+        with self.__lock:
+            if self.__sock is None:
+                sock = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.__sock = sock
+                threading.Thread(target=self.__receive_loop, args=(sock,), name="multiplex_client_receiver",
+                                 daemon=True).start()
+            sock = self.__sock
+            request_id = self.__next_id
+            self.__next_id = (self.__next_id + 1) % 2 ** 32
+            self.__pending[request_id] = future
+            if handler is not None:
+                self.__handlers[request_id] = handler
+        with self.__send_lock:
+            try:
+                sock.sendall(pack_message(MSG_REQUEST, request_id, request.encode("utf-8"), flags))
+            except OSError as e:
+                with self.__lock:
+                    lost = self.__pending.pop(request_id, None)
+                if lost is not None:
+                    future.set_exception(e)
+                self.__reset(sock)
+        return request_id, future
+
+    def request(self, request: str, timeout: Optional[float] = None) -> str:
+        """
+        Метод для отправки запроса и ожидания ответа.
+
+        Возвращает текст ответа. Если сервис ответил ошибкой (`MSG_ERROR`), вызывает RuntimeError.
+
+        """
+        message = self.submit(request).result(timeout if timeout is not None else self.timeout)
+        if message.msg_type == MSG_ERROR:
+            raise RuntimeError(message.body.decode("utf-8"))
+        return message.body.decode("utf-8")
+
+    def detections(self, stream: int = 0, timeout: Optional[float] = None) -> tuple:
+        """
+        Метод для получения последних результатов распознавания камеры.
+
+        Отправляет запрос `detections <stream>` с флагом `FLAG_BINARY` и возвращает разобранный двоичный
+        ответ `(stream, timestamp, detections)` (см. `protocol.unpack_detections`).
+
+        """
+        message = self.submit(f"detections {stream}", FLAG_BINARY).result(
+            timeout if timeout is not None else self.timeout)
+        if message.msg_type == MSG_ERROR:
+            raise RuntimeError(message.body.decode("utf-8"))
+        if message.msg_type != MSG_DETECTIONS:
+            raise RuntimeError(f"Unexpected response: {message.body[:100]!r}")
+        return unpack_detections(message.body)
+
+    def subscribe(self, request: str, handler: Callable, binary: bool = False,
+                  timeout: Optional[float] = None) -> int:
+        """
+        Метод для подписки на события распознавания.
+
+        :Параметры:
+        - `request (str)` — Команда `subscribe` с фильтром (см. `subscription.Subscriber.parse`).
+        - `handler (Callable)` — Обработчик событий, вызывается в потоке приема ответов с событием — словарем
+          (см. `ServiceClient.next_event`) или, если `binary`, кортежем `protocol.unpack_event`.
+        - `binary (bool, необязательно)` — Получать события в двоичном виде (по умолчанию - False).
+        - `timeout (float, необязательно)` — Время ожидания ответа (по умолчанию - `timeout` клиента).
+
+        Возвращает номер подписки; отменить ее можно запросом `unsubscribe <номер>`. Если сервис отказал
+        в подписке, вызывает RuntimeError.
+
+        """
+        decode = unpack_event if binary else json.loads
+        request_id, future = self.__submit(request, FLAG_BINARY if binary else 0, lambda body: handler(decode(body)))
+        try:
+            message = future.result(timeout if timeout is not None else self.timeout)
+            if message.msg_type == MSG_ERROR:
+                raise RuntimeError(message.body.decode("utf-8"))
+            return _subscription_id(message.body.decode("utf-8"))
+        except BaseException:
+            with self.__lock:
+                self.__handlers.pop(request_id, None)
+            raise
+
+    def close(self) -> None:
+        """
+        Метод для закрытия соединения.
+
+        Запросы, ожидающие ответа, завершаются ошибкой ConnectionError.
+
+        """
+        sock = self.__sock
+        if sock is not None:
+            self.__reset(sock)
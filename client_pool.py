@@ -0,0 +1,223 @@
+import collections
+import queue
+import socket
+import threading
+import time
+from typing import Optional, Callable
+
+from log import get_logger
+from metrics import MetricsRegistry
+from protocol import pack_frame, pop_frame
+
+
+logger = get_logger(__name__)
+
+
+class _Connection:
+    """
+    Постоянное соединение с одним сервером.
+
+    Запросы отправляются, не дожидаясь ответов на предыдущие; ответы читает отдельный поток
+    и передает их обработчикам в порядке отправки запросов. При обрыве соединение
+    переустанавливается при отправке следующего запроса, но не чаще, чем раз в `reconnect_delay` секунд.
+    Время от отправки запроса до получения ответа добавляется в метрику `downstream_rtt_seconds`.
+
+    """
+    def __init__(self, ip: str, port: int, timeout: float, reconnect_delay: float, metrics: MetricsRegistry):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        server = f"{ip}:{port}"
+        self.rtt = metrics.histogram("downstream_rtt_seconds", "Downstream request round-trip time", server=server)
+        self.dropped = metrics.counter("downstream_dropped_total", "Downstream requests dropped", server=server)
+        self.sock = None
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.next_attempt = 0.0
+
+    def __connect(self) -> Optional[socket.socket]:
+        if time.monotonic() < self.next_attempt:
+            return None
+        try:
+            sock = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+        except OSError as e:
+            logger.warning("Client error when connecting to %s:%s: %s", self.ip, self.port, e)
+            self.next_attempt = time.monotonic() + self.reconnect_delay
+            return None
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        receiver = threading.Thread(target=self.__receive_loop, args=(sock,),
+                                    name=f"client_pool_receiver_{self.ip}:{self.port}", daemon=True)
+        receiver.start()
+        return sock
+
+    def __receive_loop(self, sock) -> None:
+        buffer = bytearray()
+        while True:
+            try:
+                packet = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not packet:
+                break
+            buffer.extend(packet)
+            while True:
+                response = pop_frame(buffer)
+                if response is None:
+                    break
+                with self.lock:
+                    response_handler, sent_at = self.pending.popleft() if self.pending else (None, None)
+                if sent_at is not None:
+                    self.rtt.observe(time.perf_counter() - sent_at)
+                response = response.decode("utf-8")
+                logger.debug("Received: %s", response)
+                if response_handler is not None:
+                    try:
+                        response_handler(response)
+                    except Exception as e:
+                        logger.warning("Client error in response handler: %s", e)
+        self.reset(sock)
+
+    def send(self, msg: bytes, response_handler: Optional[Callable[[str], None]]) -> bool:
+        sock = self.sock
+        if sock is None:
+            sock = self.__connect()
+            if sock is None:
+                self.dropped.inc()
+                return False
+        with self.lock:
+            if self.sock is not sock:
+                self.dropped.inc()
+                return False
+            self.pending.append((response_handler, time.perf_counter()))
+        try:
+            sock.sendall(pack_frame(msg))
+        except OSError as e:
+            logger.warning("Client error when sending to %s:%s: %s", self.ip, self.port, e)
+            self.reset(sock)
+            return False
+        return True
+
+    def reset(self, sock) -> None:
+        with self.lock:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            if self.pending:
+                logger.warning("Connection to server %s:%s lost, %s responses dropped", self.ip, self.port,
+                               len(self.pending))
+                self.dropped.inc(len(self.pending))
+            self.pending.clear()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+
+class ClientPool:
+    """
+    Пул постоянных исходящих соединений для отправки запросов другим сервисам.
+
+    Для каждого сервера `(ip, port)` поддерживается одно долгоживущее соединение, которое
+    переустанавливается после обрыва. Запросы попадают в очередь, из которой их отправляет
+    единственный поток; ответы на запросы, отправленные друг за другом без ожидания, принимаются
+    в порядке отправки. Отправка запроса стоит одной операции с очередью вместо создания потока
+    и TCP-соединения.
+
+    :Параметры:
+    - `timeout (float, необязательно)` — Время ожидания подключения и отправки (по умолчанию - 3 секунды).
+    - `max_queue (int, необязательно)` — Максимальная длина очереди запросов (по умолчанию - 1024).
+    - `reconnect_delay (float, необязательно)` — Минимальный интервал между попытками подключения
+      к недоступному серверу; запросы к нему в это время отбрасываются (по умолчанию - 1 секунда).
+    - `metrics (MetricsRegistry, необязательно)` — Набор метрик, в который записываются количество отправленных
+      и отброшенных запросов и время ответа каждого сервера (по умолчанию - собственный набор пула).
+
+    :Методы:
+    - `submit(self, ip, port, request, response_handler) -> bool` — Метод для постановки запроса в очередь.
+    - `close(self) -> None` — Метод для остановки потока отправки и закрытия соединений.
+
+    """
+    def __init__(self, timeout: float = 3, max_queue: int = 1024, reconnect_delay: float = 1.0,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Конструктор класса.
+
+        """
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.reconnect_delay = reconnect_delay
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.__submitted = self.metrics.counter("downstream_requests_total", "Downstream requests submitted")
+        self.__queue_full = self.metrics.counter("downstream_queue_full_total",
+                                                 "Downstream requests dropped because the queue was full")
+        self.__requests = queue.Queue(maxsize=max_queue)
+        self.__connections = {}
+        self.__sender = None
+        self.__lock = threading.Lock()
+
+    def __send_loop(self) -> None:
+        """
+        Приватный метод потока отправки: берет запросы из очереди и отправляет их по соединениям пула.
+
+        """
+        while True:
+            item = self.__requests.get()
+            if item is None:
+                return
+            ip, port, request, response_handler = item
+            connection = self.__connections.get((ip, port))
+            if connection is None:
+                connection = _Connection(ip, port, self.timeout, self.reconnect_delay, self.metrics)
+                self.__connections[(ip, port)] = connection
+            connection.send(request.encode("utf-8"), response_handler)
+
+    def submit(self, ip: str, port: int, request: str,
+               response_handler: Optional[Callable[[str], None]] = None) -> bool:
+        """
+        Метод для постановки запроса в очередь.
+
+        :Параметры:
+        - `ip (str)` — IP-адрес сервера.
+        - `port (int)` — Порт сервера.
+        - `request (str)` — Запрос для отправки на сервер.
+        - `response_handler (Callable[[str], None], необязательно)` — Обработчик ответа от сервера,
+          вызывается в потоке приема ответов.
+
+        Запускает поток отправки, если он еще не запущен. Возвращает False, если очередь переполнена
+        и запрос отброшен.
+
+        """
+        with self.__lock:
+            if self.__sender is None:
+                self.__sender = threading.Thread(target=self.__send_loop, name="client_pool_sender", daemon=True)
+                self.__sender.start()
+        try:
+            self.__requests.put_nowait((ip, port, request, response_handler))
+        except queue.Full:
+            self.__queue_full.inc()
+            logger.warning("Client error: request queue is full, request to %s:%s dropped", ip, port)
+            return False
+        self.__submitted.inc()
+        return True
+
+    def close(self) -> None:
+        """
+        Метод для остановки потока отправки и закрытия соединений.
+
+        Запросы, уже поставленные в очередь, отправляются до остановки. После вызова пул
+        можно использовать снова — поток отправки будет запущен при следующем `submit`.
+
+        """
+        with self.__lock:
+            sender, self.__sender = self.__sender, None
+        if sender is not None:
+            self.__requests.put(None)
+            sender.join()
+        for connection in self.__connections.values():
+            if connection.sock is not None:
+                connection.reset(connection.sock)
+        self.__connections = {}
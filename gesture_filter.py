@@ -0,0 +1,115 @@
+import collections
+import time
+from typing import Optional
+
+
+class GestureFilter:
+    """
+    Класс для сглаживания результатов распознавания жестов во времени и подавления повторных команд.
+
+    Распознавание выполняется на каждом кадре, поэтому удерживаемый жест дает десятки одинаковых
+    результатов в секунду, а на границе двух жестов результат может «мигать» между классами.
+    Фильтр пропускает команду дальше, только если жест устойчив, и повторяет ее не чаще заданного интервала.
+
+    :Параметры:
+    - `window (int, необязательно)` — Размер скользящего окна кадров для голосования большинством (по умолчанию - 5).
+    - `majority (float, необязательно)` — Доля кадров окна, в которых должен быть распознан жест (по умолчанию - 0.6).
+    - `min_confidence (float, необязательно)` — Минимальная уверенность модели; менее уверенные результаты
+      считаются отсутствием жеста (по умолчанию - 0.5).
+    - `min_consecutive (int, необязательно)` — Минимальное количество последних кадров подряд с этим жестом
+      (по умолчанию - 3).
+    - `resend_interval (float, необязательно)` — Интервал в секундах, через который команда удерживаемого жеста
+      отправляется повторно; None — отправлять только при смене жеста (по умолчанию - 1 секунда).
+
+    :Атрибуты:
+    - `last_command (Optional[str])` — Последняя отправленная команда или None, если жест не удерживается.
+    - `n_frames (int)` — Количество обработанных кадров.
+    - `n_emitted (int)` — Количество пропущенных дальше команд.
+
+    :Методы:
+    - `update(self, recognition_class, confidence, now) -> Optional[str]` — Метод для обработки результата очередного кадра.
+    - `reset(self) -> None` — Метод для сброса состояния фильтра.
+
+    Использование:
+    ```python
+    gesture_filter = GestureFilter(window=5, min_consecutive=3, resend_interval=1.0)
+    command = gesture_filter.update("Forward", 0.87)
+    if command is not None:
+        ...  # отправить команду
+    ```
+
+    """
+    def __init__(self, window: int = 5, majority: float = 0.6, min_confidence: float = 0.5,
+                 min_consecutive: int = 3, resend_interval: Optional[float] = 1.0):
+        """
+        Конструктор класса.
+
+        """
+        self.window = window
+        self.majority = majority
+        self.min_confidence = min_confidence
+        self.min_consecutive = min_consecutive
+        self.resend_interval = resend_interval
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Метод для сброса состояния фильтра.
+
+        """
+        self.__history = collections.deque(maxlen=self.window)
+        self.__streak_class = None
+        self.__streak = 0
+        self.__last_emit_time = 0.0
+        self.last_command = None
+        self.n_frames = 0
+        self.n_emitted = 0
+
+    def update(self, recognition_class: Optional[str], confidence: float = 1.0,
+               now: Optional[float] = None) -> Optional[str]:
+        """
+        Метод для обработки результата очередного кадра.
+
+        :Параметры:
+        - `recognition_class (Optional[str])` — Распознанный класс жеста или None, если жест не распознан.
+        - `confidence (float, необязательно)` — Уверенность модели в распознанном классе.
+        - `now (float, необязательно)` — Момент времени кадра в секундах (по умолчанию - `time.monotonic()`).
+
+        Жест считается устойчивым, если он распознан не менее чем в доле `majority` кадров окна
+        и в `min_consecutive` последних кадрах подряд. Команда возвращается, когда устойчивый жест
+        сменился или удерживается дольше `resend_interval` с момента последней отправки.
+        Когда в окне больше нет устойчивого жеста, последняя команда сбрасывается, и повторный показ
+        того же жеста снова приводит к отправке.
+
+        Возвращает команду для отправки или None.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        if recognition_class is not None and confidence < self.min_confidence:
+            recognition_class = None
+        self.n_frames += 1
+        self.__history.append(recognition_class)
+        if recognition_class == self.__streak_class:
+            self.__streak += 1
+        else:
+            self.__streak_class = recognition_class
+            self.__streak = 1
+
+        candidate = None
+        if recognition_class is not None and self.__streak >= self.min_consecutive:
+            votes = sum(1 for c in self.__history if c == recognition_class)
+            if votes >= self.majority * len(self.__history):
+                candidate = recognition_class
+
+        if candidate is None:
+            if self.__history.count(self.last_command) < self.majority * len(self.__history):
+                self.last_command = None
+            return None
+        if candidate == self.last_command:
+            if self.resend_interval is None or now - self.__last_emit_time < self.resend_interval:
+                return None
+        self.last_command = candidate
+        self.__last_emit_time = now
+        self.n_emitted += 1
+        return candidate
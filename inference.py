@@ -0,0 +1,318 @@
+from abc import ABC, abstractmethod
+import os
+from typing import NamedTuple, Optional, Sequence
+
+import cv2
+import numpy as np
+
+
+class Detection(NamedTuple):
+    """
+    Результат распознавания одного объекта.
+
+    :Атрибуты:
+    - `class_id (int)` — Номер класса жеста.
+    - `confidence (float)` — Уверенность модели.
+    - `box (tuple)` — Координаты рамки `(x1, y1, x2, y2)` в пикселях исходного кадра.
+
+    """
+    class_id: int
+    confidence: float
+    box: tuple
+
+
+class InferenceBackend(ABC):
+    """
+    Абстрактный базовый класс механизма выполнения модели распознавания жестов.
+
+    :Методы:
+    - `predict(self, frame, imgsz) -> list` — Абстрактный метод для распознавания жестов на кадре.
+    - `predict_batch(self, frames, imgsz) -> list` — Метод для распознавания жестов на нескольких кадрах за один вызов.
+
+    :Атрибуты:
+    - `dynamic_shape (bool)` — Принимает ли модель вход произвольного размера; если нет, параметр `imgsz`
+      игнорируется и используется размер, с которым модель была экспортирована.
+
+    """
+    dynamic_shape = False
+
+    @abstractmethod
+    def predict(self, frame: np.ndarray, imgsz: Optional[int] = None) -> list:
+        """
+        Абстрактный метод для распознавания жестов на кадре.
+
+        :Параметры:
+        - `frame (numpy.ndarray)` — Кадр в формате BGR.
+        - `imgsz (int, необязательно)` — Размер входа модели (кратный 32), до которого масштабируется кадр
+          (по умолчанию - размер, с которым модель была экспортирована).
+
+        Возвращает список объектов `Detection`, упорядоченный по убыванию уверенности.
+
+        """
+        pass
+
+    def predict_batch(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> list:
+        """
+        Метод для распознавания жестов на нескольких кадрах за один вызов.
+
+        :Параметры:
+        - `frames (Sequence[numpy.ndarray])` — Кадры в формате BGR, в том числе разного размера.
+        - `imgsz (int, необязательно)` — Размер входа модели для всех кадров пакета (см. `predict`).
+
+        Возвращает для каждого кадра список объектов `Detection` (как `predict`). Реализация по умолчанию
+        обрабатывает кадры по одному; механизмы, умеющие выполнять модель на пакете, ее переопределяют.
+
+        """
+        return [self.predict(frame, imgsz) for frame in frames]
+
+
+class UltralyticsBackend(InferenceBackend):
+    """
+    Механизм выполнения модели через библиотеку ultralytics.
+
+    Библиотека (вместе с torch) импортируется только при создании объекта. Модель ONNX, экспортированная
+    с постоянным размером пакета (по умолчанию у ultralytics — 1), не принимает несколько кадров сразу,
+    поэтому для нее `predict_batch` выполняет модель по одному кадру, как `OnnxRuntimeBackend`.
+
+    :Параметры:
+    - `model_path (str)` — Путь к файлу модели.
+    - `conf (float, необязательно)` — Порог уверенности (по умолчанию - 0.25).
+    - `iou (float, необязательно)` — Порог IoU для подавления немаксимумов (по умолчанию - 0.7).
+
+    """
+    def __init__(self, model_path: str, conf: float = 0.25, iou: float = 0.7):
+        """
+        Конструктор класса.
+
+        """
+        from ultralytics import YOLO
+
+        self.conf = conf
+        self.iou = iou
+        self._model = YOLO(model_path, task="detect")
+        is_onnx = model_path.endswith(".onnx")
+        self.dynamic_shape = not is_onnx or onnx_dynamic_shape(model_path)
+        self.dynamic_batch = not is_onnx or onnx_dynamic_batch(model_path)
+
+    def predict(self, frame: np.ndarray, imgsz: Optional[int] = None) -> list:
+        return self.__run([frame], imgsz)[0]
+
+    def predict_batch(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> list:
+        if not self.dynamic_batch or len(frames) == 1:
+            return super().predict_batch(frames, imgsz)
+        return self.__run(frames, imgsz)
+
+    def __run(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> list:
+        """
+        Выполняет модель на кадрах одним вызовом ultralytics и возвращает результаты для каждого кадра.
+
+        """
+        options = {"imgsz": imgsz} if imgsz is not None and self.dynamic_shape else {}
+        results = self._model(list(frames), verbose=False, conf=self.conf, iou=self.iou, **options)
+        batch = []
+        for result in results:
+            boxes = result.boxes
+            detections = [Detection(int(cls), float(conf), tuple(float(v) for v in box))
+                          for box, conf, cls in zip(boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.cls.tolist())]
+            detections.sort(key=lambda d: d.confidence, reverse=True)
+            batch.append(detections)
+        return batch
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    Механизм выполнения модели YOLOv8 в формате ONNX напрямую через ONNX Runtime.
+
+    Не требует ultralytics и torch: предобработка (letterbox до размера входа модели, BGR → RGB,
+    нормализация) выполняется средствами OpenCV, а разбор выхода модели и подавление немаксимумов —
+    векторизованно средствами NumPy. Параметры по умолчанию совпадают с ultralytics, поэтому результаты
+    обоих механизмов совпадают с точностью до округления. Если модель экспортирована с динамическим размером
+    пакета, `predict_batch` выполняет ее один раз на весь пакет, иначе — по одному кадру.
+
+    :Параметры:
+    - `model_path (str)` — Путь к файлу модели ONNX.
+    - `intra_op_threads (int, необязательно)` — Количество потоков ONNX Runtime для одной операции
+      (по умолчанию - выбирается ONNX Runtime).
+    - `conf (float, необязательно)` — Порог уверенности (по умолчанию - 0.25).
+    - `iou (float, необязательно)` — Порог IoU для подавления немаксимумов (по умолчанию - 0.7).
+    - `max_det (int, необязательно)` — Максимальное количество объектов на кадре (по умолчанию - 300).
+
+    """
+    def __init__(self, model_path: str, intra_op_threads: Optional[int] = None,
+                 conf: float = 0.25, iou: float = 0.7, max_det: int = 300):
+        """
+        Конструктор класса.
+
+        """
+        import onnxruntime as ort
+
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads is not None:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        height, width = model_input.shape[2:4]
+        self.dynamic_shape = not isinstance(height, int) or not isinstance(width, int)
+        self.imgsz = (height if isinstance(height, int) else 640, width if isinstance(width, int) else 640)
+
+    def _letterbox(self, frame: np.ndarray, imgsz: Optional[int] = None) -> tuple:
+        """
+        Приводит кадр к размеру входа модели с сохранением пропорций и серыми полями.
+
+        Возвращает тензор NCHW float32, коэффициент масштабирования и смещение `(left, top)`.
+
+        """
+        height, width = frame.shape[:2]
+        new_height, new_width = (imgsz, imgsz) if imgsz is not None and self.dynamic_shape else self.imgsz
+        ratio = min(new_height / height, new_width / width)
+        unpad_width, unpad_height = int(round(width * ratio)), int(round(height * ratio))
+        if (unpad_width, unpad_height) != (width, height):
+            frame = cv2.resize(frame, (unpad_width, unpad_height), interpolation=cv2.INTER_LINEAR)
+        dw, dh = (new_width - unpad_width) / 2, (new_height - unpad_height) / 2
+        top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+        left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+        frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        blob = cv2.dnn.blobFromImage(frame, scalefactor=1 / 255, swapRB=True)
+        return blob, ratio, (left, top)
+
+    def _decode(self, output: np.ndarray, ratio: float, pad: tuple, shape: tuple) -> list:
+        """
+        Разбирает выход модели `(4 + число классов, число кандидатов)` в список объектов `Detection`.
+
+        """
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences > self.conf
+        if not mask.any():
+            return []
+        xywh, class_ids, confidences = predictions[mask, :4], class_ids[mask], confidences[mask]
+        boxes = np.empty_like(xywh)
+        boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        # Смещение рамок по номеру класса: подавление немаксимумов выполняется внутри каждого класса.
+        keep = nms(boxes + class_ids[:, None] * 7680.0, confidences, self.iou)[:self.max_det]
+        boxes = (boxes[keep] - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+        return [Detection(int(cls), float(conf), tuple(float(v) for v in box))
+                for box, conf, cls in zip(boxes, confidences[keep], class_ids[keep])]
+
+    def predict(self, frame: np.ndarray, imgsz: Optional[int] = None) -> list:
+        blob, ratio, pad = self._letterbox(frame, imgsz)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        return self._decode(output[0], ratio, pad, frame.shape)
+
+    def predict_batch(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> list:
+        if not self.dynamic_batch or len(frames) == 1:
+            return [self.predict(frame, imgsz) for frame in frames]
+        letterboxed = [self._letterbox(frame, imgsz) for frame in frames]
+        blob = np.concatenate([blob for blob, _, _ in letterboxed])
+        outputs = self.session.run(None, {self.input_name: blob})[0]
+        return [self._decode(output, ratio, pad, frame.shape)
+                for output, (_, ratio, pad), frame in zip(outputs, letterboxed, frames)]
+
+
+def onnx_dynamic_shape(model_path: str) -> bool:
+    """
+    Проверяет, экспортирована ли модель ONNX с произвольной высотой и шириной входа.
+
+    """
+    import onnx
+
+    dims = onnx.load(model_path, load_external_data=False).graph.input[0].type.tensor_type.shape.dim
+    return any(dim.dim_param or dim.dim_value == 0 for dim in dims[2:4])
+
+
+def onnx_dynamic_batch(model_path: str) -> bool:
+    """
+    Проверяет, экспортирована ли модель ONNX с произвольным размером пакета.
+
+    """
+    import onnx
+
+    dim = onnx.load(model_path, load_external_data=False).graph.input[0].type.tensor_type.shape.dim[0]
+    return bool(dim.dim_param) or dim.dim_value == 0
+
+
+def quantized_model_path(model_path: str) -> str:
+    """
+    Возвращает путь к квантованной (INT8) версии модели: `best.onnx` → `best.int8.onnx` (см. `quantize.py`).
+
+    """
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Подавление немаксимумов.
+
+    :Параметры:
+    - `boxes (numpy.ndarray)` — Рамки `(N, 4)` в формате `(x1, y1, x2, y2)`.
+    - `scores (numpy.ndarray)` — Уверенности `(N,)`.
+    - `iou_threshold (float)` — Рамки, перекрывающиеся с более уверенной рамкой сильнее порога, отбрасываются.
+
+    На каждом шаге IoU выбранной рамки со всеми оставшимися считается одной векторной операцией.
+    Возвращает индексы оставленных рамок в порядке убывания уверенности.
+
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        width = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        height = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = width * height
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def draw_detections(frame: np.ndarray, detections: Sequence[Detection], class_names: Sequence[str]) -> np.ndarray:
+    """
+    Рисует рамки и подписи распознанных жестов на копии кадра.
+
+    """
+    annotated = frame.copy()
+    for detection in detections:
+        x1, y1, x2, y2 = (int(v) for v in detection.box)
+        label = f"{class_names[detection.class_id]} {detection.confidence:.2f}"
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(annotated, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return annotated
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+}
+
+
+def create_backend(name: str, model_path: str, intra_op_threads: Optional[int] = None) -> InferenceBackend:
+    """
+    Создает механизм выполнения модели по имени.
+
+    :Параметры:
+    - `name (str)` — "ultralytics" или "onnxruntime".
+    - `model_path (str)` — Путь к файлу модели.
+    - `intra_op_threads (int, необязательно)` — Количество потоков ONNX Runtime (только для "onnxruntime").
+
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name}")
+    if name == "onnxruntime":
+        return OnnxRuntimeBackend(model_path, intra_op_threads=intra_op_threads)
+    return BACKENDS[name](model_path)
@@ -0,0 +1,171 @@
+"""
+Нагрузочное тестирование сервиса по его протоколу (4 байта длины + сообщение в UTF-8).
+
+`--clients` клиентов (`ServiceClient`, каждый в своем потоке) держат постоянные соединения с сервисом
+и отправляют по ним запросы из `--request` по кругу, пока не будет отправлено `--requests` запросов или
+не пройдет `--duration` секунд. Каждый клиент может ожидать ответа не более чем на `--depth` запросов
+одновременно. С `--rate` клиенты отправляют запросы с заданной суммарной частотой, и задержка отсчитывается
+от запланированного момента отправки, а не от фактического: так задержка не занижается, когда сервис
+не успевает и клиенты отправляют запросы позже плана.
+
+Отчет (JSON): достигнутое количество запросов в секунду, ошибки и распределение задержки (p50/p95/p99)
+всех запросов и отдельно по каждой команде (первому слову запроса).
+
+С `--stub` нагрузка подается на заглушку сервиса (`Service` или, с `--stub async`, `AsyncService` с пустым
+`_do_job` и эхо-обработчиком), запущенную на свободном порту в этом же процессе. Команды `close` и `restart`
+останавливают сервис, поэтому в нагрузку их включать не следует.
+
+Пример запуска:
+```
+python loadtest.py --stub sync --clients 50 --requests 20000 --depth 4
+python loadtest.py --stub async --clients 200 --duration 10 --rate 2000 --request ping --request stats
+python loadtest.py --ip 127.0.0.2 --port 5505 --clients 4 --duration 5 --request enable --request stats
+```
+"""
+import argparse
+import collections
+import itertools
+import json
+import statistics
+import threading
+import time
+
+from bench_common import AsyncStubService, StubService, free_port, percentile, send_request, wait_listening
+from client import ServiceClient
+
+
+def _latency(latencies: list) -> dict:
+    if not latencies:
+        return {}
+    return {
+        "mean": round(statistics.mean(latencies), 3),
+        "p50": round(percentile(latencies, 0.50), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "max": round(max(latencies), 3),
+    }
+
+
+def run(ip: str, port: int, requests: list, n_clients: int, n_requests=None, duration=None, depth: int = 1,
+        rate=None, timeout: float = 3.0) -> dict:
+    start = time.perf_counter()
+    deadline = start + duration if duration is not None else None
+    counter = itertools.count()
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    results_lock = threading.Lock()
+
+    def next_index():
+        index = next(counter)
+        if n_requests is not None and index >= n_requests:
+            return None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        return index
+
+    def client_loop(client_id: int) -> None:
+        client = ServiceClient(ip, port, timeout=timeout)
+        in_flight = collections.deque()
+        sent = 0
+        local = collections.defaultdict(list)
+        local_errors = collections.Counter()
+
+        def complete() -> None:
+            kind, scheduled_at = in_flight.popleft()
+            try:
+                client.receive()
+            except OSError as e:
+                local_errors[type(e).__name__] += 1 + len(in_flight)
+                in_flight.clear()
+                return
+            local[kind].append((time.perf_counter() - scheduled_at) * 1000)
+
+        while True:
+            index = next_index()
+            if index is None:
+                break
+            request = requests[index % len(requests)]
+            scheduled_at = time.perf_counter()
+            if rate is not None:
+                scheduled_at = start + (sent * n_clients + client_id) / rate
+                sent += 1
+                while in_flight and time.perf_counter() < scheduled_at:
+                    complete()
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            while len(in_flight) >= depth:
+                complete()
+            try:
+                client.send(request)
+            except OSError as e:
+                local_errors[type(e).__name__] += 1 + len(in_flight)
+                in_flight.clear()
+                continue
+            in_flight.append((request.split(" ", 1)[0], scheduled_at))
+        while in_flight:
+            complete()
+        client.close()
+        with results_lock:
+            for kind, values in local.items():
+                latencies[kind].extend(values)
+            errors.update(local_errors)
+
+    clients = [threading.Thread(target=client_loop, args=(i,), daemon=True) for i in range(n_clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "target": f"{ip}:{port}",
+        "clients": n_clients,
+        "depth": depth,
+        "rate": rate,
+        "completed": completed,
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(completed / elapsed, 1),
+        "latency_ms": _latency([value for values in latencies.values() for value in values]),
+        "by_request": {kind: {"completed": len(values), "latency_ms": _latency(values)}
+                       for kind, values in latencies.items()},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test for the length-prefixed service protocol")
+    parser.add_argument("--ip", default="127.0.0.1", help="IP-адрес сервиса")
+    parser.add_argument("--port", type=int, default=5505, help="порт сервиса")
+    parser.add_argument("--stub", choices=["sync", "async"], default=None,
+                        help="запустить заглушку Service или AsyncService вместо подключения к --ip/--port")
+    parser.add_argument("--n-conn", type=int, default=None, help="параметр n_conn заглушки (по умолчанию - --clients)")
+    parser.add_argument("--workers", type=int, default=4, help="параметр n_workers заглушки")
+    parser.add_argument("--request", action="append", default=None,
+                        help="запрос; можно указать несколько раз, запросы отправляются по кругу (по умолчанию - ping)")
+    parser.add_argument("--clients", type=int, default=10, help="количество одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=None, help="общее количество запросов")
+    parser.add_argument("--duration", type=float, default=None, help="длительность нагрузки, с")
+    parser.add_argument("--depth", type=int, default=1, help="сколько запросов клиент отправляет, не дожидаясь ответов")
+    parser.add_argument("--rate", type=float, default=None, help="суммарная частота запросов, запросов/с")
+    parser.add_argument("--timeout", type=float, default=3.0, help="время ожидания ответа, с")
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.requests = 10000
+
+    ip, port, server_thread = args.ip, args.port, None
+    if args.stub is not None:
+        service_cls = AsyncStubService if args.stub == "async" else StubService
+        ip, port = "127.0.0.1", free_port()
+        service = service_cls(ip_=ip, port_=port, n_conn_=args.n_conn or args.clients, n_workers_=args.workers)
+        server_thread = threading.Thread(target=service.start, daemon=True)
+        server_thread.start()
+        wait_listening(ip, port)
+
+    report = run(ip, port, args.request or ["ping"], args.clients, args.requests, args.duration,
+                 max(1, args.depth), args.rate, args.timeout)
+    if server_thread is not None:
+        send_request(ip, port, "close")
+        server_thread.join(timeout=30)
+    print(json.dumps(report, indent=2))
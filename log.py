@@ -0,0 +1,57 @@
+import logging
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Фильтр, ограничивающий частоту одинаковых сообщений журнала.
+
+    Сообщения считаются одинаковыми, если они записаны из одного места кода с одним шаблоном. Из каждой
+    группы за `interval` секунд пропускается не больше `burst` сообщений; о количестве подавленных
+    сообщений сообщается в следующем пропущенном сообщении группы.
+
+    :Параметры:
+    - `interval (float, необязательно)` — Длительность окна в секундах (по умолчанию - 10).
+    - `burst (int, необязательно)` — Количество сообщений группы, пропускаемых за окно (по умолчанию - 5).
+
+    """
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        """
+        Конструктор класса.
+
+        """
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.__groups = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno, record.msg)
+        now = time.monotonic()
+        with self.__lock:
+            window_start, passed, suppressed = self.__groups.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, passed = now, 0
+            if passed >= self.burst:
+                self.__groups[key] = (window_start, passed, suppressed + 1)
+                return False
+            self.__groups[key] = (window_start, passed + 1, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Возвращает журнал модуля с ограничением частоты одинаковых сообщений (`RateLimitFilter`).
+
+    Уровень и вывод журналов настраиваются приложением, например `logging.basicConfig(level=logging.INFO)`.
+    Сообщения о каждом запросе пишутся с уровнем DEBUG, поэтому по умолчанию не замедляют обработку.
+
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter())
+    return logger
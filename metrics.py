@@ -0,0 +1,273 @@
+import bisect
+import threading
+from typing import Callable, Optional, Sequence
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """
+    Класс счетчика событий.
+
+    :Методы:
+    - `inc(self, amount) -> None` — Метод для увеличения счетчика.
+
+    """
+    def __init__(self):
+        """
+        Конструктор класса.
+
+        """
+        self.value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        Метод для увеличения счетчика.
+
+        """
+        with self.__lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    Класс измеряемой величины.
+
+    Значение задается методом `set` или вычисляется функцией `func` при каждом чтении.
+
+    :Методы:
+    - `set(self, value) -> None` — Метод для установки значения.
+    - `get(self) -> float` — Метод для получения значения.
+
+    """
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        """
+        Конструктор класса.
+
+        """
+        self.func = func
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        """
+        Метод для установки значения.
+
+        """
+        self.value = value
+
+    def get(self) -> float:
+        """
+        Метод для получения значения.
+
+        """
+        return self.func() if self.func is not None else self.value
+
+
+class Histogram:
+    """
+    Класс гистограммы длительностей (в секундах) с фиксированными границами корзин.
+
+    :Методы:
+    - `observe(self, value) -> None` — Метод для добавления замера.
+    - `quantile(self, q) -> float` — Метод для оценки квантиля по корзинам.
+    - `snapshot(self) -> dict` — Метод для получения количества, суммы, среднего и p50/p95/p99 замеров.
+
+    """
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Конструктор класса.
+
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        Метод для добавления замера.
+
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Метод для оценки квантиля по корзинам.
+
+        Значение линейно интерполируется внутри корзины, в которую попадает квантиль; для замеров больше
+        последней границы возвращается последняя граница.
+
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        """
+        Метод для получения количества, суммы, среднего и p50/p95/p99 замеров (в миллисекундах).
+
+        """
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+        }
+
+
+class MetricsRegistry:
+    """
+    Класс набора метрик сервиса.
+
+    Метрики создаются при первом обращении по имени и меткам и затем возвращаются те же объекты, поэтому
+    модули могут получать их независимо друг от друга.
+
+    :Методы:
+    - `counter(self, name, help, **labels) -> Counter` — Метод для получения счетчика.
+    - `gauge(self, name, help, func, **labels) -> Gauge` — Метод для получения измеряемой величины.
+    - `histogram(self, name, help, buckets, **labels) -> Histogram` — Метод для получения гистограммы.
+    - `as_dict(self) -> dict` — Метод для получения значений всех метрик в виде словаря (для JSON).
+    - `prometheus(self) -> str` — Метод для получения значений всех метрик в текстовом формате Prometheus.
+
+    Использование:
+    ```python
+    metrics = MetricsRegistry()
+    metrics.counter("requests_total", "Обработанные запросы").inc()
+    metrics.histogram("request_seconds", "Время обработки запроса").observe(0.002)
+    print(metrics.prometheus())
+    ```
+
+    """
+    def __init__(self):
+        """
+        Конструктор класса.
+
+        """
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __get(self, kind: str, name: str, help: str, labels: dict, factory: Callable):
+        """
+        Приватный метод для получения или создания метрики.
+
+        """
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.__lock:
+            entry = self.__metrics.setdefault(name, (kind, help, {}))
+            if entry[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as {entry[0]}")
+            series = entry[2]
+            if key not in series:
+                series[key] = factory()
+            return series[key]
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        """
+        Метод для получения счетчика.
+
+        """
+        return self.__get("counter", name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str = "", func: Optional[Callable[[], float]] = None, **labels) -> Gauge:
+        """
+        Метод для получения измеряемой величины.
+
+        Если передана функция `func`, она заменяет функцию уже существующей величины.
+
+        """
+        gauge = self.__get("gauge", name, help, labels, lambda: Gauge(func))
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        """
+        Метод для получения гистограммы.
+
+        """
+        return self.__get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def __items(self) -> list:
+        """
+        Приватный метод для получения копии списка метрик.
+
+        """
+        with self.__lock:
+            return [(name, kind, help, list(series.items())) for name, (kind, help, series) in self.__metrics.items()]
+
+    @staticmethod
+    def __value(kind: str, metric):
+        """
+        Приватный метод для получения значения метрики для словаря.
+
+        """
+        if kind == "counter":
+            return metric.value
+        if kind == "gauge":
+            return round(metric.get(), 3)
+        return metric.snapshot()
+
+    def as_dict(self) -> dict:
+        """
+        Метод для получения значений всех метрик в виде словаря (для JSON).
+
+        Метрика без меток отображается в значение, метрика с метками — в словарь по строкам меток
+        вида `"stage=infer"`. Гистограммы отображаются в результат `Histogram.snapshot`.
+
+        """
+        result = {}
+        for name, kind, _, series in self.__items():
+            if len(series) == 1 and series[0][0] == ():
+                result[name] = self.__value(kind, series[0][1])
+            else:
+                result[name] = {",".join(f"{k}={v}" for k, v in key): self.__value(kind, metric)
+                                for key, metric in series}
+        return result
+
+    def prometheus(self) -> str:
+        """
+        Метод для получения значений всех метрик в текстовом формате Prometheus.
+
+        """
+        def labels_text(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        for name, kind, help, series in self.__items():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in series:
+                if kind == "counter":
+                    lines.append(f"{name}{labels_text(key)} {metric.value}")
+                elif kind == "gauge":
+                    lines.append(f"{name}{labels_text(key)} {metric.get()}")
+                else:
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets, metric.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{labels_text(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{labels_text(key, [('le', '+Inf')])} {metric.count}")
+                    lines.append(f"{name}_sum{labels_text(key)} {metric.sum}")
+                    lines.append(f"{name}_count{labels_text(key)} {metric.count}")
+        return "\n".join(lines) + "\n"
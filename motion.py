@@ -0,0 +1,94 @@
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Класс для решения, нужно ли распознавать жесты на очередном кадре.
+
+    Перед распознаванием кадр уменьшается до `size` и переводится в оттенки серого; доля пикселей, яркость
+    которых изменилась больше чем на `pixel_delta` по сравнению с кадром последнего распознавания,
+    сравнивается с порогом `threshold`. Распознавание выполняется, если движение превысило порог,
+    если с последнего распознавания прошло `max_interval` секунд, а также на всех кадрах в течение `hold`
+    секунд после движения — чтобы жест, который показали и затем удерживают неподвижно, набрал нужное
+    фильтру количество кадров. На остальных кадрах используется результат последнего распознавания.
+
+    :Параметры:
+    - `threshold (float, необязательно)` — Доля изменившихся пикселей, считающаяся движением (по умолчанию - 0.01).
+    - `pixel_delta (int, необязательно)` — Изменение яркости пикселя (0-255), считающееся изменением
+      (по умолчанию - 25).
+    - `max_interval (float, необязательно)` — Распознавать не реже чем раз в столько секунд (по умолчанию - 0.5).
+    - `hold (float, необязательно)` — Сколько секунд после движения распознавать каждый кадр (по умолчанию - 1.0).
+    - `size (tuple, необязательно)` — Размер `(ширина, высота)` уменьшенного кадра (по умолчанию - `(64, 48)`).
+
+    :Атрибуты:
+    - `n_inferred (int)` — Количество кадров, для которых распознавание было выполнено.
+    - `n_skipped (int)` — Количество кадров, для которых был использован предыдущий результат.
+    - `last_motion (float)` — Доля изменившихся пикселей на последнем проверенном кадре.
+
+    :Методы:
+    - `should_infer(self, frame, now) -> bool` — Метод для проверки очередного кадра.
+    - `reset(self) -> None` — Метод для сброса состояния.
+
+    """
+    def __init__(self, threshold: float = 0.01, pixel_delta: int = 25, max_interval: float = 0.5,
+                 hold: float = 1.0, size: tuple = (64, 48)):
+        """
+        Конструктор класса.
+
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_interval = max_interval
+        self.hold = hold
+        self.size = size
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Метод для сброса состояния.
+
+        Следующий кадр будет распознан в любом случае.
+
+        """
+        self.__reference = None
+        self.__last_inference = 0.0
+        self.__last_motion_time = float("-inf")
+        self.n_inferred = 0
+        self.n_skipped = 0
+        self.last_motion = 0.0
+
+    def should_infer(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """
+        Метод для проверки очередного кадра.
+
+        :Параметры:
+        - `frame (numpy.ndarray)` — Кадр в формате BGR.
+        - `now (float, необязательно)` — Момент времени кадра в секундах (по умолчанию - `time.monotonic()`).
+
+        Возвращает True, если кадр нужно распознать, и False, если можно использовать предыдущий результат.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        small = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self.__reference is None:
+            infer = True
+        else:
+            diff = cv2.absdiff(small, self.__reference)
+            self.last_motion = np.count_nonzero(diff > self.pixel_delta) / diff.size
+            if self.last_motion >= self.threshold:
+                self.__last_motion_time = now
+            infer = (now - self.__last_motion_time < self.hold
+                     or now - self.__last_inference >= self.max_interval)
+
+        if infer:
+            self.__reference = small
+            self.__last_inference = now
+            self.n_inferred += 1
+        else:
+            self.n_skipped += 1
+        return infer
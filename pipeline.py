@@ -0,0 +1,212 @@
+import collections
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+from log import get_logger
+from metrics import MetricsRegistry
+
+
+logger = get_logger(__name__)
+
+
+class BoundedQueue:
+    """
+    Класс ограниченной очереди между стадиями конвейера.
+
+    :Параметры:
+    - `maxsize (int)` — Максимальное количество элементов в очереди.
+    - `drop_oldest (bool, необязательно)` — Если очередь заполнена: True — выбросить самый старый элемент
+      и добавить новый, False — ждать освобождения места (по умолчанию - True).
+
+    :Атрибуты:
+    - `n_dropped (int)` — Количество выброшенных элементов.
+    - `max_depth (int)` — Наибольшая наблюдавшаяся длина очереди.
+
+    :Методы:
+    - `put(self, item) -> bool` — Метод для добавления элемента.
+    - `get(self, timeout) -> tuple` — Метод для извлечения элемента.
+    - `depth(self) -> int` — Метод для получения текущей длины очереди.
+    - `close(self) -> None` — Метод для пробуждения всех ожидающих потоков при остановке.
+
+    """
+    def __init__(self, maxsize: int, drop_oldest: bool = True):
+        """
+        Конструктор класса.
+
+        """
+        self.maxsize = max(1, maxsize)
+        self.drop_oldest = drop_oldest
+        self.n_dropped = 0
+        self.max_depth = 0
+        self.__items = collections.deque()
+        self.__closed = False
+        self.__changed = threading.Condition(threading.Lock())
+
+    def put(self, item) -> bool:
+        """
+        Метод для добавления элемента.
+
+        Возвращает False, если очередь закрыта и элемент не добавлен.
+
+        """
+        with self.__changed:
+            if not self.drop_oldest:
+                self.__changed.wait_for(lambda: len(self.__items) < self.maxsize or self.__closed)
+            if self.__closed:
+                return False
+            if len(self.__items) >= self.maxsize:
+                self.__items.popleft()
+                self.n_dropped += 1
+            self.__items.append(item)
+            self.max_depth = max(self.max_depth, len(self.__items))
+            self.__changed.notify_all()
+        return True
+
+    def get(self, timeout=None) -> tuple:
+        """
+        Метод для извлечения элемента.
+
+        Возвращает `(True, item)` или `(False, None)`, если за `timeout` секунд элемент не появился
+        либо очередь закрыта.
+
+        """
+        with self.__changed:
+            if not self.__changed.wait_for(lambda: self.__items or self.__closed, timeout) or not self.__items:
+                return False, None
+            item = self.__items.popleft()
+            self.__changed.notify_all()
+        return True, item
+
+    def depth(self) -> int:
+        """
+        Метод для получения текущей длины очереди.
+
+        """
+        return len(self.__items)
+
+    def close(self) -> None:
+        """
+        Метод для пробуждения всех ожидающих потоков при остановке.
+
+        """
+        with self.__changed:
+            self.__closed = True
+            self.__changed.notify_all()
+
+
+class Pipeline:
+    """
+    Класс конвейера из стадий, каждая из которых выполняется в своем потоке.
+
+    Стадии соединены ограниченными очередями (`BoundedQueue`): пока одна стадия обрабатывает элемент,
+    следующая обрабатывает предыдущий, поэтому пропускная способность ограничена самой медленной стадией,
+    а не суммой всех стадий. Функция стадии получает элемент из входной очереди и возвращает элемент
+    для следующей стадии; если она вернула None, элемент дальше не передается.
+
+    :Параметры:
+    - `stages (Sequence[tuple])` — Стадии в виде кортежей `(name, func, maxsize, drop_oldest)`, где `maxsize`
+      и `drop_oldest` — параметры входной очереди стадии.
+    - `samples (int, необязательно)` — Сколько последних замеров времени хранить для каждой стадии
+      (по умолчанию - 256).
+    - `metrics (MetricsRegistry, необязательно)` — Набор метрик, в который записываются время работы стадий
+      (`pipeline_stage_seconds`), длина очередей (`pipeline_queue_depth`) и количество выброшенных элементов
+      (`pipeline_dropped`) с меткой `stage` (по умолчанию - не записываются).
+
+    :Методы:
+    - `submit(self, item) -> bool` — Метод для передачи элемента первой стадии.
+    - `stats(self) -> dict` — Метод для получения времени работы стадий и длины очередей.
+    - `close(self) -> None` — Метод для остановки потоков стадий.
+
+    """
+    def __init__(self, stages: Sequence[tuple], samples: int = 256, metrics: Optional[MetricsRegistry] = None):
+        """
+        Конструктор класса.
+
+        Создает очереди и запускает потоки стадий.
+
+        """
+        self.__names = [name for name, _, _, _ in stages]
+        self.__queues = [BoundedQueue(maxsize, drop_oldest) for _, _, maxsize, drop_oldest in stages]
+        self.__latencies = [collections.deque(maxlen=samples) for _ in stages]
+        self.__counts = [0] * len(stages)
+        self.__histograms = [None] * len(stages)
+        if metrics is not None:
+            for i, (name, queue) in enumerate(zip(self.__names, self.__queues)):
+                self.__histograms[i] = metrics.histogram("pipeline_stage_seconds", "Pipeline stage time", stage=name)
+                metrics.gauge("pipeline_queue_depth", "Pipeline stage input queue depth", queue.depth, stage=name)
+                metrics.gauge("pipeline_dropped", "Items dropped from a full stage queue",
+                              lambda queue=queue: queue.n_dropped, stage=name)
+        self.__running = True
+        self.__threads = []
+        for i, (name, func, _, _) in enumerate(stages):
+            thread = threading.Thread(target=self.__run_stage, args=(i, func), name=f"{name}_stage_thread", daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def __run_stage(self, index: int, func: Callable) -> None:
+        """
+        Приватный метод потока стадии.
+
+        """
+        queue = self.__queues[index]
+        output: Optional[BoundedQueue] = self.__queues[index + 1] if index + 1 < len(self.__queues) else None
+        while self.__running:
+            ok, item = queue.get()
+            if not ok:
+                continue
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except Exception as e:
+                logger.error("Stage %s failed: %s", self.__names[index], e)
+                continue
+            elapsed = time.perf_counter() - start
+            self.__latencies[index].append(elapsed)
+            self.__counts[index] += 1
+            if self.__histograms[index] is not None:
+                self.__histograms[index].observe(elapsed)
+            if result is not None and output is not None:
+                output.put(result)
+
+    def submit(self, item) -> bool:
+        """
+        Метод для передачи элемента первой стадии.
+
+        """
+        return self.__queues[0].put(item)
+
+    def stats(self) -> dict:
+        """
+        Метод для получения времени работы стадий и длины очередей.
+
+        Возвращает словарь по именам стадий: количество обработанных элементов, среднее и 95-й процентиль
+        времени обработки по последним замерам в миллисекундах, текущая и наибольшая длина входной очереди
+        и количество выброшенных из нее элементов.
+
+        """
+        stats = {}
+        for name, queue, latencies, count in zip(self.__names, self.__queues, self.__latencies, self.__counts):
+            samples = sorted(latencies)
+            stats[name] = {
+                "processed": count,
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+                "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 3) if samples else 0.0,
+                "queue_depth": queue.depth(),
+                "queue_max_depth": queue.max_depth,
+                "dropped": queue.n_dropped,
+            }
+        return stats
+
+    def close(self) -> None:
+        """
+        Метод для остановки потоков стадий.
+
+        Необработанные элементы отбрасываются. Дожидается завершения потоков.
+
+        """
+        self.__running = False
+        for queue in self.__queues:
+            queue.close()
+        for thread in self.__threads:
+            thread.join(timeout=5)
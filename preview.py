@@ -0,0 +1,91 @@
+import threading
+from typing import Callable
+
+import cv2
+
+
+class Preview:
+    """
+    Класс окна предварительного просмотра результатов распознавания.
+
+    Отрисовка кадра с результатами и вывод его в окно OpenCV выполняются в отдельном потоке, поэтому
+    не задерживают распознавание. Отображается не более одного кадра из `every` предложенных; если поток
+    отрисовки не успевает, ожидающий кадр заменяется более новым.
+
+    :Параметры:
+    - `window_name (str, необязательно)` — Заголовок окна (по умолчанию - "Gesture recognition").
+    - `every (int, необязательно)` — Отображать каждый `every`-й предложенный кадр (по умолчанию - 1).
+
+    :Атрибуты:
+    - `quit_requested (bool)` — Флаг, указывающий, что в окне была нажата клавиша 'q'.
+
+    :Методы:
+    - `offer(self, render) -> bool` — Метод для передачи очередного кадра на отображение.
+    - `close(self) -> None` — Метод для остановки потока отрисовки и закрытия окна.
+
+    """
+    def __init__(self, window_name: str = "Gesture recognition", every: int = 1):
+        """
+        Конструктор класса.
+
+        Запускает поток отрисовки.
+
+        """
+        self.window_name = window_name
+        self.every = max(1, every)
+        self.quit_requested = False
+        self.__n_offered = 0
+        self.__render = None
+        self.__running = True
+        self.__new_render = threading.Condition()
+        self.__thread = threading.Thread(target=self.__render_loop, name="preview_thread", daemon=True)
+        self.__thread.start()
+
+    def __render_loop(self) -> None:
+        """
+        Приватный метод потока отрисовки.
+
+        Ожидает кадр, вызывает функцию отрисовки и показывает результат в окне. Пока новых кадров нет,
+        продолжает обрабатывать события окна, чтобы оно не зависало.
+
+        """
+        while True:
+            with self.__new_render:
+                self.__new_render.wait_for(lambda: self.__render is not None or not self.__running, 0.1)
+                if not self.__running:
+                    break
+                render, self.__render = self.__render, None
+            if render is not None:
+                cv2.imshow(self.window_name, render())
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.quit_requested = True
+        cv2.destroyAllWindows()
+
+    def offer(self, render: Callable) -> bool:
+        """
+        Метод для передачи очередного кадра на отображение.
+
+        :Параметры:
+        - `render (Callable[[], numpy.ndarray])` — Функция без аргументов, возвращающая кадр для отображения,
+          например `results[0].plot`. Вызывается в потоке отрисовки.
+
+        Возвращает True, если кадр принят на отображение, и False, если он пропущен.
+
+        """
+        self.__n_offered += 1
+        if (self.__n_offered - 1) % self.every != 0:
+            return False
+        with self.__new_render:
+            self.__render = render
+            self.__new_render.notify()
+        return True
+
+    def close(self) -> None:
+        """
+        Метод для остановки потока отрисовки и закрытия окна.
+
+        """
+        with self.__new_render:
+            self.__running = False
+            self.__new_render.notify()
+        self.__thread.join(timeout=1)
@@ -0,0 +1,394 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Sequence
+
+import numpy as np
+
+from inference import Detection, create_backend
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def _worker(backend: str, model_path: str, intra_op_threads: Optional[int], tasks, results) -> None:
+    """
+    Функция процесса распознавания.
+
+    Загружает свою копию модели и распознает кадры, которые родительский процесс записал в общую память.
+    Через очереди передаются только имя общей памяти, смещение и форма кадра и результаты. Когда пул
+    заменяет общую память (см. `InferenceProcessPool.submit`), процесс подключается к новой и отключается
+    от прежней: задания из очереди приходят по порядку, поэтому кадров в прежней памяти ему больше не придет.
+    После загрузки модели процесс сообщает о готовности сообщением с номером задания None и текстом ошибки,
+    если модель загрузить не удалось (тогда процесс завершается).
+
+    """
+    shm = None
+    try:
+        try:
+            model = create_backend(backend, model_path, intra_op_threads=intra_op_threads)
+        except Exception as e:
+            results.put((None, None, f"{type(e).__name__}: {e}"))
+            return
+        results.put((None, None, None))
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            ticket, shm_name, offset, shape, imgsz = task
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            try:
+                detections = [tuple(d) for d in model.predict(frame, imgsz)]
+                results.put((ticket, detections, None))
+            except Exception as e:
+                results.put((ticket, None, str(e)))
+            del frame
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+class PendingResult:
+    """
+    Класс результата распознавания пакета кадров, который еще выполняется в процессах.
+
+    :Атрибуты:
+    - `submitted_at (float)` — Время передачи пакета в пул (`time.perf_counter()`).
+    - `completed_at (Optional[float])` — Время получения результата последнего кадра пакета или None.
+
+    :Методы:
+    - `get(self, timeout) -> list` — Метод для ожидания результатов всех кадров пакета.
+
+    """
+    def __init__(self, n_frames: int):
+        """
+        Конструктор класса.
+
+        """
+        self.__detections = [None] * n_frames
+        self.__remaining = n_frames
+        self.__error = None
+        self.__done = threading.Event()
+        self.submitted_at = time.perf_counter()
+        self.completed_at = None
+        if n_frames == 0:
+            self.completed_at = self.submitted_at
+            self.__done.set()
+
+    def _set(self, index: int, detections: Optional[list], error: Optional[str]) -> None:
+        """
+        Метод, которым пул сохраняет результат одного кадра.
+
+        """
+        if error is not None:
+            self.__error = error
+        else:
+            self.__detections[index] = [Detection(d[0], d[1], tuple(d[2])) for d in detections]
+        self.__remaining -= 1
+        if self.__remaining == 0:
+            self.completed_at = time.perf_counter()
+            self.__done.set()
+
+    def get(self, timeout=None) -> list:
+        """
+        Метод для ожидания результатов всех кадров пакета.
+
+        Возвращает для каждого кадра список объектов `Detection` в порядке кадров пакета.
+        Если распознавание хотя бы одного кадра завершилось ошибкой или время ожидания истекло,
+        вызывает RuntimeError.
+
+        """
+        if not self.__done.wait(timeout):
+            raise RuntimeError("Inference result timed out")
+        if self.__error is not None:
+            raise RuntimeError(f"Inference worker failed: {self.__error}")
+        return self.__detections
+
+
+class InferenceProcessPool:
+    """
+    Класс пула процессов распознавания, каждый из которых держит свою копию модели.
+
+    Предобработка и разбор результатов на Python ограничены GIL, поэтому один процесс не может занять
+    все ядра. Пул распределяет кадры по `n_workers` процессам. Кадры передаются через общую память
+    (`multiprocessing.shared_memory`), разделенную на слоты по `max_frame_bytes` байт, без сериализации:
+    кадр один раз копируется в свободный слот, а процессу отправляются только имя памяти, смещение слота
+    и форма кадра. Слот освобождается, когда пришел результат; если свободных слотов нет, `submit` ждет,
+    ограничивая количество кадров в обработке. Если кадр больше слота, пул заменяет общую память на память
+    со слотами под этот кадр (`__grow`); прежняя память удаляется, когда освободятся все ее слоты.
+
+    Процессы запускаются методом "spawn", так как родительский процесс многопоточный. Конструктор ждет,
+    пока каждый процесс загрузит модель, и вызывает RuntimeError, если загрузка не удалась или процесс
+    завершился. Если процесс завершился во время работы (например, был убит), пул считается неисправным:
+    ожидающие результаты завершаются ошибкой, а `submit` вызывает RuntimeError.
+
+    :Параметры:
+    - `backend (str)`, `model_path (str)` — Механизм выполнения и путь к модели (см. `inference.create_backend`).
+    - `n_workers (int)` — Количество процессов.
+    - `intra_op_threads (int, необязательно)` — Количество потоков ONNX Runtime в каждом процессе (по умолчанию - 1).
+    - `max_frame_bytes (int, необязательно)` — Начальный размер слота в байтах: кадры больше него приводят
+      к замене общей памяти (по умолчанию - 1280x720x3).
+    - `n_slots (int, необязательно)` — Количество слотов общей памяти (по умолчанию - `2 * n_workers`).
+    - `timeout (float, необязательно)` — Наибольшее время ожидания свободного слота в `submit`, в секундах
+      (по умолчанию - без ограничения, пока процессы живы).
+    - `startup_timeout (float, необязательно)` — Наибольшее время загрузки модели процессами, в секундах
+      (по умолчанию - 120).
+
+    :Атрибуты:
+    - `error (Optional[str])` — Причина, по которой пул неисправен (процесс распознавания завершился), или None.
+    - `slot_bytes (int)` — Текущий размер слота общей памяти в байтах.
+    - `n_workers (int)`, `n_slots (int)`, `timeout (Optional[float])` — Параметры пула.
+
+    :Методы:
+    - `submit(self, frames, imgsz) -> PendingResult` — Метод для передачи пакета кадров на распознавание.
+    - `predict_batch(self, frames, imgsz) -> list` — Метод для распознавания пакета кадров с ожиданием результата.
+    - `close(self) -> None` — Метод для остановки процессов и освобождения общей памяти.
+
+    """
+    def __init__(self, backend: str, model_path: str, n_workers: int, intra_op_threads: Optional[int] = 1,
+                 max_frame_bytes: int = 1280 * 720 * 3, n_slots: Optional[int] = None,
+                 timeout: Optional[float] = None, startup_timeout: float = 120):
+        """
+        Конструктор класса.
+
+        Создает общую память, запускает процессы и ждет, пока они загрузят модель.
+
+        """
+        self.n_workers = max(1, n_workers)
+        self.slot_bytes = max_frame_bytes
+        self.n_slots = n_slots if n_slots is not None else 2 * self.n_workers
+        self.timeout = timeout
+        self.__error = None
+        self.__closing = threading.Event()
+        self.__shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.n_slots)
+        self.__retired = {}
+        self.__shm_lock = threading.Lock()
+        self.__free_slots = queue.SimpleQueue()
+        for number in range(self.n_slots):
+            self.__free_slots.put((self.__shm, number * self.slot_bytes))
+        self.__tickets = itertools.count()
+        self.__pending = {}
+        self.__pending_lock = threading.Lock()
+
+        context = multiprocessing.get_context("spawn")
+        self.__tasks = context.Queue()
+        self.__results = context.Queue()
+        self.__workers = [context.Process(target=_worker, name=f"inference_worker_{i}", daemon=True,
+                                          args=(backend, model_path, intra_op_threads, self.__tasks,
+                                                self.__results))
+                          for i in range(self.n_workers)]
+        for worker in self.__workers:
+            worker.start()
+        try:
+            self.__wait_ready(startup_timeout)
+        except BaseException:
+            self.__terminate()
+            raise
+        self.__collector = threading.Thread(target=self.__collect, name="inference_collector_thread", daemon=True)
+        self.__collector.start()
+
+    @property
+    def error(self) -> Optional[str]:
+        """
+        Причина, по которой пул неисправен, или None, если пул работает.
+
+        """
+        return self.__error
+
+    def __dead_worker(self) -> Optional[str]:
+        """
+        Приватный метод для проверки процессов.
+
+        Возвращает описание первого завершившегося процесса или None, если все процессы живы.
+
+        """
+        for worker in self.__workers:
+            if not worker.is_alive():
+                return f"Inference worker {worker.name} exited with code {worker.exitcode}"
+        return None
+
+    def __wait_ready(self, timeout: float) -> None:
+        """
+        Приватный метод для ожидания загрузки модели всеми процессами.
+
+        Вызывает RuntimeError, если процесс не смог загрузить модель, завершился или не успел за `timeout` секунд.
+
+        """
+        deadline = time.monotonic() + timeout
+        n_ready = 0
+        while n_ready < self.n_workers:
+            try:
+                _, _, error = self.__results.get(timeout=0.1)
+            except queue.Empty:
+                dead = self.__dead_worker()
+                if dead is not None:
+                    raise RuntimeError(dead)
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Inference workers did not load the model in time")
+                continue
+            if error is not None:
+                raise RuntimeError(f"Inference worker failed to load the model: {error}")
+            n_ready += 1
+
+    def __terminate(self) -> None:
+        """
+        Приватный метод для принудительной остановки процессов и освобождения общей памяти.
+
+        """
+        for worker in self.__workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join(timeout=1)
+        # Неотправленные задания больше не нужны; без этого выход интерпретатора ждал бы их отправки.
+        self.__tasks.cancel_join_thread()
+        for shm in [self.__shm] + [shm for shm, _ in self.__retired.values()]:
+            shm.close()
+            shm.unlink()
+        self.__retired = {}
+
+    def __fail(self, error: str) -> None:
+        """
+        Приватный метод для перевода пула в неисправное состояние.
+
+        Завершает ошибкой все ожидающие результаты; слоты, занятые завершившимся процессом, не освобождаются.
+
+        """
+        self.__error = error
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, {}
+        for result, index, _ in pending.values():
+            result._set(index, None, error)
+
+    def __collect(self) -> None:
+        """
+        Приватный метод потока, принимающего результаты от процессов.
+
+        Пока результатов нет, проверяет, что процессы живы (см. `__fail`). Останавливается по флагу, а не
+        по сообщению в очереди: процесс, убитый во время отправки результата, оставляет запись в очередь
+        заблокированной.
+
+        """
+        while not self.__closing.is_set():
+            try:
+                message = self.__results.get(timeout=0.5)
+            except queue.Empty:
+                if self.__error is None:
+                    dead = self.__dead_worker()
+                    if dead is not None:
+                        self.__fail(dead)
+                continue
+            ticket, detections, error = message
+            with self.__pending_lock:
+                entry = self.__pending.pop(ticket, None)
+            if entry is not None:
+                pending, index, slot = entry
+                self.__free_slots.put(slot)
+                pending._set(index, detections, error)
+
+    def submit(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> PendingResult:
+        """
+        Метод для передачи пакета кадров на распознавание.
+
+        :Параметры:
+        - `frames (Sequence[numpy.ndarray])` — Кадры в формате BGR (uint8).
+        - `imgsz (int, необязательно)` — Размер входа модели (см. `InferenceBackend.predict`).
+
+        Кадры пакета распределяются между процессами и распознаются параллельно. Возвращает объект
+        `PendingResult`, метод `get` которого вернет результаты в порядке кадров.
+
+        Вызывает RuntimeError, если пул неисправен (процесс распознавания завершился) или свободный слот
+        не освободился за `timeout` секунд.
+
+        """
+        pending = PendingResult(len(frames))
+        for index, frame in enumerate(frames):
+            if frame.nbytes > self.slot_bytes:
+                self.__grow(frame.nbytes)
+            slot = self.__acquire_slot()
+            shm, offset = slot
+            view = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            view[...] = frame
+            del view
+            ticket = next(self.__tickets)
+            with self.__pending_lock:
+                if self.__error is not None:  # пул стал неисправен, пока ожидался слот
+                    raise RuntimeError(self.__error)
+                self.__pending[ticket] = (pending, index, slot)
+            self.__tasks.put((ticket, shm.name, offset, frame.shape, imgsz))
+        return pending
+
+    def __grow(self, frame_bytes: int) -> None:
+        """
+        Приватный метод для замены общей памяти на память со слотами по `frame_bytes` байт.
+
+        Прежняя память остается, пока процессы распознают записанные в нее кадры (см. `__acquire_slot`).
+
+        """
+        with self.__shm_lock:
+            if frame_bytes <= self.slot_bytes:
+                return
+            logger.info("Growing inference slots from %s to %s bytes", self.slot_bytes, frame_bytes)
+            self.__retired[self.__shm.name] = [self.__shm, 0]
+            self.__shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.n_slots)
+            self.slot_bytes = frame_bytes
+            for number in range(self.n_slots):
+                self.__free_slots.put((self.__shm, number * frame_bytes))
+
+    def __acquire_slot(self) -> tuple:
+        """
+        Приватный метод для ожидания свободного слота общей памяти.
+
+        Ждет частями, чтобы не пропустить завершение процесса распознавания, пока слоты заняты. Освободившиеся
+        слоты замененной памяти не выдаются; когда освобождены все ее слоты, она удаляется. Возвращает кортеж
+        `(shm, смещение слота)`.
+
+        """
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        while True:
+            if self.__error is not None:
+                raise RuntimeError(self.__error)
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                raise RuntimeError("No free inference slot: workers are not returning results")
+            try:
+                slot = self.__free_slots.get(timeout=wait)
+            except queue.Empty:
+                continue
+            shm = slot[0]
+            with self.__shm_lock:
+                retired = self.__retired.get(shm.name)
+                if retired is None:
+                    return slot
+                retired[1] += 1
+                if retired[1] == self.n_slots:
+                    del self.__retired[shm.name]
+                    shm.close()
+                    shm.unlink()
+
+    def predict_batch(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> list:
+        """
+        Метод для распознавания пакета кадров с ожиданием результата.
+
+        """
+        return self.submit(frames, imgsz).get()
+
+    def close(self) -> None:
+        """
+        Метод для остановки процессов и освобождения общей памяти.
+
+        """
+        for _ in self.__workers:
+            self.__tasks.put(None)
+        for worker in self.__workers:
+            worker.join(timeout=5)
+        self.__closing.set()
+        self.__collector.join(timeout=1)
+        self.__terminate()
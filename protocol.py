@@ -0,0 +1,182 @@
+"""
+Протокол обмена сообщениями между сервисами.
+
+Каждое сообщение передается кадром: 4 байта длины (big-endian) и само сообщение.
+
+Версия 1 — сообщение является строкой в UTF-8 (команда или ответ). На соединении запросы обрабатываются
+по очереди, и ответы приходят в порядке запросов.
+
+Версия 2 — сообщение начинается с заголовка `HEADER`: байт `MAGIC` (0xFF, не встречается в UTF-8, поэтому
+сообщения версий различаются по первому байту), номер версии, тип сообщения (`MSG_*`), флаги (`FLAG_*`)
+и номер запроса (uint32), за которым следует тело. Ответ несет номер запроса, на который отвечает, поэтому
+по одному соединению можно отправить сколько угодно запросов, не дожидаясь ответов: сервис обрабатывает
+их одновременно и отвечает в порядке готовности. Версия соединения определяется по его первому сообщению;
+после сообщения версии 2 все сообщения соединения должны быть версии 2.
+
+Тело ответа типа `MSG_DETECTIONS` — результаты распознавания одной камеры в двоичном виде
+(см. `pack_detections`): заголовок `DETECTIONS_HEADER` (номер камеры, время захвата кадра, количество
+объектов) и для каждого объекта `DETECTION` (номер класса, уверенность и координаты рамки во float32).
+
+После ответа на команду `subscribe` сервис отправляет по тому же соединению события распознавания
+(см. `subscription`) сообщениями `MSG_EVENT` с номером запроса `subscribe`, пока подписка не будет отменена.
+Тело события — JSON или, если `subscribe` отправлен с флагом `FLAG_BINARY`, структура `EVENT` (см. `pack_event`).
+По соединению версии 1 события отправляются строками JSON.
+
+"""
+import struct
+from typing import NamedTuple, Optional, Sequence
+
+
+LENGTH = struct.Struct('>I')
+
+MAGIC = 0xFF
+VERSION = 2
+HEADER = struct.Struct('>BBBBI')
+
+MSG_REQUEST = 1
+MSG_RESPONSE = 2
+MSG_DETECTIONS = 3
+MSG_ERROR = 4
+MSG_EVENT = 5
+
+FLAG_BINARY = 0x01
+
+DETECTIONS_HEADER = struct.Struct('>HdH')
+DETECTION = struct.Struct('>Bf4f')
+EVENT = struct.Struct('>BHQdBf4f')
+EVENT_KINDS = ("detection", "command")
+
+
+class Message(NamedTuple):
+    """
+    Сообщение версии 2.
+
+    :Атрибуты:
+    - `msg_type (int)` — Тип сообщения (`MSG_REQUEST`, `MSG_RESPONSE`, `MSG_DETECTIONS`, `MSG_ERROR` или `MSG_EVENT`).
+    - `request_id (int)` — Номер запроса.
+    - `flags (int)` — Флаги (`FLAG_BINARY` — клиент принимает ответ в двоичном виде, если он возможен).
+    - `body (bytes)` — Тело сообщения.
+
+    """
+    msg_type: int
+    request_id: int
+    flags: int
+    body: bytes
+
+
+def pack_frame(payload: bytes) -> bytes:
+    """
+    Возвращает кадр: 4 байта длины и сообщение `payload`.
+
+    """
+    return LENGTH.pack(len(payload)) + payload
+
+
+def pop_frame(buffer: bytearray) -> Optional[bytes]:
+    """
+    Извлекает из буфера полное сообщение или возвращает None.
+
+    Если в буфере есть 4 байта длины и сообщение указанной длины, удаляет их из буфера и возвращает
+    сообщение. Следующие сообщения, если они уже получены, остаются в буфере.
+
+    """
+    if len(buffer) < LENGTH.size:
+        return None
+    msglen = LENGTH.unpack_from(buffer)[0]
+    if len(buffer) < LENGTH.size + msglen:
+        return None
+    payload = bytes(buffer[LENGTH.size:LENGTH.size + msglen])
+    del buffer[:LENGTH.size + msglen]
+    return payload
+
+
+def is_v2(payload: bytes) -> bool:
+    """
+    Проверяет, что сообщение относится к версии 2 протокола.
+
+    """
+    return len(payload) >= HEADER.size and payload[0] == MAGIC
+
+
+def pack_message(msg_type: int, request_id: int, body: bytes = b"", flags: int = 0) -> bytes:
+    """
+    Возвращает кадр с сообщением версии 2.
+
+    """
+    return pack_frame(HEADER.pack(MAGIC, VERSION, msg_type, flags, request_id) + body)
+
+
+def unpack_message(payload: bytes) -> Message:
+    """
+    Разбирает сообщение версии 2 (без 4 байтов длины).
+
+    Если сообщение не относится к версии 2, вызывает ValueError.
+
+    """
+    if not is_v2(payload):
+        raise ValueError("not a protocol v2 message")
+    magic, version, msg_type, flags, request_id = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"unsupported protocol version {version}")
+    return Message(msg_type, request_id, flags, payload[HEADER.size:])
+
+
+def pack_detections(stream: int, timestamp: float, detections: Sequence) -> bytes:
+    """
+    Упаковывает результаты распознавания кадра в тело сообщения `MSG_DETECTIONS`.
+
+    :Параметры:
+    - `stream (int)` — Номер камеры.
+    - `timestamp (float)` — Время захвата кадра (`time.time()`).
+    - `detections (Sequence)` — Объекты `(class_id, confidence, (x1, y1, x2, y2))`, например `inference.Detection`.
+
+    """
+    parts = [DETECTIONS_HEADER.pack(stream, timestamp, len(detections))]
+    for class_id, confidence, box in detections:
+        parts.append(DETECTION.pack(class_id, confidence, *box))
+    return b"".join(parts)
+
+
+def unpack_detections(body: bytes) -> tuple:
+    """
+    Разбирает тело сообщения `MSG_DETECTIONS`.
+
+    Возвращает кортеж `(stream, timestamp, detections)`, где `detections` — список кортежей
+    `(class_id, confidence, (x1, y1, x2, y2))`.
+
+    """
+    stream, timestamp, count = DETECTIONS_HEADER.unpack_from(body)
+    detections = []
+    for i in range(count):
+        class_id, confidence, x1, y1, x2, y2 = DETECTION.unpack_from(body, DETECTIONS_HEADER.size + i * DETECTION.size)
+        detections.append((class_id, confidence, (x1, y1, x2, y2)))
+    return stream, timestamp, detections
+
+
+def pack_event(kind: str, stream: int, seq: int, timestamp: float, class_id: int, confidence: float,
+               box: Sequence) -> bytes:
+    """
+    Упаковывает событие распознавания в тело сообщения `MSG_EVENT`.
+
+    :Параметры:
+    - `kind (str)` — Вид события из `EVENT_KINDS`.
+    - `stream (int)` — Номер камеры.
+    - `seq (int)` — Номер кадра камеры.
+    - `timestamp (float)` — Время захвата кадра (`time.time()`).
+    - `class_id (int)` — Номер класса.
+    - `confidence (float)` — Уверенность модели.
+    - `box (Sequence)` — Координаты рамки `(x1, y1, x2, y2)`.
+
+    """
+    return EVENT.pack(EVENT_KINDS.index(kind), stream, seq, timestamp, class_id, confidence, *box)
+
+
+def unpack_event(body: bytes) -> tuple:
+    """
+    Разбирает двоичное тело сообщения `MSG_EVENT`.
+
+    Возвращает кортеж `(kind, stream, seq, timestamp, class_id, confidence, (x1, y1, x2, y2))`.
+
+    """
+    kind, stream, seq, timestamp, class_id, confidence, x1, y1, x2, y2 = EVENT.unpack_from(body)
+    return EVENT_KINDS[kind], stream, seq, timestamp, class_id, confidence, (x1, y1, x2, y2)
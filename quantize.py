@@ -0,0 +1,207 @@
+"""
+Квантование модели распознавания жестов в INT8 (ONNX Runtime) и отчет о ее точности и скорости.
+
+Статическое квантование (`--mode static`, по умолчанию) заранее подбирает масштабы активаций по
+калибровочным кадрам: изображениям из каталога `images/`, их области интереса (`RegionOfInterest`) и
+зеркальным копиям. Кадры приводятся к входу модели той же предобработкой, что и в `OnnxRuntimeBackend`.
+Динамическое квантование (`--mode dynamic`) калибровки не требует: веса хранятся в INT8, а масштабы
+активаций вычисляются при каждом запуске.
+
+Голова детектора (узлы последнего блока `/model.N/` модели YOLOv8) по умолчанию остается в fp32: рамки и
+уверенность на ее выходе чувствительнее всего к ошибке квантования. `--quantize-head` квантует модель
+целиком.
+
+После квантования `bench_inference.py` в отдельных процессах сравнивает исходную и квантованную модели:
+задержку кадра (p50/p95/p99), пиковую память и совпадение лучшего объекта на изображениях каждого из
+7 классов. Отчет выводится в формате JSON.
+
+Квантованная модель по умолчанию сохраняется рядом с исходной (`best.onnx` → `best.int8.onnx`),
+где ее находит `ServiceGR(precision_="int8")`.
+
+Пример запуска:
+```
+python quantize.py --model best.onnx
+python quantize.py --model best.onnx --mode dynamic
+python quantize.py --model best.onnx --calibrate percentile --quantize-head --threads 1 --repeat 50
+```
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+
+import cv2
+
+import bench_inference
+from inference import OnnxRuntimeBackend, quantized_model_path
+from roi import RegionOfInterest
+
+try:
+    from onnxruntime.quantization import CalibrationDataReader
+except ImportError:  # onnxruntime без модуля квантования: ошибка будет выдана в quantize()
+    CalibrationDataReader = object
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Класс источника калибровочных кадров для статического квантования.
+
+    Для каждого изображения передает в модель весь кадр, его область интереса и зеркальную копию кадра,
+    приведенные к входу модели так же, как при распознавании.
+
+    :Параметры:
+    - `model_path (str)` — Путь к файлу исходной модели ONNX.
+    - `images (list)` — Пути к калибровочным изображениям.
+    - `roi (RegionOfInterest, необязательно)` — Область интереса кадра (по умолчанию - левая половина кадра).
+
+    :Методы:
+    - `get_next(self) -> Optional[dict]` — Метод для получения следующего входа модели.
+    - `rewind(self) -> None` — Метод для возврата к первому кадру.
+
+    """
+    def __init__(self, model_path: str, images: list, roi: RegionOfInterest = None):
+        """
+        Конструктор класса.
+
+        """
+        backend = OnnxRuntimeBackend(model_path)
+        roi = roi if roi is not None else RegionOfInterest()
+        self.__inputs = []
+        for path in images:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            region, _, _ = roi.crop(frame)
+            for variant in (frame, region, cv2.flip(frame, 1)):
+                blob, _, _ = backend._letterbox(variant, roi.input_size() if variant is region else None)
+                self.__inputs.append({backend.input_name: blob})
+        if not self.__inputs:
+            raise ValueError("No calibration images found")
+        self.__index = 0
+
+    def __len__(self) -> int:
+        return len(self.__inputs)
+
+    def get_next(self):
+        """
+        Метод для получения следующего входа модели.
+
+        Возвращает None, когда кадры закончились.
+
+        """
+        if self.__index >= len(self.__inputs):
+            return None
+        self.__index += 1
+        return self.__inputs[self.__index - 1]
+
+    def rewind(self) -> None:
+        """
+        Метод для возврата к первому кадру.
+
+        """
+        self.__index = 0
+
+
+def head_nodes(model_path: str) -> list:
+    """
+    Возвращает имена узлов головы детектора — последнего блока `/model.N/` модели YOLOv8.
+
+    Если имена узлов не содержат номеров блоков, возвращает пустой список.
+
+    """
+    import onnx
+
+    nodes = onnx.load(model_path, load_external_data=False).graph.node
+    blocks = {}
+    for node in nodes:
+        match = re.match(r"/model\.(\d+)/", node.name)
+        if match:
+            blocks.setdefault(int(match.group(1)), []).append(node.name)
+    return blocks[max(blocks)] if blocks else []
+
+
+def quantize(model_path: str, output_path: str, mode: str = "static", images: list = (),
+             calibrate: str = "minmax", quantize_head: bool = False, preprocess: bool = True) -> dict:
+    """
+    Квантует модель в INT8 и сохраняет ее в `output_path`.
+
+    Возвращает сведения о квантовании: режим, метод калибровки, количество калибровочных кадров, количество
+    узлов, оставленных в fp32, и время квантования.
+
+    """
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType, quantize_dynamic,
+                                          quantize_static)
+
+    start = time.perf_counter()
+    exclude = [] if quantize_head else head_nodes(model_path)
+    info = {"mode": mode, "excluded_nodes": len(exclude)}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = model_path
+        if preprocess:
+            # Вывод форм и упрощение графа перед квантованием, как рекомендует ONNX Runtime. Символьный вывод
+            # форм нужен только моделям-трансформерам и требует sympy, поэтому пропускается.
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+
+            source = os.path.join(tmp, "preprocessed.onnx")
+            quant_pre_process(model_path, source, skip_symbolic_shape=True)
+        if mode == "dynamic":
+            quantize_dynamic(source, output_path, weight_type=QuantType.QInt8, nodes_to_exclude=exclude)
+        elif mode == "static":
+            reader = ImageCalibrationReader(model_path, list(images))
+            method = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+                      "percentile": CalibrationMethod.Percentile}[calibrate]
+            quantize_static(source, output_path, reader, quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True,
+                            calibrate_method=method, nodes_to_exclude=exclude)
+            info.update(calibrate=calibrate, calibration_frames=len(reader))
+        else:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+    info["quantize_s"] = round(time.perf_counter() - start, 3)
+    return info
+
+
+def report(model_path: str, output_path: str, images_dir: str, repeat: int, threads) -> dict:
+    """
+    Сравнивает исходную и квантованную модели средствами `bench_inference.run`.
+
+    Возвращает размеры файлов, результаты замеров обеих моделей, совпадение результатов по изображениям
+    (классам) и ускорение по медиане задержки.
+
+    """
+    result = bench_inference.run(["onnxruntime", "onnxruntime"], model_path, images_dir, repeat, threads,
+                                 models=[model_path, output_path])
+    fp32, int8 = result["backends"].values()
+    result["size_mb"] = {"fp32": round(os.path.getsize(model_path) / 2 ** 20, 2),
+                         "int8": round(os.path.getsize(output_path) / 2 ** 20, 2)}
+    result["speedup_p50"] = round(fp32["latency_ms"]["p50"] / int8["latency_ms"]["p50"], 3)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="INT8 quantization of the gesture model with accuracy/latency report")
+    parser.add_argument("--model", default="best.onnx", help="путь к файлу исходной модели")
+    parser.add_argument("--output", default=None, help="путь к квантованной модели (по умолчанию - *.int8.onnx)")
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static", help="вид квантования")
+    parser.add_argument("--images", default="images", help="каталог с калибровочными изображениями *.jpg")
+    parser.add_argument("--calibrate", choices=["minmax", "entropy", "percentile"], default="minmax",
+                        help="метод калибровки статического квантования")
+    parser.add_argument("--quantize-head", action="store_true", help="квантовать и голову детектора")
+    parser.add_argument("--no-preprocess", action="store_true", help="не выполнять quant_pre_process")
+    parser.add_argument("--eval-images", default=None,
+                        help="каталог с изображениями для отчета (по умолчанию - --images)")
+    parser.add_argument("--repeat", type=int, default=20, help="количество проходов по изображениям в отчете")
+    parser.add_argument("--threads", type=int, default=None, help="intra_op_threads для onnxruntime")
+    parser.add_argument("--no-report", action="store_true", help="только квантовать, без сравнения моделей")
+    args = parser.parse_args()
+
+    output = args.output or quantized_model_path(args.model)
+    images = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    result = {"model": args.model, "output": output,
+              "quantization": quantize(args.model, output, args.mode, images, args.calibrate, args.quantize_head,
+                                       not args.no_preprocess)}
+    if not args.no_report:
+        result["report"] = report(args.model, output, args.eval_images or args.images, args.repeat, args.threads)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,122 @@
+import glob
+import os
+import time
+from typing import Optional
+
+import cv2
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class ReplayCapture:
+    """
+    Класс источника кадров из каталога изображений или видеофайла, заменяющий камеру.
+
+    Объект можно передать в `Camera` (и в `sources_` класса `ServiceGR`) вместо ссылки на камеру: он читается
+    так же, как `cv2.VideoCapture`. Изображения каталога выдаются в порядке имен файлов. В режиме реального
+    времени кадры выдаются с частотой `fps`, иначе — так быстро, как их успевают прочитать. Когда кадры
+    закончились (и `loop` равен False), `read` возвращает `(False, None)`, а `finished` становится True.
+
+    :Параметры:
+    - `source (str)` — Путь к каталогу изображений или к видеофайлу.
+    - `realtime (bool, необязательно)` — Выдавать кадры с частотой `fps` (по умолчанию - True).
+    - `fps (float, необязательно)` — Частота кадров; None — частота видеофайла или 30 для каталога
+      (по умолчанию - None).
+    - `loop (bool, необязательно)` — Начинать сначала после последнего кадра (по умолчанию - False).
+
+    :Атрибуты:
+    - `n_frames (int)` — Количество выданных кадров.
+    - `finished (bool)` — Флаг, указывающий, что кадры закончились.
+    - `started_at (Optional[float])` — Время выдачи первого кадра (`time.perf_counter()`) или None.
+
+    :Методы:
+    - `read(self, image) -> tuple` — Метод для получения очередного кадра.
+    - `release(self) -> None` — Метод для закрытия видеофайла.
+
+    Использование:
+    ```python
+    service = ServiceGR("127.0.0.1", 5505, preview_every_=None, sources_=[ReplayCapture("images", fps=10, loop=True)])
+    ```
+
+    """
+    def __init__(self, source: str, realtime: bool = True, fps: Optional[float] = None, loop: bool = False):
+        """
+        Конструктор класса.
+
+        """
+        self.source = source
+        self.realtime = realtime
+        self.loop = loop
+        self.n_frames = 0
+        self.finished = False
+        self.started_at = None
+        self.__capture = None
+        self.__paths = []
+        if os.path.isdir(source):
+            self.__paths = sorted(path for path in glob.glob(os.path.join(source, "*"))
+                                  if path.lower().endswith(IMAGE_EXTENSIONS))
+            if not self.__paths:
+                raise ValueError(f"No images found in {source}")
+            self.fps = fps or 30.0
+        else:
+            self.__capture = cv2.VideoCapture(source)
+            if not self.__capture.isOpened():
+                raise ValueError(f"Cannot open video file {source}")
+            self.fps = fps or self.__capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.__position = 0
+
+    def __next(self, image):
+        """
+        Приватный метод для чтения следующего кадра источника без учета `loop`.
+
+        """
+        if self.__capture is None:
+            if self.__position >= len(self.__paths):
+                return None
+            frame = cv2.imread(self.__paths[self.__position])
+            self.__position += 1
+            return frame
+        ready, frame = self.__capture.read(image)
+        return frame if ready else None
+
+    def read(self, image=None) -> tuple:
+        """
+        Метод для получения очередного кадра.
+
+        :Параметры:
+        - `image (numpy.ndarray, необязательно)` — Массив, в который можно декодировать кадр видеофайла
+          (см. `cv2.VideoCapture.read`).
+
+        Возвращает кортеж `(True, frame)` или `(False, None)`, если кадры закончились. В режиме реального
+        времени ждет момента выдачи кадра.
+
+        """
+        if self.finished:
+            return False, None
+        frame = self.__next(image)
+        if frame is None and self.loop and self.n_frames > 0:
+            self.__position = 0
+            if self.__capture is not None:
+                self.__capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            frame = self.__next(image)
+        if frame is None:
+            self.finished = True
+            return False, None
+        now = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+        if self.realtime:
+            delay = self.started_at + self.n_frames / self.fps - now
+            if delay > 0:
+                time.sleep(delay)
+        self.n_frames += 1
+        return True, frame
+
+    def release(self) -> None:
+        """
+        Метод для закрытия видеофайла.
+
+        """
+        if self.__capture is not None:
+            self.__capture.release()
@@ -0,0 +1,135 @@
+import math
+from typing import Optional, Sequence
+
+from inference import Detection
+
+
+class RegionOfInterest:
+    """
+    Класс области интереса кадра, передаваемой в модель распознавания.
+
+    Основная область `region` задается долями ширины и высоты кадра (по умолчанию — левая половина кадра
+    стереокамеры). В адаптивном режиме область сужается до последней найденной рамки руки с запасом
+    `margin` и следует за ней; если рука не найдена на `max_misses` кадрах подряд, снова используется
+    основная область. Размер входа модели подбирается по размеру вырезанной области: наименьшее кратное 32
+    значение не меньше ее большей стороны, в пределах от `min_input` до `max_input`, поэтому маленькая
+    область не растягивается, а большая уменьшается до `max_input`.
+
+    :Параметры:
+    - `region (Sequence[float], необязательно)` — Основная область `(x0, y0, x1, y1)` в долях кадра
+      (по умолчанию - `(0.0, 0.0, 0.5, 1.0)`).
+    - `adaptive (bool, необязательно)` — Следовать за найденной рукой (по умолчанию - False).
+    - `margin (float, необязательно)` — Запас вокруг рамки руки с каждой стороны в долях ее большей стороны
+      (по умолчанию - 0.5).
+    - `max_misses (int, необязательно)` — После скольких кадров подряд без руки вернуться к основной области
+      (по умолчанию - 5).
+    - `min_input (int, необязательно)` — Наименьший размер входа модели, при котором сохраняется точность
+      распознавания (по умолчанию - 320).
+    - `max_input (int, необязательно)` — Наибольший размер входа модели (по умолчанию - 640).
+
+    :Атрибуты:
+    - `box (Optional[tuple])` — Текущая область слежения `(x0, y0, x1, y1)` в пикселях кадра или None,
+      если используется основная область.
+    - `n_tracked (int)` — Количество кадров, обработанных в суженной области.
+
+    `crop` и `update` могут вызываться из разных потоков (стадии конвейера `ServiceGR`), поэтому все, что
+    `update` нужно знать о вырезанной области, — ее смещение и границы основной области — возвращается
+    из `crop` и передается в `update` вместе с результатами, а не берется из последнего вызова `crop`.
+
+    :Методы:
+    - `crop(self, frame) -> tuple` — Метод для вырезания области интереса из кадра (без копирования).
+    - `input_size(self) -> int` — Метод для получения размера входа модели для последней вырезанной области.
+    - `update(self, detections, offset, bounds) -> list` — Метод для перевода результатов в координаты кадра и смещения области.
+    - `reset(self) -> None` — Метод для возврата к основной области.
+
+    """
+    def __init__(self, region: Sequence[float] = (0.0, 0.0, 0.5, 1.0), adaptive: bool = False,
+                 margin: float = 0.5, max_misses: int = 5, min_input: int = 320, max_input: int = 640):
+        """
+        Конструктор класса.
+
+        """
+        self.region = tuple(region)
+        self.adaptive = adaptive
+        self.margin = margin
+        self.max_misses = max_misses
+        self.min_input = min_input
+        self.max_input = max_input
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Метод для возврата к основной области.
+
+        """
+        self.box = None
+        self.n_tracked = 0
+        self.__misses = 0
+        self.__bounds = (0, 0, 0, 0)
+        self.__offset = (0, 0)
+        self.__crop_size = (0, 0)
+
+    def crop(self, frame) -> tuple:
+        """
+        Метод для вырезания области интереса из кадра.
+
+        Возвращает срез кадра без копирования, его смещение `(x0, y0)` в кадре и границы основной области
+        `(x0, y0, x1, y1)` в пикселях этого кадра; координаты результатов распознавания на срезе переводятся
+        в координаты кадра методом `update`, которому передаются смещение и границы.
+
+        """
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = self.region
+        self.__bounds = (int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h))
+        x0, y0, x1, y1 = self.box if self.box is not None else self.__bounds
+        if self.box is not None:
+            self.n_tracked += 1
+        self.__offset = (x0, y0)
+        self.__crop_size = (x1 - x0, y1 - y0)
+        return frame[y0:y1, x0:x1], self.__offset, self.__bounds
+
+    def input_size(self) -> int:
+        """
+        Метод для получения размера входа модели для последней вырезанной области.
+
+        """
+        size = int(math.ceil(max(self.__crop_size) / 32)) * 32
+        return max(self.min_input, min(self.max_input, size))
+
+    def update(self, detections: Sequence[Detection], offset: Optional[tuple] = None,
+               bounds: Optional[tuple] = None) -> list:
+        """
+        Метод для перевода результатов распознавания в координаты кадра и смещения области.
+
+        :Параметры:
+        - `detections (Sequence[Detection])` — Результаты распознавания на последней вырезанной области,
+          упорядоченные по убыванию уверенности.
+        - `offset (tuple, необязательно)` — Смещение среза, возвращенное `crop` (по умолчанию - смещение последнего
+          среза). Нужно, если между `crop` и `update` могли быть вырезаны другие срезы.
+        - `bounds (tuple, необязательно)` — Границы основной области, возвращенные `crop` (по умолчанию - границы
+          последнего среза), в пределах которых перемещается область слежения.
+
+        Возвращает те же результаты с рамками в координатах всего кадра. В адаптивном режиме область
+        слежения перемещается к рамке с наибольшей уверенностью.
+
+        """
+        dx, dy = offset if offset is not None else self.__offset
+        mapped = [Detection(d.class_id, d.confidence, (d.box[0] + dx, d.box[1] + dy, d.box[2] + dx, d.box[3] + dy))
+                  for d in detections]
+        if not self.adaptive:
+            return mapped
+        if not mapped:
+            self.__misses += 1
+            if self.__misses >= self.max_misses:
+                self.box = None
+            return mapped
+
+        self.__misses = 0
+        x0, y0, x1, y1 = mapped[0].box
+        bx0, by0, bx1, by1 = bounds if bounds is not None else self.__bounds
+        half = max(x1 - x0, y1 - y0) * (0.5 + self.margin)
+        half = max(half, self.min_input / 2)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        box = (max(bx0, int(cx - half)), max(by0, int(cy - half)), min(bx1, int(cx + half)), min(by1, int(cy + half)))
+        self.box = box if box[0] < box[2] and box[1] < box[3] else None
+        return mapped
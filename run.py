@@ -1,6 +1,9 @@
+import logging
+
 from service_gr import ServiceGR
 
 if __name__ == '__main__' :
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     # Для запуска сервиса используем
     # IP-адрес - строковый литерал
     # Порт - int value
@@ -1,52 +1,132 @@
 from abc import ABC, abstractmethod
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import json
+import queue
+import selectors
 import threading
 import socket
-import struct
+import time
 from typing import Optional, Callable
 
+import protocol
+from client_pool import ClientPool
+from log import get_logger
+from metrics import MetricsRegistry
+from subscription import Subscriber, SubscriptionHub
+
+
+logger = get_logger(__name__)
+
 
 class Service(ABC):
     """
     Абстрактный базовый класс, представляющий собой общий сервис.
+
+    Сервис принимает сообщения обеих версий протокола (см. `protocol`). Запросы версии 1 одного соединения
+    обрабатываются по очереди. Запросы версии 2 одного соединения обрабатываются пулом потоков одновременно,
+    ответы отправляются по мере готовности с номером запроса, а ошибка обработки возвращается клиенту
+    сообщением `MSG_ERROR` без закрытия соединения.
+
+    По команде `subscribe` клиент подписывается на события, которые сервис публикует в `subscriptions`,
+    и получает их по тому же соединению (см. `Subscriber.parse`). Соединение версии 1 после подписки
+    используется только для событий и не учитывается в `n_conn`; по соединению версии 2 можно продолжать
+    отправлять запросы. События каждой подписки отправляет отдельный поток, поэтому медленный подписчик
+    теряет события из своей очереди, не задерживая ни сервис, ни других подписчиков.
     
     :Параметры:
     - `ip_ (str)` — IP-адрес для привязки сервиса. 
     - `port_ (int)` — Номер порта для привязки сервиса.
-    - `n_conn_ (int, необязательно)` — Максимальное количество разрешенных подключений (по умолчанию - 10).
+    - `n_conn_ (int, необязательно)` — Максимальное количество одновременно обрабатываемых запросов; соединения,
+      ожидающие следующего запроса, не учитываются (по умолчанию - 10).
+    - `n_workers_ (int, необязательно)` — Количество потоков, обрабатывающих запросы клиентов (по умолчанию - 4).
     
     :Атрибуты:
     - `ip (str)` — IP-адрес сервиса.
     - `port (int)` — Номер порта сервиса.
-    - `n_conn (int)` — Максимальное количество разрешенных подключений.
+    - `n_conn (int)` — Максимальное количество одновременно обрабатываемых запросов, как в `AsyncService`.
+      Новые подключения принимаются всегда, а полностью полученные запросы сверх `n_conn` ждут своей очереди
+      и передаются в пул потоков по мере освобождения мест. Соединения, ожидающие следующего запроса
+      (keep-alive), не учитываются, поэтому постоянные клиенты не мешают обслуживать других клиентов,
+      в том числе со служебными командами.
+    - `n_workers (int)` — Количество потоков, обрабатывающих запросы клиентов.
     - `timeout (int)` — Значение времени ожидания для операций сокета (по умолчанию - 3 секунды).
+      За это время клиент должен передать запрос целиком, иначе соединение закрывается.
+    - `keepalive_timeout (int)` — Время, в течение которого соединение остается открытым после ответа
+      в ожидании следующего запроса (по умолчанию - 60 секунд). Соединение версии 2 с действующей подпиской
+      по этому сроку не закрывается.
+    - `max_idle_conn (int)` — Максимальное количество простаивающих соединений — без начатого запроса,
+      запросов в обработке и действующих подписок (по умолчанию - 1024). Сверх этого числа при новом
+      подключении закрывается простаивающее соединение с ближайшим сроком ожидания, а если такого нет — само
+      новое подключение.
     - `need_job_break (bool)` — Флаг, указывающий, нужно ли сервису прекратить обработку задач.
     - `need_job_pause (bool)` — Флаг, указывающий, нужно ли сервису приостановить обработку задач.
+      Флаги `need_job_break` и `need_job_pause` изменяются под условной переменной, поэтому поток работы
+      может не опрашивать их, а ждать изменения методом `_wait_unpaused`.
     - `server_is_open (bool)` — Флаг, указывающий, открыт ли сервер.
     - `need_restart (bool)` — Флаг, указывающий, нужно ли сервису перезапуститься.
     - `server (socket.socket)` — Объект сокета для взаимодействия.
-    - `connected_clients (list)` — Список подключенных сокетов клиентов.
+    - `connected_clients (dict)` — Подключенные сокеты клиентов, ожидающие следующего запроса:
+      сокет → [буфер принятых байтов, крайний срок получения запроса].
+    - `client_pool (ClientPool)` — Пул постоянных исходящих соединений, через который `run_client` отправляет запросы.
+    - `subscriptions (SubscriptionHub)` — Подписки клиентов на события; наследники публикуют в него события
+      методом `subscriptions.publish`.
+    - `metrics (MetricsRegistry)` — Метрики сервиса: количество подключений и запросов, время обработки запросов,
+      время ответа других сервисов и метрики, добавленные наследниками. Возвращаются командой `stats`.
+    - `selector (selectors.BaseSelector)` — Селектор, в котором зарегистрированы сокет сервера, сокеты клиентов
+      и сокет пробуждения. Поток управления клиентами блокируется на нем, пока не появится работа.
     
     :Методы:
-    - `__init__(self, ip_, port_, n_conn_)` — Конструктор класса.
+    - `__init__(self, ip_, port_, n_conn_, n_workers_)` — Конструктор класса.
     - `__recvall(self, sock, n) -> bytearray` — Приватный метод для приема определенного количества байтов из сокета.
     - `__recv_msg(self, sock) -> bytearray` — Приватный метод для приема сообщения из сокета.
     - `__send_msg(self, sock, msg) -> None` — Приватный метод для отправки сообщения в сокет.
+    - `__wakeup(self) -> None` — Приватный метод для пробуждения потока управления клиентами.
+    - `__accept_client(self) -> None` — Приватный метод для приема нового подключения.
+    - `__read_request(self, client_socket) -> Optional[bytes]` — Приватный метод для неблокирующего чтения запроса.
+    - `__stream_events(self, client_socket, lock, subscriber, request_id) -> None` — Приватный метод, выполняемый
+      потоком подписки для отправки событий клиенту.
+    - `__start_stream(self, client_socket, lock, subscriber, request_id) -> None` — Приватный метод для запуска
+      потока подписки.
+    - `__handle_client(self, client_socket, request) -> Optional[bool]` — Приватный метод для обработки запроса клиента.
+    - `__serve_client(self, client_socket, request) -> None` — Приватный метод, выполняемый потоком обработки запросов.
+    - `__dispatch_client(self, pool, client_socket, request) -> None` — Приватный метод для передачи запроса в пул потоков.
+    - `__serve_message(self, client_socket, lock, payload, subscribers) -> None` — Приватный метод, выполняемый
+      потоком обработки запросов для запроса версии 2.
+    - `__dispatch_messages(self, pool, client_socket, payload) -> None` — Приватный метод для передачи запросов
+      версии 2 в пул потоков.
+    - `__release_clients(self, pool) -> None` — Приватный метод для возврата обслуженных соединений в селектор.
+    - `__close_client(self, client_socket) -> None` — Приватный метод для закрытия ожидающего соединения.
+    - `__evict_idle(self) -> bool` — Приватный метод для освобождения места под новое подключение
+      сверх `max_idle_conn`.
+    - `__is_busy(self, client_socket) -> bool` — Приватный метод для проверки, что у соединения версии 2 есть
+      запросы в обработке или действующие подписки.
+    - `__submit(self, pool, fn, *args) -> None` — Приватный метод для передачи запроса в пул потоков с учетом
+      `n_conn`.
     - `__manage_clients(self) -> None` — Приватный метод для управления подключенными клиентами.
     - `_do_job(self)` — Абстрактный метод для выполнения конкретной задачи сервиса. Должен быть переопределен.
     - `_request_handler(self, request)` — Абстрактный метод для обработки запросов от клиентов.
+    - `_process_request(self, request) -> str` — Метод для обработки служебных команд и запросов клиентов.
+    - `_process_message(self, request, flags) -> tuple` — Метод для обработки запроса версии 2.
+    - `_subscribe(self, request, binary) -> Subscriber` — Метод для создания подписки по команде `subscribe`.
+    - `stats(self) -> dict` — Метод для получения метрик сервиса.
+    - `_wait_unpaused(self, timeout) -> bool` — Метод для ожидания возобновления или остановки работы.
     - `_run_client(self, ip, port, request, response_handler) -> None` — Метод для запуска клиента и отправки запроса на сервер.
-    - `run_client(self, ip, port, request, response_handler) -> None` — Метод для запуска клиента в отдельном потоке.
+    - `_serve_once(self) -> None` — Метод для одного запуска сервера — от открытия сокета до остановки.
+    - `_release_resources(self) -> None` — Метод для освобождения ресурсов, общих для всех запусков сервиса.
+    - `run_client(self, ip, port, request, response_handler) -> None` — Метод для отправки запроса через пул соединений.
     - `start(self) -> None` — Метод для запуска сервера.
     - `stop(self) -> None` — Метод для остановки сервера.
     - `pause(self) -> None` — Метод для приостановки выполнения работы.
     - `unpause(self) -> None` — Метод для возобновления выполнения работы.
-    - `restart(self) -> None` — Метод для перезапуска сервера.
+    - `shutdown(self, timeout) -> bool` — Метод для окончательной остановки сервиса с ожиданием всех потоков.
+    - `restart(self) -> None` — Метод для повторного запуска остановленного сервера.
     :Примечание:
     Этот класс служит абстрактным базовым классом и должен быть унаследован для реализации конкретной функциональности сервиса.
     """
 
 
-    def __init__(self, ip_: str, port_: int, n_conn_=10):
+    def __init__(self, ip_: str, port_: int, n_conn_=10, n_workers_=4):
         """
         Конструктор класса.
 
@@ -54,13 +134,38 @@ class Service(ABC):
         self.ip = ip_
         self.port = port_
         self.n_conn = n_conn_
+        self.n_workers = n_workers_
         self.timeout = 3
+        self.keepalive_timeout = 60
+        self.max_idle_conn = 1024
         self.need_job_break = False
         self.need_job_pause = True
         self.server_is_open = True
         self.need_restart = False
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connected_clients = []
+        self.connected_clients = {}
+        self.selector = None
+        self.__wakeup_r, self.__wakeup_w = None, None
+        self.__clients_lock = threading.Lock()
+        self.__busy_clients = {}
+        self.__served_clients = queue.SimpleQueue()
+        self.__multiplexed = {}
+        self.__served_messages = queue.SimpleQueue()
+        self._closing_commands = []
+        self.metrics = MetricsRegistry()
+        self._connections_total = self.metrics.counter("connections_total", "Accepted client connections")
+        self._requests_total = self.metrics.counter("requests_total", "Handled client requests")
+        self._request_errors_total = self.metrics.counter("request_errors_total", "Failed client requests")
+        self._request_seconds = self.metrics.histogram("request_seconds", "Client request handling time")
+        self._idle_evicted_total = self.metrics.counter("idle_connections_evicted_total",
+                                                        "Idle connections closed above max_idle_conn")
+        self.client_pool = ClientPool(timeout=self.timeout, metrics=self.metrics)
+        self.subscriptions = SubscriptionHub(self.metrics)
+        self.__stream_threads = []
+        self.__job_state = threading.Condition()
+        self.__shutdown_requested = False
+        self.__stopped = threading.Event()
+        self.__stopped.set()
 
     def __recvall(self, sock, n: int) -> bytearray:
         """
@@ -101,7 +206,7 @@ class Service(ABC):
         raw_msglen = self.__recvall(sock, 4)
         if not raw_msglen:
             return bytearray()
-        msglen = struct.unpack('>I', raw_msglen)[0]
+        msglen = protocol.LENGTH.unpack(raw_msglen)[0]
         return self.__recvall(sock, msglen)
 
     def __send_msg(self, sock, msg: bytes) -> None:
@@ -115,61 +220,513 @@ class Service(ABC):
         Упаковывает длину сообщения в 4 байта, добавляет сообщение и отправляет все данные в сокет.
 
         """
-        msg = struct.pack('>I', len(msg)) + msg
-        sock.sendall(msg)
+        sock.sendall(protocol.pack_frame(msg))
 
 
-    def __manage_clients(self) -> None:
+    def __wakeup(self) -> None:
         """
-        Приватный метод для управления подключенными клиентами.
+        Приватный метод для пробуждения потока управления клиентами.
 
-        Внутренний цикл обрабатывает запросы от клиентов, основываясь на полученных данных.
-        Если нет подключенных клиентов и сервер закрыт, цикл завершается.
-        Если нет подключенных клиентов, происходит продолжение цикла.
-        Для каждого подключенного клиента извлекается запрос и обрабатывается в соответствии с логикой:\n
-        - `disable` — приостанавливает сервис и отправляет подтверждение клиенту. \n
-        - `enable` — возобновляет сервис и отправляет подтверждение клиенту. \n
-        - `close` или `restart` — останавливает сервис, добавляет соответствующую команду в список, отправляет подтверждение клиенту.
-        В остальных случаях вызывается метод обработки запроса `_request_handler` и результат отправляется клиенту.
-        
-        При возникновении исключения выводится сообщение об ошибке, и клиентский сокет закрывается.
+        Записывает байт в сокет пробуждения, чтобы `selector.select()` вернул управление
+        (например, после вызова `stop`).
+
+        """
+        if self.__wakeup_w is None:
+            return
+        try:
+            self.__wakeup_w.send(b"\0")
+        except OSError:
+            pass
+
+    def __accept_client(self) -> None:
+        """
+        Приватный метод для приема нового подключения.
+
+        Принимает подключение на сокете сервера и регистрирует неблокирующий сокет клиента в селекторе.
+        Запрос должен быть получен целиком не позднее чем через `timeout` секунд. Если простаивающих соединений
+        уже `max_idle_conn`, освобождает для нового подключения место (`__evict_idle`) или закрывает его.
+
+        """
+        try:
+            client_socket, client_address = self.server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        logger.debug("Accepted connection from %s:%s", client_address[0], client_address[1])
+        self._connections_total.inc()
+        if len(self.connected_clients) >= self.max_idle_conn and not self.__evict_idle():
+            self._idle_evicted_total.inc()
+            logger.warning("Too many idle connections, closing new connection from %s:%s",
+                           client_address[0], client_address[1])
+            client_socket.close()
+            return
+        client_socket.setblocking(False)
+        self.connected_clients[client_socket] = [bytearray(), time.monotonic() + self.timeout]
+        self.selector.register(client_socket, selectors.EVENT_READ)
+
+    def __read_request(self, client_socket) -> Optional[bytes]:
+        """
+        Приватный метод для неблокирующего чтения запроса.
+
+        :Параметры:
+        - `client_socket (socket)` — Сокет клиента, доступный для чтения.
+
+        Дописывает доступные байты в буфер клиента и пытается извлечь из него полный запрос (`protocol.pop_frame`).
+        Следующие запросы, отправленные клиентом без ожидания ответа, остаются в буфере.
+        С первого байта нового запроса у клиента есть не более `timeout` секунд, чтобы передать его целиком.
+        Если клиент закрыл соединение между запросами, выбрасывает `EOFError`,
+        если посреди запроса — `ConnectionError`.
+
+        """
+        client = self.connected_clients[client_socket]
+        packet = client_socket.recv(65536)
+        if not packet:
+            if client[0]:
+                raise ConnectionError("connection closed by client in the middle of a request")
+            raise EOFError
+        if not client[0]:
+            client[1] = min(client[1], time.monotonic() + self.timeout)
+        client[0].extend(packet)
+        return protocol.pop_frame(client[0])
+
+    def __stream_events(self, client_socket, lock: Optional[threading.Lock], subscriber: Subscriber,
+                        request_id: Optional[int] = None) -> None:
+        """
+        Приватный метод, выполняемый потоком подписки для отправки событий клиенту.
+
+        :Параметры:
+        - `client_socket (socket)` — Сокет клиента.
+        - `lock (threading.Lock, необязательно)` — Блокировка записи в сокет соединения версии 2.
+        - `subscriber (Subscriber)` — Подписка.
+        - `request_id (int, необязательно)` — Номер запроса `subscribe` для соединения версии 2; None — соединение
+          версии 1.
+
+        Отправляет события из очереди подписки, пока подписка не отменена, соединение не закрыто клиентом или
+        отправка не завершилась ошибкой (в том числе по таймауту `timeout` у клиента, который не принимает
+        данные). Затем отменяет подписку; соединение версии 1 закрывается, соединение версии 2 остается
+        у потока управления клиентами. Закрытие соединения версии 1 клиентом поток замечает через собственный
+        селектор: номер дескриптора сокета при этом не ограничен, в отличие от `select.select`.
+
+        """
+        readable = selectors.DefaultSelector()
+        try:
+            if request_id is None:
+                readable.register(client_socket, selectors.EVENT_READ)
+            while not subscriber.closed:
+                ok, event = subscriber.queue.get(timeout=1.0)
+                if not ok:
+                    if client_socket.fileno() == -1:
+                        break
+                    if request_id is None and readable.select(0):
+                        # Соединение версии 1 после подписки только отправляет события: входящие данные
+                        # отбрасываются, а пустое чтение означает, что клиент закрыл соединение.
+                        if not client_socket.recv(65536):
+                            break
+                    continue
+                body = event.encode(subscriber.binary)
+                if request_id is None:
+                    self.__send_msg(client_socket, body)
+                else:
+                    with lock:
+                        client_socket.sendall(protocol.pack_message(protocol.MSG_EVENT, request_id, body))
+                subscriber.n_sent += 1
+        except (OSError, ValueError) as e:
+            logger.info("Subscription %s closed: %s", subscriber.id, e)
+        finally:
+            readable.close()
+        self.subscriptions.unsubscribe(subscriber.id)
+        if request_id is None:
+            client_socket.close()
+
+    def __start_stream(self, client_socket, lock: Optional[threading.Lock], subscriber: Subscriber,
+                       request_id: Optional[int] = None) -> None:
+        """
+        Приватный метод для запуска потока подписки (`__stream_events`).
+
+        Запоминает поток, чтобы дождаться его завершения при остановке сервера.
+
+        """
+        thread = threading.Thread(target=self.__stream_events, args=(client_socket, lock, subscriber, request_id),
+                                  name=f"subscription_{subscriber.id}", daemon=True)
+        with self.__clients_lock:
+            self.__stream_threads = [t for t in self.__stream_threads if t.is_alive()]
+            self.__stream_threads.append(thread)
+        thread.start()
+
+    def __handle_client(self, client_socket, request: bytes) -> Optional[bool]:
+        """
+        Приватный метод для обработки запроса клиента.
+
+        :Параметры:
+        - `client_socket (socket)` — Сокет клиента.
+        - `request (bytes)` — Полученный запрос.
+
+        Декодирует запрос, обрабатывает его методом `_process_request` и отправляет результат клиенту.
+        Команда `subscribe` подтверждается ответом `subscribed <номер подписки>`, после чего соединение
+        передается потоку подписки (`__stream_events`).
+
+        При возникновении исключения в журнал записывается сообщение об ошибке. Время обработки запроса
+        добавляется в метрику `request_seconds`.
+
+        Возвращает True, если ответ отправлен и соединение можно использовать для следующего запроса,
+        и None, если соединение передано потоку подписки.
+
+        """
+        start = time.perf_counter()
+        try:
+            client_socket.settimeout(self.timeout)
+            request = request.decode("utf-8")
+            logger.debug("Received: %s", request)
+            if request.split(" ", 1)[0].lower() == "subscribe":
+                try:
+                    subscriber = self._subscribe(request)
+                except (ValueError, RuntimeError) as e:
+                    self.__send_msg(client_socket, f"subscribe error: {e}".encode("utf-8"))
+                    return True
+                self.__send_msg(client_socket, f"subscribed {subscriber.id}".encode("utf-8"))
+                self._requests_total.inc()
+                self.__start_stream(client_socket, None, subscriber)
+                return None
+            result = self._process_request(request)
+            self.__send_msg(client_socket, result.encode("utf-8"))
+            self._requests_total.inc()
+            self._request_seconds.observe(time.perf_counter() - start)
+            return True
+        except Exception as e:
+            self._request_errors_total.inc()
+            logger.warning("Server error when handling client: %s", e)
+            return False
+
+    def __serve_client(self, client_socket, request: bytes) -> None:
+        """
+        Приватный метод, выполняемый потоком обработки запросов.
+
+        :Параметры:
+        - `client_socket (socket)` — Сокет клиента.
+        - `request (bytes)` — Полученный запрос.
 
-        Если в списке команд закрытия есть "restart", устанавливается флаг `need_restart`.
+        Обрабатывает запрос (`__handle_client`), возвращает соединение потоку управления клиентами
+        и пробуждает его.
+
+        """
+        keep_alive = self.__handle_client(client_socket, request)
+        self.__served_clients.put((client_socket, keep_alive))
+        self.__wakeup()
+
+    def __dispatch_client(self, pool, client_socket, request: bytes) -> None:
+        """
+        Приватный метод для передачи запроса в пул потоков.
+
+        :Параметры:
+        - `pool (ThreadPoolExecutor)` — Пул потоков обработки запросов.
+        - `client_socket (socket)` — Сокет клиента.
+        - `request (bytes)` — Полученный запрос.
+
+        Снимает сокет с селектора на время обработки: запросы одного соединения обрабатываются
+        по очереди, поэтому ответы приходят клиенту в порядке запросов. Если в обработке уже `n_conn` запросов,
+        запрос ждет своей очереди (`__submit`).
+
+        """
+        buffer = self.connected_clients.pop(client_socket)[0]
+        self.selector.unregister(client_socket)
+        self.__busy_clients[client_socket] = buffer
+        self.__submit(pool, self.__serve_client, client_socket, request)
+
+    def __release_clients(self, pool) -> None:
+        """
+        Приватный метод для возврата обслуженных соединений в селектор.
+
+        :Параметры:
+        - `pool (ThreadPoolExecutor)` — Пул потоков обработки запросов.
+
+        Соединение закрывается, если при обработке произошла ошибка или сервер остановлен, и забывается,
+        если оно передано потоку подписки.
+        Иначе, если в буфере уже есть следующий запрос, он сразу передается в пул потоков, а если нет —
+        сокет снова регистрируется в селекторе и ждет запроса не дольше `keepalive_timeout` секунд.
+        Также учитывает обработанные запросы версии 2 и закрывает соединения, ответ на которые
+        не удалось отправить. Освободившиеся места обработки отдаются запросам из очереди `__submit`
+        в порядке поступления; запросы версии 2 уже закрытых соединений из очереди отбрасываются.
 
         """
-        service_closing_commands = []
         while True:
-            if len(self.connected_clients) == 0 and not self.server_is_open:
+            try:
+                client_socket, keep_alive = self.__served_clients.get_nowait()
+            except queue.Empty:
                 break
-            if len(self.connected_clients) == 0:
+            self.__n_serving -= 1
+            buffer = self.__busy_clients.pop(client_socket)
+            if keep_alive is None:
                 continue
-            while len(self.connected_clients) > 0:
-                client_socket = self.connected_clients[0]
-                self.connected_clients.pop(0)
-                try:
-                    request = self.__recv_msg(client_socket)
-                    request = request.decode("utf-8")
-                    print(f"Received: {request}")
-                    if request.lower() == "disable":
-                        self.pause()
-                        self.__send_msg(client_socket, "disable success".encode("utf-8"))
-                    elif request.lower() == "enable":
-                        self.unpause()
-                        self.__send_msg(client_socket, "enable success".encode("utf-8"))
-                    elif request.lower() == "close" or request.lower() == "restart":
-                        self.stop()
-                        service_closing_commands.append(request.lower())
-                        self.__send_msg(client_socket, ("beginning " + request.lower()).encode("utf-8"))
+            if not keep_alive or not self.server_is_open:
+                client_socket.close()
+                continue
+            client_socket.setblocking(False)
+            timeout = self.timeout if buffer else self.keepalive_timeout
+            self.connected_clients[client_socket] = [buffer, time.monotonic() + timeout]
+            self.selector.register(client_socket, selectors.EVENT_READ)
+            request = protocol.pop_frame(buffer)
+            if request is not None:
+                if protocol.is_v2(request):
+                    self.__dispatch_messages(pool, client_socket, request)
+                else:
+                    self.__dispatch_client(pool, client_socket, request)
+        while True:
+            try:
+                client_socket, ok = self.__served_messages.get_nowait()
+            except queue.Empty:
+                break
+            self.__n_serving -= 1
+            state = self.__multiplexed.get(client_socket)
+            if state is None:
+                continue
+            state[1] -= 1
+            if not ok:
+                self.__close_client(client_socket)
+        while self.__waiting and self.__n_serving < self.n_conn:
+            fn, args = self.__waiting.popleft()
+            if fn == self.__serve_message and args[0] not in self.__multiplexed:
+                continue
+            self.__n_serving += 1
+            pool.submit(fn, *args)
+
+    def __serve_message(self, client_socket, lock: threading.Lock, payload: bytes, subscribers: set) -> None:
+        """
+        Приватный метод, выполняемый потоком обработки запросов для запроса версии 2.
+
+        :Параметры:
+        - `client_socket (socket)` — Сокет клиента.
+        - `lock (threading.Lock)` — Блокировка записи в сокет клиента.
+        - `payload (bytes)` — Полученное сообщение.
+        - `subscribers (set)` — Подписки соединения: пока среди них есть действующие, соединение
+          не закрывается по `keepalive_timeout`, а при его закрытии они отменяются.
+
+        Обрабатывает запрос методом `_process_message` и отправляет ответ с номером запроса. После ответа
+        на команду `subscribe` запускает поток подписки, отправляющий события с номером этого запроса
+        (`__stream_events`). Ошибка обработки
+        отправляется клиенту сообщением `MSG_ERROR`. Если сообщение не удалось разобрать или ответ не удалось
+        отправить, соединение закрывается. Сообщает потоку управления клиентами о завершении и пробуждает его.
+
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            message = protocol.unpack_message(payload)
+            if message.msg_type != protocol.MSG_REQUEST:
+                raise ValueError(f"unexpected message type {message.msg_type}")
+            request = message.body.decode("utf-8")
+            logger.debug("Received #%s: %s", message.request_id, request)
+            subscriber = None
+            try:
+                if request.split(" ", 1)[0].lower() == "subscribe":
+                    subscriber = self._subscribe(request, bool(message.flags & protocol.FLAG_BINARY))
+                    subscribers.add(subscriber)
+                    msg_type, body = protocol.MSG_RESPONSE, f"subscribed {subscriber.id}".encode("utf-8")
+                else:
+                    msg_type, body = self._process_message(request, message.flags)
+            except Exception as e:
+                self._request_errors_total.inc()
+                logger.warning("Server error when handling request: %s", e)
+                msg_type, body = protocol.MSG_ERROR, str(e).encode("utf-8")
+            with lock:
+                client_socket.sendall(protocol.pack_message(msg_type, message.request_id, body))
+            if subscriber is not None:
+                self.__start_stream(client_socket, lock, subscriber, message.request_id)
+            self._requests_total.inc()
+            self._request_seconds.observe(time.perf_counter() - start)
+            ok = True
+        except Exception as e:
+            self._request_errors_total.inc()
+            logger.warning("Server error when handling client: %s", e)
+        self.__served_messages.put((client_socket, ok))
+        self.__wakeup()
+
+    def __dispatch_messages(self, pool, client_socket, payload: bytes) -> None:
+        """
+        Приватный метод для передачи запросов версии 2 в пул потоков.
+
+        :Параметры:
+        - `pool (ThreadPoolExecutor)` — Пул потоков обработки запросов.
+        - `client_socket (socket)` — Сокет клиента.
+        - `payload (bytes)` — Полученное сообщение.
+
+        В отличие от запросов версии 1, сокет остается в селекторе, поэтому следующие запросы соединения
+        принимаются и обрабатываются, не дожидаясь ответов на предыдущие. Передает в пул полученное сообщение
+        и все уже полученные следом за ним. Ответы отправляются потоками пула под блокировкой соединения,
+        поэтому сокет переводится в блокирующий режим с таймаутом `timeout`; читает из него по-прежнему
+        только поток управления клиентами после сигнала селектора.
+
+        """
+        state = self.__multiplexed.get(client_socket)
+        if state is None:
+            client_socket.settimeout(self.timeout)
+            state = self.__multiplexed[client_socket] = [threading.Lock(), 0, set()]
+        client = self.connected_clients[client_socket]
+        while payload is not None:
+            state[1] += 1
+            self.__submit(pool, self.__serve_message, client_socket, state[0], payload, state[2])
+            payload = protocol.pop_frame(client[0])
+        client[1] = time.monotonic() + (self.timeout if client[0] else self.keepalive_timeout)
+
+    def __close_client(self, client_socket) -> None:
+        """
+        Приватный метод для закрытия ожидающего соединения.
+
+        Отменяет подписки соединения версии 2.
+
+        """
+        self.selector.unregister(client_socket)
+        del self.connected_clients[client_socket]
+        state = self.__multiplexed.pop(client_socket, None)
+        if state is not None:
+            for subscriber in list(state[2]):
+                self.subscriptions.unsubscribe(subscriber.id)
+        client_socket.close()
+
+    def __evict_idle(self) -> bool:
+        """
+        Приватный метод для освобождения места под новое подключение сверх `max_idle_conn`.
+
+        Пока простаивающих соединений (без начатого запроса, запросов в обработке и действующих подписок,
+        см. `__is_busy`) не меньше `max_idle_conn`, закрывает те из них, у которых раньше всех истекает срок
+        ожидания. Возвращает False, если место нужно, но закрыть нечего.
+
+        """
+        idle = sorted((deadline, id(client_socket), client_socket)
+                      for client_socket, (buffer, deadline) in self.connected_clients.items()
+                      if not buffer and not self.__is_busy(client_socket))
+        n_evict = len(idle) - self.max_idle_conn + 1
+        for _, _, client_socket in idle[:max(0, n_evict)]:
+            self._idle_evicted_total.inc()
+            logger.debug("Too many idle connections, closing the oldest one")
+            self.__close_client(client_socket)
+        return n_evict <= len(idle)
+
+    def __is_busy(self, client_socket) -> bool:
+        """
+        Приватный метод для проверки, что у соединения версии 2 есть запросы в обработке или действующие подписки.
+
+        Попутно забывает отмененные подписки соединения.
+
+        """
+        state = self.__multiplexed.get(client_socket)
+        if state is None:
+            return False
+        subscribers = state[2]
+        subscribers.difference_update([subscriber for subscriber in list(subscribers) if subscriber.closed])
+        return state[1] > 0 or bool(subscribers)
+
+    def __submit(self, pool, fn, *args) -> None:
+        """
+        Приватный метод для передачи запроса в пул потоков с учетом `n_conn`.
+
+        :Параметры:
+        - `pool (ThreadPoolExecutor)` — Пул потоков обработки запросов.
+        - `fn (Callable)` — Метод обработки (`__serve_client` или `__serve_message`).
+        - `args` — Аргументы метода обработки.
+
+        Если в обработке уже `n_conn` запросов, запрос ставится в очередь и передается в пул, когда место
+        освободится (`__release_clients`).
+
+        """
+        if self.__n_serving < self.n_conn:
+            self.__n_serving += 1
+            pool.submit(fn, *args)
+        else:
+            self.__waiting.append((fn, args))
+
+    def __manage_clients(self) -> None:
+        """
+        Приватный метод для управления подключенными клиентами.
+
+        Поток блокируется на `selector.select()` и просыпается только при появлении работы:\n
+        - сокет сервера доступен для чтения — принимается новое подключение (`__accept_client`); \n
+        - сокет клиента доступен для чтения — дочитывается его запрос (`__read_request`); полностью
+          полученный запрос передается в пул из `n_workers` потоков (`__dispatch_client`), поэтому медленный
+          клиент не задерживает остальных; \n
+        - сокет пробуждения доступен для чтения — обслуженные соединения возвращаются в селектор
+          (`__release_clients`), проверяется, не остановлен ли сервер и не освободилось ли место
+          для новых подключений; \n
+        - истек крайний срок получения запроса — соединение с клиентом закрывается. Если клиент не начал
+          передавать запрос, это обычное закрытие простаивающего соединения, а не ошибка; соединение версии 2
+          с запросами в обработке или действующими подписками (`__is_busy`) не закрывается, а срок продлевается.
+
+        После ответа соединение не закрывается: клиент может отправлять по нему следующие запросы,
+        в том числе не дожидаясь ответов на предыдущие. Соединение, первый запрос которого относится
+        к версии 2 протокола, остается в селекторе и во время обработки запросов (`__dispatch_messages`).
+
+        Новые подключения принимаются, пока сервер открыт, независимо от нагрузки: одновременно обрабатывается
+        не более `n_conn` запросов, остальные полученные запросы ждут своей очереди (`__submit`), поэтому
+        клиенты не ждут в очереди `listen` повторной отправки SYN.
+
+        После остановки сервера новые подключения не принимаются, соединения без начатого запроса
+        закрываются, начатые запросы дочитываются до истечения крайнего срока, а поток дожидается
+        завершения всех обрабатываемых запросов.
+
+        """
+        self.__busy_clients = {}
+        self.__served_clients = queue.SimpleQueue()
+        self.__multiplexed = {}
+        self.__served_messages = queue.SimpleQueue()
+        self.__n_serving = 0
+        self.__waiting = collections.deque()
+        listening = False
+        with ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix="service_worker") as pool:
+            while True:
+                self.__release_clients(pool)
+                if self.server_is_open != listening:
+                    if self.server_is_open:
+                        self.selector.register(self.server, selectors.EVENT_READ)
+                    else:
+                        self.selector.unregister(self.server)
+                    listening = self.server_is_open
+                if not self.server_is_open:
+                    for client_socket, (buffer, _) in list(self.connected_clients.items()):
+                        in_flight = self.__multiplexed.get(client_socket, (None, 0))[1]
+                        if not buffer and in_flight == 0:
+                            self.__close_client(client_socket)
+                    if len(self.connected_clients) == 0 and len(self.__busy_clients) == 0:
+                        break
+
+                timeout = None
+                if len(self.connected_clients) > 0:
+                    nearest_deadline = min(deadline for _, deadline in self.connected_clients.values())
+                    timeout = max(0.0, nearest_deadline - time.monotonic())
+                for key, _ in self.selector.select(timeout):
+                    if key.fileobj is self.__wakeup_r:
+                        self.__wakeup_r.recv(1024)
+                    elif key.fileobj is self.server:
+                        self.__accept_client()
+                    elif key.fileobj in self.connected_clients:
+                        client_socket = key.fileobj
+                        try:
+                            request = self.__read_request(client_socket)
+                        except EOFError:
+                            self.__close_client(client_socket)
+                            continue
+                        except OSError as e:
+                            self._request_errors_total.inc()
+                            logger.warning("Server error when handling client: %s", e)
+                            self.__close_client(client_socket)
+                            continue
+                        if request is None:
+                            continue
+                        if client_socket in self.__multiplexed or protocol.is_v2(request):
+                            self.__dispatch_messages(pool, client_socket, request)
+                        else:
+                            self.__dispatch_client(pool, client_socket, request)
+
+                now = time.monotonic()
+                for client_socket, (buffer, deadline) in list(self.connected_clients.items()):
+                    if deadline > now:
+                        continue
+                    if buffer:
+                        self._request_errors_total.inc()
+                        logger.warning("Server error when handling client: request read deadline exceeded")
+                    elif self.__is_busy(client_socket):
+                        self.connected_clients[client_socket][1] = now + self.keepalive_timeout
+                        continue
                     else:
-                        result = self._request_handler(request)
-                        self.__send_msg(client_socket, result.encode("utf-8"))
-                except Exception as e:
-                    print(f"Server error when handling client: {e}")
-                finally:
-                    client_socket.close()
-        if len(service_closing_commands) > 0:
-            if service_closing_commands[0] == "restart":
-                self.need_restart = True
+                        logger.debug("Closing idle connection")
+                    self.__close_client(client_socket)
 
 
     # protected:
@@ -196,6 +753,100 @@ class Service(ABC):
         """
         pass
 
+    def _process_request(self, request: str) -> str:
+        """
+        Метод для обработки служебных команд и запросов клиентов.
+
+        :Параметры:
+        - `request (str)` — Декодированный запрос клиента.
+
+        Обрабатывает запрос в соответствии с логикой:\n
+        - `disable` — приостанавливает сервис. \n
+        - `enable` — возобновляет сервис. \n
+        - `close` или `restart` — останавливает сервис. Если первой из команд закрытия была "restart",
+          устанавливается флаг `need_restart`. \n
+        - `stats` — возвращает метрики сервиса (`stats`) в формате JSON. \n
+        - `stats prometheus` — возвращает метрики сервиса в текстовом формате Prometheus. \n
+        - `unsubscribe <номер>` — отменяет подписку на события. \n
+        В остальных случаях вызывается метод обработки запроса `_request_handler`.
+
+        Возвращает ответ, который нужно отправить клиенту.
+
+        """
+        command = request.lower()
+        if command == "disable":
+            self.pause()
+            return "disable success"
+        elif command == "enable":
+            self.unpause()
+            return "enable success"
+        elif command == "close" or command == "restart":
+            with self.__clients_lock:
+                self._closing_commands.append(command)
+                if self._closing_commands[0] == "restart" and not self.__shutdown_requested:
+                    self.need_restart = True
+            self.stop()
+            return "beginning " + command
+        elif command == "stats":
+            return json.dumps(self.stats())
+        elif command == "stats prometheus":
+            return self.metrics.prometheus()
+        elif command.startswith("unsubscribe "):
+            subscription_id = command.split(" ", 1)[1].strip()
+            if subscription_id.isdigit() and self.subscriptions.unsubscribe(int(subscription_id)):
+                return "unsubscribe success"
+            return f"unsubscribe error: no subscription {subscription_id}"
+        else:
+            return self._request_handler(request)
+
+    def _process_message(self, request: str, flags: int) -> tuple:
+        """
+        Метод для обработки запроса версии 2.
+
+        :Параметры:
+        - `request (str)` — Декодированный запрос клиента.
+        - `flags (int)` — Флаги запроса (см. `protocol`).
+
+        Возвращает кортеж `(msg_type, body)` — тип и тело ответа. По умолчанию запрос обрабатывается
+        методом `_process_request`, и ответ отправляется строкой (`MSG_RESPONSE`). Наследники могут
+        отвечать на запросы с флагом `FLAG_BINARY` двоичными сообщениями, например `MSG_DETECTIONS`.
+
+        """
+        return protocol.MSG_RESPONSE, self._process_request(request).encode("utf-8")
+
+    def _subscribe(self, request: str, binary: bool = False) -> Subscriber:
+        """
+        Метод для создания подписки по команде `subscribe`.
+
+        :Параметры:
+        - `request (str)` — Команда `subscribe` (см. `Subscriber.parse`).
+        - `binary (bool, необязательно)` — Отправлять события в двоичном виде (по умолчанию - False).
+
+        Если сервер остановлен, вызывает RuntimeError, если команда записана неверно — ValueError.
+
+        """
+        if not self.server_is_open:
+            raise RuntimeError("server is shutting down")
+        subscriber = self.subscriptions.subscribe(Subscriber.parse(request, binary))
+        logger.info("Subscription %s: %s", subscriber.id, request)
+        return subscriber
+
+    def _wait_unpaused(self, timeout=None) -> bool:
+        """
+        Метод для ожидания возобновления или остановки работы.
+
+        :Параметры:
+        - `timeout (float, необязательно)` — Максимальное время ожидания в секундах (по умолчанию - без ограничения).
+
+        Блокирует поток работы, пока сервис приостановлен, не занимая процессор. Возвращает True, если работу
+        нужно продолжать, и False, если сервис остановлен или время ожидания истекло, а работа все еще
+        приостановлена.
+
+        """
+        with self.__job_state:
+            self.__job_state.wait_for(lambda: self.need_job_pause or self.need_job_break, timeout)
+            return self.need_job_pause and not self.need_job_break
+
     def _run_client(self, ip: str, port: int, request: str,
                     response_handler: Optional[Callable[[str], None]] = None) -> None:
         
@@ -210,27 +861,90 @@ class Service(ABC):
         Если предоставлен обработчик ответа, вызывает его с полученным ответом.
         """
 
-        global client
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             client.connect((ip, port))
             self.__send_msg(client, request.encode("utf-8"))
             response = self.__recv_msg(client)
             response = response.decode("utf-8")
-            print(f"Received: {response}")
+            logger.debug("Received: %s", response)
             if response_handler is not None:
                 response_handler(response)
         except Exception as e:
-            print(f"Client error when handling client: {e}")
+            logger.warning("Client error when handling client: %s", e)
         finally:
             client.close()
-            print("Connection to server closed")
+            logger.debug("Connection to server closed")
+
+
+    def _serve_once(self) -> None:
+        """
+        Метод для одного запуска сервера — от открытия сокета до остановки.
+
+        Создает неблокирующий сокет сервера, селектор и сокет пробуждения, затем запускает потоки для выполнения
+        работы сервиса и управления клиентами (прием новых подключений и обработка запросов). Возвращает
+        управление, когда завершатся поток управления клиентами, поток работы и потоки подписок.
+
+        """
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.setblocking(False)
+        self.server.bind((self.ip, self.port))
+        self.server.listen(max(self.n_conn, socket.SOMAXCONN))
+        logger.info("Listening on %s:%s", self.ip, self.port)
+
+        self.selector = selectors.DefaultSelector()
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.selector.register(self.__wakeup_r, selectors.EVENT_READ)
+
+        job_thread = threading.Thread(target=self._do_job, args=())
+        job_thread.start()
+
+        client_managing_thread = threading.Thread(target=self.__manage_clients, args=())
+        client_managing_thread.start()
+        client_managing_thread.join()
+
+        self.selector.close()
+        self.__wakeup_r.close()
+        self.__wakeup_w.close()
+        self.__wakeup_r, self.__wakeup_w = None, None
+        self.server.close()
+        job_thread.join()
+        with self.__clients_lock:
+            stream_threads, self.__stream_threads = self.__stream_threads, []
+        for thread in stream_threads:
+            thread.join(timeout=self.timeout)
+        self.client_pool.close()
+
+    def _release_resources(self) -> None:
+        """
+        Метод для освобождения ресурсов, общих для всех запусков сервиса.
+
+        Вызывается один раз, когда `start` завершается без перезапуска (команда `close`, `shutdown` или ошибка
+        работы). Наследники освобождают здесь ресурсы, которые не нужно создавать заново при каждом запуске
+        (например, камеры и загруженную модель). По умолчанию ничего не делает.
+
+        """
+        pass
 
 
     # public:
+    def stats(self) -> dict:
+        """
+        Метод для получения метрик сервиса.
+
+        Возвращает словарь значений метрик `metrics` (см. `MetricsRegistry.as_dict`) и состояние подписок
+        (`subscriptions`). Наследники могут дополнять его своими данными.
+
+        """
+        stats = self.metrics.as_dict()
+        stats["subscriptions"] = self.subscriptions.stats()
+        return stats
+
     def run_client(self, ip: str, port: int, request: str, response_handler: Optional[Callable] = None) -> None:
         """
-        Метод для запуска клиента в отдельном потоке.
+        Метод для отправки запроса через пул соединений.
 
         :Параметры:
         - `ip (str)` — IP-адрес сервера.
@@ -238,52 +952,60 @@ class Service(ABC):
         - `request (str)` — Запрос для отправки на сервер.
         - `response_handler (Callable, необязательно)` — Обработчик ответа от сервера.
 
-        Создает новый поток для выполнения `_run_client` с указанными параметрами.
+        Ставит запрос в очередь `client_pool`: запрос отправляется по постоянному соединению с сервером,
+        ответ передается обработчику в потоке приема ответов. Для одиночного запроса по отдельному
+        соединению используется `_run_client`.
 
         """
-        
-        client_thread = threading.Thread(target=self._run_client, args=(ip, port, request, response_handler,))
-        client_thread.start()
+        self.client_pool.submit(ip, port, request, response_handler)
 
     def start(self) -> None:
         """
         Метод для запуска сервера.
 
-        Инициализирует все необходимые параметры, создает сокет сервера и запускает потоки
-        для выполнения работы сервиса, управления клиентами и прослушивания новых подключений.
+        Инициализирует все необходимые параметры и запускает сервер (`_serve_once`). Если была получена
+        команда `restart`, запускает его снова в том же потоке: ресурсы сервиса (см. `_release_resources`)
+        при этом не освобождаются, поэтому перезапуск занимает миллисекунды. Возвращает управление после
+        остановки без перезапуска, когда все потоки сервиса завершены, а ресурсы освобождены.
 
         """
-        self.need_job_break = False
-        self.need_job_pause = True
-        self.server_is_open = True
-        self.need_restart = False
-        self.connected_clients = []
-
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.settimeout(self.timeout)
-        self.server.bind((self.ip, self.port))
-        self.server.listen(self.n_conn)
-        print(f"Listening on {self.ip}:{self.port}")
-
-        job_thread = threading.Thread(target=self._do_job, args=())
-        job_thread.start()
+        self.__shutdown_requested = False
+        self.__stopped.clear()
+        try:
+            while True:
+                self.need_job_break = False
+                self.need_job_pause = True
+                self.server_is_open = True
+                self.need_restart = False
+                self.connected_clients = {}
+                self._closing_commands = []
+                self._serve_once()
+                if not self.need_restart or self.__shutdown_requested:
+                    break
+                logger.info("Restarting")
+        finally:
+            try:
+                self._release_resources()
+            finally:
+                self.__stopped.set()
 
-        client_managing_thread = threading.Thread(target=self.__manage_clients, args=())
-        client_managing_thread.start()
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """
+        Метод для окончательной остановки сервиса.
 
-        while self.server_is_open:
-            try:
-                client_socket, client_address = self.server.accept()
-                print(f"Accepted connection from {client_address[0]}:{client_address[1]}")
-                self.connected_clients.append(client_socket)
-            except socket.timeout:
-                pass
+        :Параметры:
+        - `timeout (float, необязательно)` — Максимальное время ожидания в секундах (по умолчанию - без ограничения).
 
-        client_managing_thread.join()
-        self.server.close()
+        Отменяет перезапуск, если он был запрошен, останавливает сервер (`stop`) и ждет, пока `start`
+        дождется завершения всех потоков сервиса и освободит его ресурсы. Может вызываться из любого потока,
+        кроме потоков самого сервиса. Возвращает False, если сервис не остановился за `timeout` секунд.
 
-        if self.need_restart:
-            self.restart()
+        """
+        with self.__clients_lock:
+            self.__shutdown_requested = True
+            self.need_restart = False
+        self.stop()
+        return self.__stopped.wait(timeout)
 
 
     def stop(self) -> None:
@@ -291,11 +1013,16 @@ class Service(ABC):
         Метод для остановки сервера.
 
         Устанавливает флаги `server_is_open` и `need_job_break` в False для завершения циклов,
-        управляющих сервером и выполнением работы.
+        управляющих сервером и выполнением работы, отменяет подписки и пробуждает поток управления
+        клиентами и ожидающий поток работы.
 
         """
         self.server_is_open = False
-        self.need_job_break = True
+        self.subscriptions.close()
+        with self.__job_state:
+            self.need_job_break = True
+            self.__job_state.notify_all()
+        self.__wakeup()
 
     def pause(self) -> None:
         """
@@ -304,27 +1031,26 @@ class Service(ABC):
         Устанавливает флаг `need_job_pause` в False.
 
         """
-        self.need_job_pause = False
+        with self.__job_state:
+            self.need_job_pause = False
+            self.__job_state.notify_all()
 
     def unpause(self) -> None:
         """
         Метод для возобновления выполнения работы.
 
-        Устанавливает флаг `need_job_pause` в True.
+        Устанавливает флаг `need_job_pause` в True и пробуждает ожидающий поток работы.
 
         """
-        self.need_job_pause = True
+        with self.__job_state:
+            self.need_job_pause = True
+            self.__job_state.notify_all()
 
     def restart(self) -> None:
         """
-        Метод для перезапуска сервера.
+        Метод для повторного запуска остановленного сервера.
 
-        Инициализирует параметры для нового запуска, затем вызывает метод `start` для запуска сервера.
+        Вызывает метод `start`. Работающий сервер перезапускается командой `restart`.
 
         """
-        self.need_job_break = False
-        self.need_job_pause = True
-        self.server_is_open = True
-        self.need_restart = False
-        self.connected_clients = []
         self.start()
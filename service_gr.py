@@ -1,165 +1,706 @@
 import os, sys
+import copy
+import json
+import time
+from functools import partial
+from typing import Optional, Sequence
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(f"{dir_path}/..")
 
+import protocol
 from service import Service
-from ultralytics import YOLO
-import cv2
-from cam import Camera
+from inference import create_backend, draw_detections, quantized_model_path
+from batcher import FrameBatcher
+from gesture_filter import GestureFilter
+from motion import MotionGate
+from pipeline import Pipeline
+from process_pool import InferenceProcessPool, PendingResult
+from preview import Preview
+from roi import RegionOfInterest
+from subscription import Event
+from log import get_logger
+
+
+logger = get_logger(__name__)
 
 class ServiceGR(Service):
     """
     Этот класс расширяет базовый класс Service и реализует конкретную логику обработки задач,
     связанных с распознаванием жестов с использованием видеопотока с камеры.
 
+    :Параметры:
+    - `ip_ (str)`, `port_ (int)`, `n_conn_ (int)`, `n_workers_ (int)` — Параметры базового класса Service.
+    - `gesture_filter_ (GestureFilter, необязательно)` — Фильтр, сглаживающий результаты распознавания
+      перед отправкой команд; для каждой камеры используется своя копия (по умолчанию - `GestureFilter()`
+      с параметрами по умолчанию).
+    - `idle_release_ (float, необязательно)` — Через сколько секунд паузы освобождать камеру и модель;
+      None — не освобождать (по умолчанию - None).
+    - `preview_every_ (int, необязательно)` — Показывать в окне каждый N-й обработанный кадр; None — работа
+      без окна и без отрисовки результатов (headless), например на сервере или в контейнере (по умолчанию - 1).
+    - `backend_ (str, необязательно)` — Механизм выполнения модели: "ultralytics" или "onnxruntime"
+      (без ultralytics и torch, см. `inference.py`) (по умолчанию - "ultralytics").
+    - `model_path_ (str, необязательно)` — Путь к файлу модели (по умолчанию - "best.onnx").
+    - `intra_op_threads_ (int, необязательно)` — Количество потоков ONNX Runtime для одной операции;
+      None — выбирается ONNX Runtime (по умолчанию - None).
+    - `inference_workers_ (int, необязательно)` — Количество процессов распознавания, каждый со своей копией
+      модели (`InferenceProcessPool`); 0 — распознавать в процессе сервиса (по умолчанию - 0).
+    - `sources_ (Sequence, необязательно)` — Ссылки на RTSP-потоки или номера устройств камер, пути к видеофайлам
+      и каталогам изображений или объекты `ReplayCapture` (см. `Camera`); кадры всех камер распознаются одной
+      моделью пакетами (по умолчанию - `[0]`).
+    - `max_batch_ (int, необязательно)` — Максимальное количество кадров в пакете (по умолчанию - 4).
+    - `max_wait_ (float, необязательно)` — Сколько секунд можно ждать кадров других камер ради заполнения
+      пакета (по умолчанию - 0.01).
+    - `roi_ (RegionOfInterest, необязательно)` — Область кадра, передаваемая в модель, и выбор размера входа модели;
+      для каждой камеры используется своя копия (по умолчанию - `RegionOfInterest()`: левая половина кадра).
+    - `motion_gate_ (MotionGate, необязательно)` — Проверка движения, по которой распознавание пропускается
+      на неподвижной сцене; для каждой камеры используется своя копия. None — распознавать каждый кадр
+      (по умолчанию - None).
+    - `dispatch_commands_ (bool, необязательно)` — Отправлять команды внешним серверам (`__dispatch`); False —
+      команды только публикуются подписчикам (по умолчанию - True).
+    - `precision_ (str, необязательно)` — Точность модели: "fp32" — `model_path_`, "int8" — ее квантованная версия
+      `best.int8.onnx` рядом с ней, созданная `quantize.py` (по умолчанию - "fp32").
+    - `shared_frames_ (str, необязательно)` — Префикс имен общей памяти, в которую публикуются кадры камер
+      и результаты их распознавания для других процессов узла: камера с номером `i` — в `{shared_frames_}_{i}`
+      (см. `shared_frames.SharedFrameReader`); None — не публиковать (по умолчанию - None).
+    - `worker_restarts_ (int, необязательно)` — Сколько раз подряд перезапускать процессы распознавания, если
+      один из них завершился (см. `_do_job`) (по умолчанию - 3).
+
     :Атрибуты:
     - `_classNames` —  Список названий классов жестов.
-    - `_model` —  Модель YOLO для распознавания жестов.
+    - `_model` —  Механизм выполнения модели YOLO для распознавания жестов (`InferenceBackend`
+      или `InferenceProcessPool`).
+    - `gesture_filter` — Фильтр результатов распознавания (`GestureFilter`), по образцу которого создаются фильтры камер.
+    - `gesture_filters (list)` — Фильтры результатов распознавания для каждой камеры.
+    - `sources (list)`, `max_batch (int)`, `max_wait (float)` — Параметры пакетного распознавания.
+    - `batcher (Optional[FrameBatcher])` — Источник пакетов кадров; None, пока камеры не открыты.
+    - `roi` — Область интереса (`RegionOfInterest`), по образцу которой создаются области камер.
+    - `rois (list)` — Области интереса для каждой камеры.
+    - `motion_gates (Optional[list])` — Проверки движения для каждой камеры или None, если они отключены.
+    - `pipeline (Optional[Pipeline])` — Конвейер стадий подготовки, распознавания и обработки результатов;
+      None, пока камеры не открыты.
+    - `idle_release (Optional[float])` — Через сколько секунд паузы освобождаются камера и модель.
+    - `preview_every (Optional[int])` — Каждый какой кадр показывается в окне; None — без окна.
+    - `backend (str)`, `model_path (str)`, `precision (str)`, `intra_op_threads (Optional[int])`,
+      `inference_workers (int)` — Параметры механизма выполнения модели.
+    - `model_file (str)` — Путь к файлу загружаемой модели с учетом `precision`.
+    - `last_latency (float)` — Время в секундах от захвата последнего обработанного кадра до решения
+      об отправке команды.
+    - `last_detections (list)` — Для каждой камеры кортеж `(timestamp, detections)`: время захвата последнего
+      распознанного кадра и найденные на нем объекты `Detection` в координатах кадра.
+    - `dispatch_commands (bool)` — Флаг, указывающий, отправляются ли команды внешним серверам.
+    - `shared_frames (Optional[str])` — Префикс имен общей памяти с кадрами камер или None.
+    - `worker_restarts (int)` — Сколько раз подряд перезапускаются процессы распознавания.
+    - `error (Optional[str])` — Причина, по которой распознавание остановлено (процессы распознавания
+      завершаются снова и снова), или None. Возвращается командой `stats` вместе с флагом `healthy`.
+
+    Каждый найденный объект публикуется подписчикам (`subscriptions`, команда `subscribe`) событием
+    "detection", а каждая команда, пропущенная фильтром, — событием "command", с номером и временем захвата
+    кадра. Так любое количество потребителей получает результаты одного распознавания по своим соединениям
+    с сервисом, и сервису не нужно подключаться к ним самому.
+
+    Помимо метрик `Service`, в `metrics` записываются: возраст кадра к началу подготовки (`capture_age_seconds`),
+    время распознавания пакета (`inference_seconds`), время от захвата кадра до решения об отправке команды
+    (`frame_latency_seconds`), время стадий конвейера, количество распознанных и пропущенных кадров,
+    найденных объектов каждого класса (`detections_total`) и отправленных команд, а также частота кадров,
+    пропущенные кадры и ошибки чтения каждой камеры.
 
     :Методы:
     - `_do_job(self)` — Реализует основной цикл работы, захватывая кадры с камеры, выполняя распознавание жестов и взаимодействуя с внешними серверами на основе распознанных жестов.
+    - `__model_signature(self) -> Optional[tuple]` — Возвращает размер и время изменения файла модели.
+    - `__acquire(self)` — Готовит модель, камеры и конвейер к работе, сохраняя уже готовые.
     - `__init_vars(self)` — Инициализирует внутренние переменные, такие как названия классов жестов и модель YOLO.
-    - `__specific_work(self)` — Выполняет конкретную работу по распознаванию жестов с использованием модели YOLO.
+    - `__frame_bytes(self) -> int` — Возвращает наибольший размер кадра камер для слотов процессов распознавания.
+    - `__release(self)` — Останавливает конвейер и освобождает камеры и модель.
+    - `__release_model(self)` — Освобождает модель.
+    - `_release_resources(self)` — Освобождает камеры, модель и конвейер при окончательной остановке сервиса.
+    - `stop(self)` — Останавливает сервис и прерывает ожидание кадров.
+    - `__preprocess(self, batch)` — Стадия подготовки: проверка движения и вырезание областей интереса.
+    - `__specific_work(self, item)` — Стадия распознавания жестов на пакете кадров с использованием модели YOLO.
+    - `__handle_results(self, item)` — Стадия обработки результатов: фильтрация, публикация событий и отправка команд.
+    - `stream_stats(self) -> dict` — Возвращает частоту кадров по камерам, эффективность пакетирования,
+      счетчики пропущенных проверкой движения кадров и время работы стадий конвейера.
+    - `stats(self) -> dict` — Возвращает метрики сервиса вместе с `stream_stats` и состоянием распознавания
+      (команда `stats`).
+    - `__restart_workers(self) -> bool` — Пересоздает процессы распознавания после завершения одного из них.
+    - `__camera_value(self, stream, name) -> float` — Возвращает показатель камеры для метрик.
+    - `__dispatch(self, command)` — Отправляет команду серверу распознавания речи или управления движениями.
     - `__resp_hand(self, response)` — Обрабатывает ответы от внешних серверов.
-    - `_request_handler(request: str) -> str` — Обрабатывает запросы на включение, отключение, закрытие или перезапуск службы.
+    - `__detections_stream(self, request) -> Optional[int]` — Возвращает номер камеры из запроса `detections`.
+    - `_request_handler(self, request: str) -> str` — Обрабатывает запросы клиентов, в том числе `detections`.
+    - `_process_message(self, request, flags) -> tuple` — Отвечает на запрос версии 2 `detections` с флагом
+      `FLAG_BINARY` двоичным сообщением `MSG_DETECTIONS`.
 
     :Примечание:
-    - Метод `_do_job` содержит цикл, который непрерывно захватывает кадры, выполняет
-      распознавание жестов и взаимодействует с внешними серверами. Цикл может быть прерван
-      установкой `need_job_break` в True или приостановлен установкой `need_job_pause` в False.
-    - Ожидается, что файл модели YOLO "best.onnx" находится в том же каталоге, что и скрипт.
-    - Результаты распознавания жестов отображаются с использованием OpenCV в окне с заголовком "Gesture recognition".
+    - Метод `_do_job` содержит цикл, который непрерывно захватывает кадры и передает их конвейеру из трех
+      стадий в отдельных потоках: подготовка, распознавание, обработка результатов и взаимодействие с внешними
+      серверами. Пока модель распознает один пакет, подготавливается следующий и обрабатываются результаты
+      предыдущего. Цикл прерывается методом `stop` и приостанавливается методом `pause`; на паузе потоки
+      работы спят, не занимая процессор.
+    - Камеры, модель и конвейер принадлежат объекту сервиса и переживают команду `restart`: перезапуск
+      не открывает камеры и не загружает модель заново, если файл модели не изменился. Они освобождаются,
+      когда `start` завершается без перезапуска (команда `close` или метод `shutdown`).
+    - Ожидается, что файл модели YOLO "best.onnx" находится в том же каталоге, что и скрипт (см. `model_path_`).
+    - Результаты распознавания жестов (первой камеры из `sources_`) отображаются с использованием OpenCV в окне
+      с заголовком "Gesture recognition".
+      Отрисовка выполняется в отдельном потоке (`Preview`) и не задерживает распознавание;
+      при `preview_every_=None` окно не создается.
     - Класс поддерживает обработку конкретных жестов, таких как "Hello" и "Goodbye",
       взаимодействуя с серверами распознавания речи.
 
     Использование:
     ```python
-    service = ServiceGR()
+    service = ServiceGR(ip_="127.0.0.2", port_=5505)
     service.start()  # Запустить службу, инициируя цикл распознавания жестов.
     ```
 
     """
+    def __init__(self, ip_: str, port_: int, n_conn_=10, n_workers_=4,
+                 gesture_filter_: Optional[GestureFilter] = None, idle_release_: Optional[float] = None,
+                 preview_every_: Optional[int] = 1, backend_: str = "ultralytics",
+                 model_path_: str = "best.onnx", intra_op_threads_: Optional[int] = None, inference_workers_: int = 0,
+                 sources_: Optional[Sequence] = None, max_batch_: int = 4, max_wait_: float = 0.01,
+                 roi_: Optional[RegionOfInterest] = None, motion_gate_: Optional[MotionGate] = None,
+                 dispatch_commands_: bool = True, precision_: str = "fp32", shared_frames_: Optional[str] = None,
+                 worker_restarts_: int = 3):
+        """
+        Конструктор класса.
+
+        """
+        super().__init__(ip_, port_, n_conn_, n_workers_)
+        self.gesture_filter = gesture_filter_ if gesture_filter_ is not None else GestureFilter()
+        self.idle_release = idle_release_
+        self.preview_every = preview_every_
+        self.backend = backend_
+        self.model_path = model_path_
+        if precision_ not in ("fp32", "int8"):
+            raise ValueError(f"Unknown model precision: {precision_}")
+        self.precision = precision_
+        self.model_file = model_path_ if precision_ == "fp32" else quantized_model_path(model_path_)
+        self.intra_op_threads = intra_op_threads_
+        self.inference_workers = inference_workers_
+        self.sources = list(sources_) if sources_ is not None else [0]
+        self.max_batch = max_batch_
+        self.max_wait = max_wait_
+        self.gesture_filters = [copy.deepcopy(self.gesture_filter) for _ in self.sources]
+        self.roi = roi_ if roi_ is not None else RegionOfInterest()
+        self.rois = [copy.deepcopy(self.roi) for _ in self.sources]
+        self.motion_gates = [copy.deepcopy(motion_gate_) for _ in self.sources] if motion_gate_ is not None else None
+        self.dispatch_commands = dispatch_commands_
+        self.shared_frames = shared_frames_
+        self.worker_restarts = worker_restarts_
+        self.error = None
+        self.__n_worker_restarts = 0
+        self._model = None
+        self.__loaded_signature = None
+        self.batcher = None
+        self.pipeline = None
+        self.__last_results = [("Class wasn't recognised", 0.0)] * len(self.sources)
+        self.last_detections = [(0.0, [])] * len(self.sources)
+        self.__preview = None
+        self.last_latency = 0.0
+        self.__capture_age = self.metrics.histogram("capture_age_seconds", "Frame age when preprocessing starts")
+        self.__inference_seconds = self.metrics.histogram("inference_seconds", "Model inference time per batch")
+        self.__frame_latency = self.metrics.histogram("frame_latency_seconds", "Capture to command decision time")
+        self.__frames_inferred = self.metrics.counter("frames_inferred_total", "Frames passed to the model")
+        self.__frames_skipped = self.metrics.counter("frames_skipped_total", "Frames skipped by the motion gate")
+        self.__frames_stale = self.metrics.counter("frames_stale_total",
+                                                   "Frames overwritten in the camera buffer before preprocessing")
+        self.__worker_restarts_total = self.metrics.counter("inference_worker_restarts_total",
+                                                            "Inference process pool restarts after a worker died")
+        self._classNames = ['Forward', 'Left', 'Right', 'Stop', 'Goodbye', 'Back', 'Hello']
+        self.__detections_total = [self.metrics.counter("detections_total", "Detected objects", gesture=name)
+                                   for name in self._classNames]
+        self.__commands_total = {name: self.metrics.counter("commands_total", "Commands sent downstream", command=name)
+                                 for name in self._classNames}
+        for stream in range(len(self.sources)):
+            for name, help in (("fps", "Camera capture rate"), ("frames", "Frames captured by the camera"),
+                               ("dropped", "Frames overwritten before processing"),
+                               ("read_errors", "Failed camera reads")):
+                self.metrics.gauge(f"camera_{name}", help, partial(self.__camera_value, stream, name), stream=stream)
+
     def _do_job(self):
         """
         Реализует основной цикл работы сервиса по распознаванию жестов.
 
-        Метод начинает выполнение, захватывая кадры с камеры и инициализируя необходимые переменные.
-        Далее запускается бесконечный цикл, в котором происходит следующее:
+        Метод запускает бесконечный цикл, в котором происходит следующее:
         
         1. Проверяется флаг `need_job_break`. Если он установлен в True, цикл прерывается, и выполнение метода завершается.
         
-        2. Проверяется флаг `need_job_pause`. Если он установлен в False, цикл останавливается, и выполнение метода
-           приостанавливается, ожидая изменения значения флага.
+        2. Если сервис приостановлен, поток блокируется в `_wait_unpaused` до вызова `unpause` или `stop`.
+           Если пауза длится дольше `idle_release` секунд, камеры и модель освобождаются. При первом кадре после
+           запуска или освобождения модель, камеры и конвейер готовятся к работе (`__acquire`): после команды
+           `restart` используются уже открытые камеры и загруженная модель, если ее файл не изменился.
+
+        3. Ожидается следующий пакет кадров с камер (`FrameBatcher.next_batch`): по одному новому кадру от камер,
+           у которых он появился за `max_wait` секунд, не более `max_batch` кадров. Каждый кадр обрабатывается
+           ровно один раз, без холостого опроса камер. Ожидание ограничено `timeout` секундами, чтобы цикл
+           мог проверить флаги. Пакет передается конвейеру (`pipeline`); шаги 4-8 выполняются его стадиями.
+           Если стадия подготовки не успевает, из ее очереди выбрасываются самые старые пакеты.
 
-        3. Захватывается кадр с камеры, проверяется его корректность, и обрабатывается для дальнейшего использования.
+        4. Стадия подготовки (`__preprocess`): если включена проверка движения (`motion_gates`), кадры неподвижной
+           сцены не распознаются — для них используется результат последнего распознавания той же камеры.
+           Из каждого оставшегося кадра вырезается и копируется область интереса камеры (`rois`).
 
-        4. Выполняется распознавание жестов с использованием метода `__specific_work`, который использует модель YOLO.
+        5. Стадия распознавания (`__specific_work`): распознавание жестов на всех подготовленных кадрах пакета
+           одним вызовом модели.
 
-        5. В зависимости от распознанного жеста, инициируется взаимодействие с внешними серверами:
+        6. Стадия обработки результатов (`__handle_results`): результат каждого кадра проходит через фильтр своей
+           камеры (`gesture_filters`): команда отправляется, только если жест устойчив на нескольких кадрах,
+           и повторяется не чаще заданного интервала.
+
+        7. Если фильтр пропустил команду, инициируется взаимодействие с внешними серверами (`__dispatch`):
            - Если жест распознан как "Hello" или "Goodbye", выполняется запрос к серверу распознавания речи.
            - В противном случае, выполняется запрос к серверу управления движениями.
 
-        6. В окне с заголовком "Gesture recognition" с использованием OpenCV отображаются результаты распознавания.
+        8. В `last_latency` сохраняется время от захвата кадра до решения об отправке команды.
+
+        9. Если включен просмотр и в окне "Gesture recognition" нажата клавиша 'q', цикл прерывается,
+           и метод завершает выполнение.
 
-        7. Если нажата клавиша 'q', цикл прерывается, и метод завершает выполнение.
+        Если процесс распознавания завершился, пул процессов неисправен (`InferenceProcessPool.error`): конвейер
+        и пул пересоздаются (`__restart_workers`), но не более `worker_restarts` раз подряд без успешного
+        распознавания между ними. После этого распознавание останавливается: камеры и модель освобождаются,
+        сервис приостанавливается, а причина записывается в `error` и возвращается командой `stats`
+        (`healthy: false`). Команда `enable` снова запускает распознавание.
 
-        Наконец, в блоке `finally` закрываются окна OpenCV, и вызывается метод `stop` для завершения работы сервиса.
+        Наконец, в блоке `finally` вызывается метод `stop` для завершения работы сервиса. Камеры, модель, конвейер
+        и окно просмотра остаются открытыми для следующего запуска по команде `restart` и освобождаются
+        при окончательной остановке (`_release_resources`) или, если работа прервана ошибкой, сразу.
 
         """
+        acquired = False
         try:
-            url = 0
-            cap = Camera(url)        
-            self.__init_vars()
+            if self.preview_every is not None and self.__preview is None:
+                self.__preview = Preview("Gesture recognition", every=self.preview_every)
             while True:
                 if self.need_job_break:
                     return
-                if not self.need_job_pause:
+                if not self._wait_unpaused(self.idle_release):
+                    if not self.need_job_break and self.batcher is not None:
+                        self.__release()
+                    acquired = False
                     continue
+                if not acquired:
+                    self.__acquire()
+                    acquired = True
 
-                frame_raw = cap.getFrame()
-                if frame_raw is None:
+                if isinstance(self._model, InferenceProcessPool) and self._model.error is not None:
+                    acquired = self.__restart_workers()
                     continue
 
-                h, w, ch = frame_raw.shape
-                w = w//2
-                self.frame = frame_raw[0:h, 0:w]
-
-                result = self.__specific_work()
-
-                server_ip_speach_recognition = '0.0.0.0'
-                server_port_speach_recognition = 0000
-                server_ip_doing_movements = '0.0.0.0'
-                server_port_doing_movements = 0000
-
-                if result == "Class wasn't recognised":
+                batch = self.batcher.next_batch(timeout=self.timeout)
+                if not batch:
                     continue
-                elif result == "Hello" or result == "Goodbye":
-                    self.run_client(ip=server_ip_speach_recognition, port=server_port_speach_recognition_port, \
-                                    request=result, response_handler=self.__resp_hand)
-                else:
-                    self.run_client(ip=server_ip_doing_movements, port=server_port_doing_movements,\
-                                    request=result, response_handler=self.__resp_hand)
-                         
-                if cv2.waitKey(5) & 0xFF == ord('q'):
+                self.pipeline.submit(batch)
+
+                if self.__preview is not None and self.__preview.quit_requested:
                     break
-        
-        finally:    
-            cv2.destroyAllWindows()
+        except BaseException:
+            self.__release()
+            raise
+        finally:
             self.stop()
 
+    def __model_signature(self) -> Optional[tuple]:
+        """
+        Возвращает размер и время изменения файла модели или None, если файла нет.
+
+        """
+        try:
+            stat = os.stat(self.model_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __acquire(self):
+        """
+        Готовит модель, камеры и конвейер к работе, сохраняя уже готовые.
+
+        Модель загружается заново, только если ее еще нет или файл `model_file` изменился с момента загрузки;
+        в этом случае пересоздается и конвейер, чтобы пакеты, переданные прежней модели, не смешивались
+        с результатами новой. Модель в процессе сервиса загружается до открытия камер, чтобы кадры
+        не пропускались во время загрузки; процессы распознавания запускаются после, так как размер слотов
+        их общей памяти определяется по кадрам камер (`__frame_bytes`). При создании конвейера сбрасываются
+        фильтры, области интереса и проверки движения.
+
+        """
+        if self._model is not None and self.__model_signature() != self.__loaded_signature:
+            logger.info("Model file %s changed, reloading", self.model_file)
+            if self.pipeline is not None:
+                self.pipeline.close()
+                self.pipeline = None
+            self.__release_model()
+        if self._model is None and self.inference_workers <= 0:
+            self.__init_vars()
+        if self.batcher is None:
+            self.batcher = FrameBatcher(self.sources, self.max_batch, self.max_wait, buffer_size=8,
+                                        shared_name=self.shared_frames)
+        if self._model is None:
+            self.__init_vars()
+        if self.pipeline is None:
+            for gesture_filter, roi in zip(self.gesture_filters, self.rois):
+                gesture_filter.reset()
+                roi.reset()
+            for motion_gate in self.motion_gates or []:
+                motion_gate.reset()
+            self.__last_results = [("Class wasn't recognised", 0.0)] * len(self.sources)
+            self.pipeline = Pipeline([
+                ("preprocess", self.__preprocess, 2, True),
+                ("infer", self.__specific_work, 2, True),
+                ("dispatch", self.__handle_results, 8, False),
+            ], metrics=self.metrics)
+
     def __init_vars(self):
         """
         Инициализирует внутренние переменные класса ServiceGR.
 
-        Устанавливает список `_classNames` с названиями классов жестов и загружает модель YOLO из файла "best.onnx".
+        Загружает модель YOLO из файла `model_file` выбранным механизмом выполнения `backend` — в процессе сервиса
+        или, если `inference_workers` больше 0, в каждом из процессов распознавания. Слоты общей памяти
+        процессов вмещают наибольший кадр открытых камер (`__frame_bytes`), а значит, и любую его область.
 
         """
-        self._classNames = ['Forward', 'Left', 'Right', 'Stop', 'Goodbye', 'Back', 'Hello']
-        self._model = YOLO("best.onnx")
+        self.__loaded_signature = self.__model_signature()
+        if self.inference_workers > 0:
+            threads = self.intra_op_threads if self.intra_op_threads is not None else 1
+            self._model = InferenceProcessPool(self.backend, self.model_file, self.inference_workers,
+                                               intra_op_threads=threads, max_frame_bytes=self.__frame_bytes(),
+                                               timeout=self.timeout)
+        else:
+            self._model = create_backend(self.backend, self.model_file, intra_op_threads=self.intra_op_threads)
 
-    def __specific_work(self) -> str:
+    def __restart_workers(self) -> bool:
         """
-        Выполняет конкретную работу по распознаванию жестов с использованием модели YOLO.
+        Пересоздает конвейер и пул процессов распознавания после завершения одного из процессов.
 
-        Метод передает текущий кадр в модель YOLO и обрабатывает результаты распознавания.
-        Если распознан какой-либо жест, то отображает аннотированный кадр с результатами и возвращает
-        строку с названием распознанного класса жеста. В случае, если жест не распознан, возвращает
-        строку "Class wasn't recognised".
+        Пакеты, переданные неисправному пулу, теряются. Камеры остаются открытыми. Если пул не удается
+        запустить заново или перезапусков подряд уже `worker_restarts`, освобождает камеры, записывает причину
+        в `error` и приостанавливает сервис. Возвращает True, если сервис готов к работе.
 
         """
-        results = self._model(self.frame)
-        recognition_class = ""
+        error = self._model.error
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
+        self.__release_model()
+        while self.__n_worker_restarts < self.worker_restarts:
+            self.__n_worker_restarts += 1
+            self.__worker_restarts_total.inc()
+            logger.warning("Restarting inference workers (%s of %s): %s", self.__n_worker_restarts,
+                           self.worker_restarts, error)
+            try:
+                self.__acquire()
+                return True
+            except RuntimeError as e:
+                error = str(e)
+                self.__release_model()
+        self.error = f"Inference workers keep failing: {error}"
+        logger.error("%s; recognition stopped until 'enable'", self.error)
+        self.__n_worker_restarts = 0
+        self.__release()
+        self.pause()
+        return False
+
+    def __frame_bytes(self) -> int:
+        """
+        Возвращает наибольший размер кадра открытых камер в байтах.
 
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                recognition_class = self._classNames[cls]
+        Ждет первого кадра каждой камеры не дольше `timeout` секунд; для камеры, от которой кадр не пришел,
+        берется размер кадра 1920x1080x3.
 
-        annotated_frame = results[0].plot()
+        """
+        sizes = []
+        for camera in self.batcher.cameras:
+            _, frame, _ = camera.wait_frame(0, self.timeout)
+            sizes.append(frame.nbytes if frame is not None else 1920 * 1080 * 3)
+        return max(sizes, default=1920 * 1080 * 3)
 
-        cv2.imshow("Gesture recognition", annotated_frame)
+    def __release(self):
+        """
+        Останавливает конвейер и освобождает камеры и модель.
+
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
+        if self.batcher is not None:
+            self.batcher.release()
+            self.batcher = None
+        self.__release_model()
+
+    def __release_model(self):
+        """
+        Освобождает модель (и процессы распознавания, если они используются).
+
+        """
+        if isinstance(self._model, InferenceProcessPool):
+            self._model.close()
+        self._model = None
+
+    def _release_resources(self) -> None:
+        """
+        Освобождает камеры, модель и конвейер и закрывает окно просмотра при окончательной остановке сервиса.
+
+        """
+        self.__release()
+        if self.__preview is not None:
+            self.__preview.close()
+            self.__preview = None
 
-        if recognition_class == "":
-            return "Class wasn't recognised"
+    def stop(self) -> None:
+        """
+        Останавливает сервис (`Service.stop`) и прерывает ожидание кадров потоком работы, чтобы остановка
+        и перезапуск не ждали следующего кадра.
+
+        """
+        super().stop()
+        batcher = self.batcher
+        if batcher is not None:
+            batcher.interrupt()
+
+    def __preprocess(self, batch: list) -> tuple:
+        """
+        Стадия подготовки пакета кадров к распознаванию.
+
+        Отбирает кадры, которые нужно распознать (см. `motion_gates`), вырезает из них области интереса камер
+        и копирует их: пока пакет ждет в очередях конвейера, поток чтения камеры может перезаписать кадр
+        в кольцевом буфере. Кадры, полученные без копирования, проверяются (`Camera.is_valid`) до обработки
+        и после копирования области; перезаписанные кадры выбрасываются из пакета и учитываются
+        в `frames_stale_total`. Выбирает наибольший из нужных областям размеров входа модели.
+
+        Возвращает кортеж `(batch, to_infer, crops, imgsz)`, где `crops` — для каждого кадра `to_infer` копия
+        области, ее смещение и границы основной области (см. `RegionOfInterest.crop`).
+
+        """
+        now = time.time()
+        for _, _, _, captured_at in batch:
+            self.__capture_age.observe(now - captured_at)
+        batcher = self.batcher
+        cameras = batcher.cameras if batcher is not None else None
+        n_frames = len(batch)
+        if cameras is not None:
+            batch = [item for item in batch if cameras[item[0]].is_valid(item[1])]
+        if self.motion_gates is None:
+            to_infer = batch
+        else:
+            to_infer = [item for item in batch if self.motion_gates[item[0]].should_infer(item[2], item[3])]
+        self.__frames_skipped.inc(len(batch) - len(to_infer))
+        crops = []
+        for stream, _, frame, _ in to_infer:
+            crop, offset, bounds = self.rois[stream].crop(frame)
+            crops.append((crop.copy(), offset, bounds))
+        if cameras is not None:
+            # Кадр мог быть перезаписан, пока копировалась его область.
+            stale = {(stream, seq) for stream, seq, _, _ in to_infer if not cameras[stream].is_valid(seq)}
+            if stale:
+                crops = [crop for item, crop in zip(to_infer, crops) if item[:2] not in stale]
+                to_infer = [item for item in to_infer if item[:2] not in stale]
+                batch = [item for item in batch if item[:2] not in stale]
+        self.__frames_stale.inc(n_frames - len(batch))
+        self.__frames_inferred.inc(len(to_infer))
+        imgsz = max((self.rois[stream].input_size() for stream, _, _, _ in to_infer), default=None)
+        return batch, to_infer, crops, imgsz
+
+    def __specific_work(self, item: tuple) -> tuple:
+        """
+        Стадия распознавания жестов на пакете кадров с использованием модели YOLO.
+
+        Метод передает все подготовленные области кадров в модель YOLO одним вызовом.
+        Возвращает кортеж `(batch, to_infer, crops, detections)`, где `detections` — списки объектов
+        `Detection` в координатах областей. При распознавании в процессах стадия не ждет результата:
+        вместо списков возвращается `PendingResult`, и пока процессы распознают этот пакет, стадия
+        передает им следующие.
+
+        """
+        batch, to_infer, crops, imgsz = item
+        frames = [crop for crop, _, _ in crops]
+        if isinstance(self._model, InferenceProcessPool):
+            return batch, to_infer, crops, self._model.submit(frames, imgsz)
+        if not frames:
+            return batch, to_infer, crops, []
+        start = time.perf_counter()
+        detections = self._model.predict_batch(frames, imgsz)
+        self.__inference_seconds.observe(time.perf_counter() - start)
+        return batch, to_infer, crops, detections
+
+    def __handle_results(self, item: tuple) -> None:
+        """
+        Стадия обработки результатов распознавания.
+
+        Переводит результаты в координаты кадра (при этом адаптивные области интереса смещаются за рукой) и
+        запоминает для каждой распознанной камеры класс жеста с наибольшей уверенностью и эту уверенность
+        или строку "Class wasn't recognised" и нулевую уверенность, если жест не распознан. Если включен
+        просмотр, передает отрисовку результатов области кадра первой камеры в окно просмотра (сама
+        отрисовка выполняется в потоке просмотра). Найденные объекты публикуются подписчикам и, если включена
+        публикация кадров, в общую память рядом с кадром. Затем для каждого кадра пакета пропускает последний
+        результат его камеры через фильтр, публикует и отправляет команды и обновляет `last_latency`. Пакеты
+        проходят стадию в порядке захвата, поэтому результаты процессов распознавания собираются в том же порядке.
+
+        """
+        batch, to_infer, crops, detections_list = item
+        batcher = self.batcher if self.shared_frames is not None else None
+        if isinstance(detections_list, PendingResult):
+            pending = detections_list
+            detections_list = pending.get(timeout=self.timeout)
+            if to_infer:
+                self.__inference_seconds.observe(pending.completed_at - pending.submitted_at)
+                self.__n_worker_restarts = 0
+                self.error = None
+        for (stream, seq, _, captured_at), (crop, offset, bounds), detections in zip(to_infer, crops,
+                                                                                      detections_list):
+            if self.__preview is not None and stream == 0:
+                self.__preview.offer(partial(draw_detections, crop, detections, self._classNames))
+            detections = self.rois[stream].update(detections, offset, bounds)
+            self.last_detections[stream] = (captured_at, detections)
+            if batcher is not None:
+                batcher.cameras[stream].publish_detections(seq, detections)
+            for detection in detections:
+                self.__detections_total[detection.class_id].inc()
+                if self.subscriptions:
+                    self.subscriptions.publish(Event("detection", stream, seq, captured_at,
+                                                     self._classNames[detection.class_id], *detection))
+            if not detections:
+                self.__last_results[stream] = ("Class wasn't recognised", 0.0)
+            else:
+                best = detections[0]
+                self.__last_results[stream] = (self._classNames[best.class_id], best.confidence)
+
+        for stream, seq, _, captured_at in batch:
+            result, confidence = self.__last_results[stream]
+            if result == "Class wasn't recognised":
+                command = self.gesture_filters[stream].update(None)
+            else:
+                command = self.gesture_filters[stream].update(result, confidence)
+            if command is not None:
+                self.__commands_total[command].inc()
+                if self.subscriptions:
+                    detections = self.last_detections[stream][1]
+                    box = detections[0].box if detections else (0.0, 0.0, 0.0, 0.0)
+                    class_id = self._classNames.index(command) if command in self._classNames else 0
+                    self.subscriptions.publish(Event("command", stream, seq, captured_at, command, class_id,
+                                                     confidence, box))
+                if self.dispatch_commands:
+                    self.__dispatch(command)
+            self.last_latency = time.time() - captured_at
+            self.__frame_latency.observe(self.last_latency)
+
+    def stream_stats(self) -> dict:
+        """
+        Возвращает частоту кадров по камерам и эффективность пакетирования (см. `FrameBatcher.stats`),
+        при включенной проверке движения — количество распознанных (`inferred`) и пропущенных (`skipped`)
+        кадров каждой камеры, а также время работы стадий конвейера и длину их очередей (`pipeline`,
+        см. `Pipeline.stats`).
+
+        Если камеры не открыты, возвращает пустой словарь.
+
+        """
+        batcher, pipeline = self.batcher, self.pipeline
+        if batcher is None or pipeline is None:
+            return {}
+        stats = batcher.stats()
+        if self.motion_gates is not None:
+            stats["inferred"] = [motion_gate.n_inferred for motion_gate in self.motion_gates]
+            stats["skipped"] = [motion_gate.n_skipped for motion_gate in self.motion_gates]
+        stats["pipeline"] = pipeline.stats()
+        return stats
+
+    def stats(self) -> dict:
+        """
+        Возвращает метрики сервиса (`Service.stats`) и показатели камер и конвейера (`stream_stats`, ключ `streams`).
+
+        """
+        stats = super().stats()
+        stats["streams"] = self.stream_stats()
+        stats["healthy"] = self.error is None
+        stats["error"] = self.error
+        return stats
+
+    def __camera_value(self, stream: int, name: str) -> float:
+        """
+        Возвращает показатель камеры `stream` для метрик: частоту кадров (`fps`), количество захваченных
+        (`frames`) и пропущенных (`dropped`) кадров или ошибок чтения (`read_errors`). Если камеры не открыты,
+        возвращает 0.
+
+        """
+        batcher = self.batcher
+        if batcher is None:
+            return 0.0
+        camera = batcher.cameras[stream]
+        if name == "fps":
+            return camera.seq / max(time.monotonic() - camera.started_at, 1e-9)
+        if name == "frames":
+            return camera.seq
+        if name == "dropped":
+            return camera.n_dropped
+        return camera.n_read_errors
+
+    def __dispatch(self, command: str) -> None:
+        """
+        Отправляет команду внешним серверам.
+
+        Команды "Hello" и "Goodbye" отправляются серверу распознавания речи, остальные — серверу
+        управления движениями.
+
+        """
+        server_ip_speach_recognition = '0.0.0.0'
+        server_port_speach_recognition = 0000
+        server_ip_doing_movements = '0.0.0.0'
+        server_port_doing_movements = 0000
+
+        if command == "Hello" or command == "Goodbye":
+            self.run_client(ip=server_ip_speach_recognition, port=server_port_speach_recognition, \
+                            request=command, response_handler=self.__resp_hand)
         else:
-            return recognition_class
+            self.run_client(ip=server_ip_doing_movements, port=server_port_doing_movements,\
+                            request=command, response_handler=self.__resp_hand)
 
     def __resp_hand(self, response):
         """
         Обрабатывает ответ от внешних сервисов.
 
-        Выводит в консоль сообщение о полученном ответе и IP-адресе сервера.
+        Записывает в журнал (уровень DEBUG) сообщение о полученном ответе.
+
+        """
+        logger.debug("Message was received: %s", response)
+
+    def __detections_stream(self, request: str) -> Optional[int]:
+        """
+        Возвращает номер камеры из запроса `detections [stream]` (по умолчанию - 0) или None, если это другой запрос.
+
+        Если номер камеры неверен, вызывает ValueError.
 
         """
-        print(f"Message was received from ip {server_ip_speech_recognition}: {response}")
+        parts = request.split()
+        if not parts or parts[0].lower() != "detections":
+            return None
+        stream = int(parts[1]) if len(parts) > 1 else 0
+        if not 0 <= stream < len(self.sources):
+            raise ValueError(f"Unknown stream {stream}")
+        return stream
+
+    def _process_message(self, request: str, flags: int) -> tuple:
+        """
+        Обрабатывает запрос версии 2 протокола.
+
+        На запрос `detections [stream]` с флагом `FLAG_BINARY` отвечает последними результатами распознавания
+        камеры в двоичном виде (`MSG_DETECTIONS`, см. `protocol.pack_detections`). Остальные запросы
+        обрабатываются так же, как запросы версии 1.
 
-    def _request_handler(request: str) -> str:
+        """
+        if flags & protocol.FLAG_BINARY:
+            stream = self.__detections_stream(request)
+            if stream is not None:
+                timestamp, detections = self.last_detections[stream]
+                return protocol.MSG_DETECTIONS, protocol.pack_detections(stream, timestamp, detections)
+        return super()._process_message(request, flags)
+
+    def _request_handler(self, request: str) -> str:
         """
         Обрабатывает запросы, поступающие от внешних источников.
 
-        В зависимости от значения запроса, возвращает соответствующий ответ.
+        В зависимости от значения запроса, возвращает соответствующий ответ. На запрос `detections [stream]`
+        возвращает последние результаты распознавания камеры (по умолчанию - первой) в формате JSON:
+        `{"stream": ..., "timestamp": ..., "detections": [{"class": ..., "confidence": ..., "box": [...]}]}`.
 
         Аргументы:
         - `request` — Строка с запросом.
@@ -176,5 +717,13 @@ class ServiceGR(Service):
             return "closed"
         elif request == "restart":
             return "restarted"
-        else:
-            return "nothing"
+        stream = self.__detections_stream(request)
+        if stream is not None:
+            timestamp, detections = self.last_detections[stream]
+            return json.dumps({
+                "stream": stream,
+                "timestamp": timestamp,
+                "detections": [{"class": self._classNames[d.class_id], "confidence": round(float(d.confidence), 4),
+                                "box": [round(float(v), 1) for v in d.box]} for d in detections],
+            })
+        return "nothing"
@@ -0,0 +1,434 @@
+"""
+Публикация кадров камеры и результатов распознавания в именованной общей памяти.
+
+Камеру можно открыть только одним процессом, поэтому другие сервисы на том же узле получают ее кадры
+из общей памяти (`multiprocessing.shared_memory`), которую заполняет `Camera` (см. параметр `shared_name`):
+без повторного декодирования, кодирования и передачи по TCP. Каждый читатель (`SharedFrameReader`) видит
+кадры без копирования, поэтому количество читателей не увеличивает нагрузку на процесс камеры.
+
+Память начинается с заголовка `RING`: метка `MAGIC`, версия формата, количество слотов, наибольшее
+количество объектов в слоте, размер области кадра в слоте, номер последнего опубликованного кадра и номер
+последнего кадра с опубликованными результатами распознавания. Затем идут `n_slots` слотов; кадр с номером
+`seq` записывается в слот `seq % n_slots`. Слот начинается с заголовка `SLOT` (номер кадра в начале
+и в конце записи, время захвата, номер кадра, к которому относятся результаты, высота, ширина и количество
+каналов кадра, количество объектов и тип элементов кадра `numpy.dtype.str`), за ним — до `max_detections`
+структур `protocol.DETECTION` и сам кадр.
+
+Писатель в каждый момент один: кадры и результаты распознавания публикуются из разных потоков
+(чтения камеры и обработки результатов), но `SharedFramePublisher` выполняет запись под общей блокировкой.
+Перед записью кадра писатель записывает в начало слота его номер, а после записи — в конец слота
+и в заголовок `RING`; читатель принимает слот, только если оба номера совпадают с нужным кадром. Результаты
+распознавания записываются в слот уже опубликованного кадра тем же способом (номер кадра результатов
+обнуляется на время записи). Ожидание новых кадров выполняется опросом номера кадра в заголовке `RING`.
+
+Пример просмотра опубликованных кадров из другого процесса:
+```
+python shared_frames.py gesture_cam_0
+```
+"""
+import argparse
+import json
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Sequence
+
+import numpy as np
+
+import protocol
+from inference import Detection
+
+
+MAGIC = b"GRSF"
+VERSION = 1
+RING = struct.Struct('<4sBxHIIQQ')
+SLOT = struct.Struct('<QQdQIIII8s')
+SEQ = struct.Struct('<Q')
+ALIGN = 64
+
+_RING_SEQ = 16
+_RING_DETECTIONS_SEQ = 24
+_SLOT_END = 8
+_SLOT_DETECTIONS_SEQ = 24
+_SLOT_N_DETECTIONS = 44
+
+# Имена общей памяти, созданной писателями этого процесса (см. `SharedFrameReader.__attach`).
+_published = set()
+
+
+def _aligned(size: int) -> int:
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(n_slots: int, max_detections: int, slot_bytes: int) -> tuple:
+    """
+    Возвращает смещение области кадра в слоте, размер слота и размер всей памяти.
+
+    """
+    frame_offset = _aligned(SLOT.size) + _aligned(max_detections * protocol.DETECTION.size)
+    slot_size = frame_offset + _aligned(slot_bytes)
+    return frame_offset, slot_size, _aligned(RING.size) + n_slots * slot_size
+
+
+class SharedFramePublisher:
+    """
+    Класс писателя кадров и результатов распознавания в именованную общую память.
+
+    :Параметры:
+    - `name (str)` — Имя общей памяти, по которому подключаются читатели.
+    - `max_frame_bytes (int, необязательно)` — Наибольший размер кадра в байтах; большие кадры не публикуются
+      (по умолчанию - 1280x720x3).
+    - `n_slots (int, необязательно)` — Количество слотов: кадр, полученный читателем без копирования, остается
+      неизменным, пока не опубликованы еще `n_slots - 1` кадров (по умолчанию - 8).
+    - `max_detections (int, необязательно)` — Наибольшее количество объектов, публикуемых для кадра
+      (по умолчанию - 32).
+
+    :Атрибуты:
+    - `name (str)`, `n_slots (int)`, `max_detections (int)`, `slot_bytes (int)` — Параметры общей памяти.
+    - `n_published (int)` — Количество опубликованных кадров.
+    - `n_oversized (int)` — Количество кадров, не опубликованных из-за размера.
+
+    :Методы:
+    - `publish_frame(self, seq, frame, timestamp) -> bool` — Метод для публикации кадра.
+    - `publish_detections(self, seq, detections) -> bool` — Метод для публикации результатов распознавания кадра.
+    - `close(self) -> None` — Метод для удаления общей памяти.
+
+    Методы можно вызывать из разных потоков: записи в общую память и ее удаление выполняются под блокировкой.
+
+    """
+    def __init__(self, name: str, max_frame_bytes: int = 1280 * 720 * 3, n_slots: int = 8,
+                 max_detections: int = 32):
+        """
+        Конструктор класса.
+
+        Создает общую память; если память с таким именем уже существует, вызывает FileExistsError.
+
+        """
+        self.name = name
+        self.n_slots = max(2, n_slots)
+        self.max_detections = max_detections
+        self.slot_bytes = max_frame_bytes
+        self.n_published = 0
+        self.n_oversized = 0
+        self.__frame_offset, self.__slot_size, size = _layout(self.n_slots, max_detections, max_frame_bytes)
+        self.__shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.__lock = threading.Lock()
+        _published.add(name)
+        RING.pack_into(self.__shm.buf, 0, MAGIC, VERSION, self.n_slots, max_detections, max_frame_bytes, 0, 0)
+
+    def __slot(self, seq: int) -> int:
+        return _aligned(RING.size) + (seq % self.n_slots) * self.__slot_size
+
+    def publish_frame(self, seq: int, frame: np.ndarray, timestamp: float) -> bool:
+        """
+        Метод для публикации кадра.
+
+        :Параметры:
+        - `seq (int)` — Номер кадра; номера должны возрастать.
+        - `frame (numpy.ndarray)` — Кадр (двумерный или с каналами).
+        - `timestamp (float)` — Время захвата кадра (`time.time()`).
+
+        Копирует кадр в очередной слот. Возвращает False, если кадр больше `slot_bytes` или память удалена.
+
+        """
+        if frame.nbytes > self.slot_bytes or frame.ndim not in (2, 3):
+            self.n_oversized += 1
+            return False
+        offset = self.__slot(seq)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 0
+        with self.__lock:
+            buf = self.__shm.buf
+            if buf is None:
+                return False
+            SEQ.pack_into(buf, offset, seq)
+            view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=buf, offset=offset + self.__frame_offset)
+            view[...] = frame
+            del view
+            SLOT.pack_into(buf, offset, seq, 0, timestamp, 0, height, width, channels, 0, frame.dtype.str.encode())
+            SEQ.pack_into(buf, offset + _SLOT_END, seq)
+            SEQ.pack_into(buf, _RING_SEQ, seq)
+        self.n_published += 1
+        return True
+
+    def publish_detections(self, seq: int, detections: Sequence[Detection]) -> bool:
+        """
+        Метод для публикации результатов распознавания кадра.
+
+        :Параметры:
+        - `seq (int)` — Номер опубликованного кадра.
+        - `detections (Sequence[Detection])` — Найденные объекты в координатах кадра; публикуются первые
+          `max_detections`.
+
+        Возвращает False, если слот кадра уже занят более новым кадром или память удалена.
+
+        """
+        offset = self.__slot(seq)
+        detections = detections[:self.max_detections]
+        with self.__lock:
+            buf = self.__shm.buf
+            if buf is None or SEQ.unpack_from(buf, offset)[0] != seq:
+                return False
+            SEQ.pack_into(buf, offset + _SLOT_DETECTIONS_SEQ, 0)
+            for i, detection in enumerate(detections):
+                protocol.DETECTION.pack_into(buf, offset + _aligned(SLOT.size) + i * protocol.DETECTION.size,
+                                             detection.class_id, detection.confidence, *detection.box)
+            struct.pack_into('<I', buf, offset + _SLOT_N_DETECTIONS, len(detections))
+            SEQ.pack_into(buf, offset + _SLOT_DETECTIONS_SEQ, seq)
+            if seq > SEQ.unpack_from(buf, _RING_DETECTIONS_SEQ)[0]:
+                SEQ.pack_into(buf, _RING_DETECTIONS_SEQ, seq)
+        return True
+
+    def close(self) -> None:
+        """
+        Метод для удаления общей памяти.
+
+        Читатели, уже подключенные к памяти, сохраняют доступ к ней, но новых кадров не получат. Запись,
+        выполняемая в другом потоке, завершается до удаления; последующие вызовы `publish_*` возвращают False.
+        Повторный вызов ничего не делает.
+
+        """
+        with self.__lock:
+            if self.__shm.buf is None:
+                return
+            self.__shm.close()
+            self.__shm.unlink()
+            _published.discard(self.name)
+
+
+class SharedFrameReader:
+    """
+    Класс читателя кадров и результатов распознавания из общей памяти, заполняемой `SharedFramePublisher`.
+
+    Методы для получения кадров повторяют методы `Camera`: кадры возвращаются без копирования в виде
+    массивов только для чтения, которые указывают прямо в общую память. Такой кадр остается неизменным,
+    пока писатель не опубликует еще `n_slots - 1` кадров; проверить это можно методом `is_valid(seq)`,
+    а если кадр нужно хранить дольше, его следует скопировать.
+
+    :Параметры:
+    - `name (str)` — Имя общей памяти (см. `SharedFramePublisher`).
+    - `timeout (float, необязательно)` — Сколько секунд ждать появления общей памяти; None — не ждать
+      (по умолчанию - None). Если памяти нет, вызывается FileNotFoundError.
+    - `poll (float, необязательно)` — Период опроса при ожидании новых кадров в секундах (по умолчанию - 0.002).
+
+    :Атрибуты:
+    - `n_slots (int)`, `max_detections (int)`, `slot_bytes (int)` — Параметры общей памяти.
+    - `n_dropped (int)` — Количество кадров, пропущенных потребителем `next_frame`.
+
+    :Методы:
+    - `seq(self) -> int` — Метод для получения номера последнего опубликованного кадра.
+    - `latest(self) -> tuple` — Метод для получения последнего кадра без копирования.
+    - `wait_frame(self, after_seq, timeout) -> tuple` — Метод для ожидания кадра новее указанного.
+    - `is_valid(self, seq) -> bool` — Метод для проверки, что кадр с номером `seq` еще не перезаписан.
+    - `next_frame(self, timeout) -> tuple` — Метод для получения следующего еще не выданного кадра.
+    - `frames(self, timeout)` — Генератор, выдающий каждый новый кадр один раз.
+    - `detections(self, seq) -> Optional[list]` — Метод для получения результатов распознавания кадра.
+    - `latest_detections(self) -> tuple` — Метод для получения последних опубликованных результатов распознавания.
+    - `close(self) -> None` — Метод для отключения от общей памяти.
+
+    """
+    def __init__(self, name: str, timeout: Optional[float] = None, poll: float = 0.002):
+        """
+        Конструктор класса.
+
+        Подключается к общей памяти и проверяет ее формат (ValueError, если формат не подходит).
+
+        """
+        deadline = time.monotonic() + (timeout or 0.0)
+        while True:
+            try:
+                self.__shm = self.__attach(name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        self.__buf = self.__shm.buf.toreadonly()
+        magic, version, self.n_slots, self.max_detections, self.slot_bytes, _, _ = RING.unpack_from(self.__buf)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Shared memory {name} is not a frame ring of version {VERSION}")
+        self.__frame_offset, self.__slot_size, _ = _layout(self.n_slots, self.max_detections, self.slot_bytes)
+        self.poll = poll
+        self.n_dropped = 0
+        self.__consumed_seq = 0
+
+    @staticmethod
+    def __attach(name: str) -> shared_memory.SharedMemory:
+        """
+        Приватный метод для подключения к существующей общей памяти.
+
+        До Python 3.13 подключение регистрирует память в `resource_tracker` читателя, который удалил бы ее
+        при завершении читателя, поэтому регистрация отменяется (кроме памяти писателя того же процесса:
+        у них общая регистрация).
+
+        """
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            if name not in _published:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+    def __slot(self, seq: int) -> int:
+        return _aligned(RING.size) + (seq % self.n_slots) * self.__slot_size
+
+    def seq(self) -> int:
+        """
+        Метод для получения номера последнего опубликованного кадра (0 — кадров еще не было).
+
+        """
+        return SEQ.unpack_from(self.__buf, _RING_SEQ)[0]
+
+    def latest(self) -> tuple:
+        """
+        Метод для получения последнего кадра без копирования.
+
+        Возвращает кортеж `(seq, frame, timestamp)`, где `timestamp` — время захвата кадра (`time.time()`).
+        Если кадров еще не было, возвращает `(0, None, 0.0)`.
+
+        """
+        while True:
+            seq = self.seq()
+            if seq == 0:
+                return 0, None, 0.0
+            offset = self.__slot(seq)
+            begin, end, timestamp, _, height, width, channels, _, dtype = SLOT.unpack_from(self.__buf, offset)
+            if begin == end == seq:
+                break
+            # Писатель уже перезаписывает слот: читатель отстал на целое кольцо, берется более новый кадр.
+        shape = (height, width, channels) if channels else (height, width)
+        frame = np.ndarray(shape, dtype=np.dtype(dtype.rstrip(b"\0").decode()), buffer=self.__buf,
+                           offset=offset + self.__frame_offset)
+        return seq, frame, timestamp
+
+    def wait_frame(self, after_seq: int, timeout=None) -> tuple:
+        """
+        Метод для ожидания кадра новее указанного.
+
+        Параметры:
+        - `after_seq` (int) — Номер последнего обработанного потребителем кадра.
+        - `timeout` (float, необязательно) — Максимальное время ожидания в секундах (по умолчанию - без ограничения).
+
+        Возвращает последний кадр без копирования в виде `(seq, frame, timestamp)`, как только его номер
+        больше `after_seq`. По истечении времени ожидания возвращает `(after_seq, None, 0.0)`.
+
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.seq() <= after_seq:
+            if deadline is not None and time.monotonic() >= deadline:
+                return after_seq, None, 0.0
+            time.sleep(self.poll)
+        return self.latest()
+
+    def is_valid(self, seq: int) -> bool:
+        """
+        Метод для проверки, что кадр с номером `seq`, полученный без копирования, еще не перезаписан.
+
+        """
+        return 0 < seq and self.seq() - seq < self.n_slots - 1 \
+            and SEQ.unpack_from(self.__buf, self.__slot(seq))[0] == seq
+
+    def next_frame(self, timeout=None) -> tuple:
+        """
+        Метод для получения следующего еще не выданного кадра.
+
+        Как `Camera.next_frame`: один и тот же кадр не выдается дважды, а кадры, пропущенные медленным
+        потребителем, учитываются в `n_dropped`.
+
+        """
+        seq, frame, timestamp = self.wait_frame(self.__consumed_seq, timeout)
+        if frame is not None:
+            self.n_dropped += max(0, seq - self.__consumed_seq - 1)
+            self.__consumed_seq = seq
+        return seq, frame, timestamp
+
+    def frames(self, timeout=None):
+        """
+        Генератор, выдающий каждый новый кадр один раз.
+
+        Выдает кортежи `(seq, frame, timestamp)` (см. `next_frame`). Завершается, если очередной кадр
+        не появился за `timeout` секунд.
+
+        """
+        while True:
+            seq, frame, timestamp = self.next_frame(timeout)
+            if frame is None:
+                return
+            yield seq, frame, timestamp
+
+    def detections(self, seq: int) -> Optional[list]:
+        """
+        Метод для получения результатов распознавания кадра.
+
+        Возвращает список объектов `Detection` в координатах кадра или None, если результаты для кадра
+        еще не опубликованы (или не будут: например, кадр пропущен проверкой движения) либо слот кадра
+        уже перезаписан.
+
+        """
+        offset = self.__slot(seq)
+        begin, _, _, detections_seq, _, _, _, n_detections, _ = SLOT.unpack_from(self.__buf, offset)
+        if begin != seq or detections_seq != seq:
+            return None
+        detections = []
+        for i in range(min(n_detections, self.max_detections)):
+            class_id, confidence, *box = protocol.DETECTION.unpack_from(
+                self.__buf, offset + _aligned(SLOT.size) + i * protocol.DETECTION.size)
+            detections.append(Detection(class_id, confidence, tuple(box)))
+        begin, _, _, detections_seq = SLOT.unpack_from(self.__buf, offset)[:4]
+        if begin != seq or detections_seq != seq:
+            return None
+        return detections
+
+    def latest_detections(self) -> tuple:
+        """
+        Метод для получения последних опубликованных результатов распознавания.
+
+        Возвращает кортеж `(seq, timestamp, detections)` для последнего кадра с результатами или
+        `(0, 0.0, None)`, если результатов еще не было или их слот уже перезаписан.
+
+        """
+        seq = SEQ.unpack_from(self.__buf, _RING_DETECTIONS_SEQ)[0]
+        detections = self.detections(seq) if seq else None
+        if detections is None:
+            return 0, 0.0, None
+        timestamp = SLOT.unpack_from(self.__buf, self.__slot(seq))[2]
+        return seq, timestamp, detections
+
+    def close(self) -> None:
+        """
+        Метод для отключения от общей памяти.
+
+        Кадры, полученные без копирования, должны быть удалены до вызова: пока они существуют, память
+        остается подключенной и освобождается вместе с ними.
+
+        """
+        try:
+            self.__buf.release()
+            self.__shm.close()
+        except BufferError:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monitor frames and detections published to shared memory")
+    parser.add_argument("name", help="имя общей памяти, например gesture_cam_0")
+    parser.add_argument("--timeout", type=float, default=10.0, help="сколько секунд ждать кадров")
+    args = parser.parse_args()
+    reader = SharedFrameReader(args.name, timeout=args.timeout)
+    started, n_frames = time.monotonic(), 0
+    for seq, frame, timestamp in reader.frames(timeout=args.timeout):
+        n_frames += 1
+        if time.monotonic() - started >= 1.0:
+            detections_seq, _, detections = reader.latest_detections()
+            print(json.dumps({
+                "seq": seq, "shape": list(frame.shape), "age_ms": round((time.time() - timestamp) * 1000, 1),
+                "fps": round(n_frames / (time.monotonic() - started), 1), "dropped": reader.n_dropped,
+                "detections_seq": detections_seq,
+                "detections": [d._asdict() for d in detections] if detections is not None else None,
+            }))
+            started, n_frames = time.monotonic(), 0
+        del frame
+    reader.close()
@@ -0,0 +1,298 @@
+import itertools
+import json
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import protocol
+from metrics import MetricsRegistry
+from pipeline import BoundedQueue
+
+
+class Event(NamedTuple):
+    """
+    Событие распознавания, отправляемое подписчикам.
+
+    :Атрибуты:
+    - `kind (str)` — Вид события: "detection" — объект, найденный на кадре, "command" — команда, пропущенная
+      фильтром жестов.
+    - `stream (int)` — Номер камеры.
+    - `seq (int)` — Номер кадра камеры.
+    - `timestamp (float)` — Время захвата кадра (`time.time()`).
+    - `class_name (str)` — Название класса жеста.
+    - `class_id (int)` — Номер класса жеста.
+    - `confidence (float)` — Уверенность модели.
+    - `box (tuple)` — Координаты рамки `(x1, y1, x2, y2)` в пикселях кадра.
+
+    """
+    kind: str
+    stream: int
+    seq: int
+    timestamp: float
+    class_name: str
+    class_id: int
+    confidence: float
+    box: tuple = (0.0, 0.0, 0.0, 0.0)
+
+    def to_json(self) -> str:
+        """
+        Возвращает событие в формате JSON.
+
+        """
+        return json.dumps({
+            "event": self.kind,
+            "stream": self.stream,
+            "seq": self.seq,
+            "timestamp": self.timestamp,
+            "class": self.class_name,
+            "confidence": round(float(self.confidence), 4),
+            "box": [round(float(v), 1) for v in self.box],
+        })
+
+    def encode(self, binary: bool = False) -> bytes:
+        """
+        Возвращает тело сообщения с событием: JSON в UTF-8 или, если `binary`, структуру `protocol.EVENT`.
+
+        """
+        if binary:
+            return protocol.pack_event(self.kind, self.stream, self.seq, self.timestamp, self.class_id,
+                                       self.confidence, self.box)
+        return self.to_json().encode("utf-8")
+
+
+class Subscriber:
+    """
+    Класс подписчика на события распознавания.
+
+    Подписчик получает события выбранных видов и классов не чаще `rate` событий в секунду: более частые
+    события пропускаются. Отобранные события ждут отправки в ограниченной очереди; если подписчик не успевает
+    их принимать и очередь заполнена, выбрасывается самое старое (или, при `drop_newest`, новое) событие.
+    Поэтому медленный подписчик не задерживает распознавание и других подписчиков.
+
+    :Параметры:
+    - `kinds (tuple, необязательно)` — Виды событий (по умолчанию - `("detection",)`).
+    - `classes (set, необязательно)` — Названия классов в нижнем регистре; None — все классы (по умолчанию - None).
+    - `rate (float, необязательно)` — Наибольшая частота событий в секунду; None — без ограничения
+      (по умолчанию - None).
+    - `maxsize (int, необязательно)` — Размер очереди событий (по умолчанию - 64).
+    - `drop_newest (bool, необязательно)` — Выбрасывать при заполненной очереди новое событие вместо самого
+      старого (по умолчанию - False).
+    - `binary (bool, необязательно)` — Отправлять события в двоичном виде (`protocol.pack_event`) вместо JSON
+      (по умолчанию - False).
+
+    :Атрибуты:
+    - `id (int)` — Номер подписки, присваивается `SubscriptionHub.subscribe`.
+    - `queue (BoundedQueue)` — Очередь событий, ожидающих отправки.
+    - `n_sent (int)` — Количество отправленных событий.
+    - `n_limited (int)` — Количество событий, пропущенных из-за ограничения частоты.
+    - `closed (bool)` — Флаг, указывающий, что подписка отменена.
+    - `on_put (Optional[Callable[[], None]])` — Функция, вызываемая после добавления события в очередь
+      (например, чтобы разбудить цикл событий asyncio).
+
+    :Методы:
+    - `parse(request, binary) -> Subscriber` — Метод класса для создания подписчика по команде `subscribe`.
+    - `offer(self, event) -> bool` — Метод для передачи события подписчику.
+    - `close(self) -> None` — Метод для отмены подписки.
+
+    """
+    def __init__(self, kinds: tuple = ("detection",), classes: Optional[set] = None, rate: Optional[float] = None,
+                 maxsize: int = 64, drop_newest: bool = False, binary: bool = False):
+        """
+        Конструктор класса.
+
+        """
+        self.id = 0
+        self.kinds = tuple(kinds)
+        self.classes = classes
+        self.rate = rate
+        self.drop_newest = drop_newest
+        self.binary = binary
+        self.queue = BoundedQueue(maxsize, drop_oldest=True)
+        self.n_sent = 0
+        self.n_limited = 0
+        self.closed = False
+        self.on_put: Optional[Callable[[], None]] = None
+        self.__next_allowed = 0.0
+
+    @classmethod
+    def parse(cls, request: str, binary: bool = False) -> "Subscriber":
+        """
+        Метод класса для создания подписчика по команде `subscribe`.
+
+        Формат команды: `subscribe [detections|commands|all] [CLASS ...] [rate=R] [queue=N] [drop=oldest|newest]`,
+        например `subscribe commands Forward Stop rate=2`. По умолчанию — все найденные объекты всех классов.
+        Если команда записана неверно, вызывает ValueError.
+
+        """
+        words = request.split()
+        if not words or words[0].lower() != "subscribe":
+            raise ValueError("not a subscribe command")
+        kinds, classes, options = ("detection",), set(), {}
+        for word in words[1:]:
+            if "=" in word:
+                key, value = word.split("=", 1)
+                options[key.lower()] = value
+            elif word.lower() in ("detections", "commands", "all"):
+                kinds = {"detections": ("detection",), "commands": ("command",),
+                         "all": ("detection", "command")}[word.lower()]
+            else:
+                classes.add(word.lower())
+        unknown = set(options) - {"rate", "queue", "drop"}
+        if unknown:
+            raise ValueError(f"Unknown subscribe options: {', '.join(sorted(unknown))}")
+        if options.get("drop", "oldest") not in ("oldest", "newest"):
+            raise ValueError("drop must be 'oldest' or 'newest'")
+        rate = float(options["rate"]) if "rate" in options else None
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        return cls(kinds, classes or None, rate, int(options.get("queue", 64)),
+                   options.get("drop") == "newest", binary)
+
+    def offer(self, event: Event) -> bool:
+        """
+        Метод для передачи события подписчику.
+
+        Возвращает True, если событие поставлено в очередь.
+
+        """
+        if self.closed or event.kind not in self.kinds:
+            return False
+        if self.classes is not None and event.class_name.lower() not in self.classes:
+            return False
+        if self.rate is not None:
+            now = time.monotonic()
+            if now < self.__next_allowed:
+                self.n_limited += 1
+                return False
+            self.__next_allowed = now + 1.0 / self.rate
+        if self.drop_newest and self.queue.depth() >= self.queue.maxsize:
+            self.queue.n_dropped += 1
+            return False
+        self.queue.put(event)
+        if self.on_put is not None:
+            self.on_put()
+        return True
+
+    def close(self) -> None:
+        """
+        Метод для отмены подписки.
+
+        Пробуждает поток, ожидающий событий в `queue`.
+
+        """
+        self.closed = True
+        self.queue.close()
+        if self.on_put is not None:
+            self.on_put()
+
+
+class SubscriptionHub:
+    """
+    Класс набора подписок на события распознавания.
+
+    Сервис публикует события методом `publish`, и каждое событие передается всем подходящим подписчикам
+    (`Subscriber.offer`). Отправку событий клиентам выполняет сервер (см. команду `subscribe` в `Service`).
+
+    :Параметры:
+    - `metrics (MetricsRegistry, необязательно)` — Набор метрик, в который записываются количество подписчиков
+      (`subscribers`), опубликованных (`events_published_total`) и отправленных подписчикам
+      (`subscriber_events_sent`) событий и событий, выброшенных из очередей подписчиков
+      (`subscriber_events_dropped`) (по умолчанию - собственный набор).
+
+    :Методы:
+    - `subscribe(self, subscriber) -> Subscriber` — Метод для добавления подписчика.
+    - `unsubscribe(self, subscription_id) -> bool` — Метод для отмены подписки.
+    - `publish(self, event) -> int` — Метод для передачи события подписчикам.
+    - `close(self) -> None` — Метод для отмены всех подписок.
+    - `stats(self) -> list` — Метод для получения состояния подписок.
+
+    """
+    def __init__(self, metrics: Optional[MetricsRegistry] = None):
+        """
+        Конструктор класса.
+
+        """
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self.__subscribers = {}
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__published = metrics.counter("events_published_total", "Events published to subscribers")
+        self.__dropped = 0
+        self.__sent = 0
+        metrics.gauge("subscribers", "Active subscriptions", lambda: len(self.__subscribers))
+        metrics.gauge("subscriber_events_sent", "Events sent to subscribers", lambda: self.__sent + sum(
+            subscriber.n_sent for subscriber in list(self.__subscribers.values())))
+        metrics.gauge("subscriber_events_dropped", "Events dropped from full subscriber queues",
+                      lambda: self.__dropped + sum(
+                          subscriber.queue.n_dropped for subscriber in list(self.__subscribers.values())))
+
+    def __len__(self) -> int:
+        return len(self.__subscribers)
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        """
+        Метод для добавления подписчика.
+
+        Присваивает подписчику номер и возвращает его.
+
+        """
+        with self.__lock:
+            subscriber.id = next(self.__ids)
+            self.__subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscription_id: int) -> bool:
+        """
+        Метод для отмены подписки.
+
+        Возвращает False, если подписки с таким номером нет.
+
+        """
+        with self.__lock:
+            subscriber = self.__subscribers.pop(subscription_id, None)
+            if subscriber is not None:
+                self.__sent += subscriber.n_sent
+                self.__dropped += subscriber.queue.n_dropped
+        if subscriber is None:
+            return False
+        subscriber.close()
+        return True
+
+    def publish(self, event: Event) -> int:
+        """
+        Метод для передачи события подписчикам.
+
+        Не блокируется. Возвращает количество подписчиков, которым событие поставлено в очередь.
+
+        """
+        if not self.__subscribers:
+            return 0
+        self.__published.inc()
+        return sum(subscriber.offer(event) for subscriber in list(self.__subscribers.values()))
+
+    def close(self) -> None:
+        """
+        Метод для отмены всех подписок.
+
+        """
+        for subscription_id in list(self.__subscribers):
+            self.unsubscribe(subscription_id)
+
+    def stats(self) -> list:
+        """
+        Метод для получения состояния подписок.
+
+        Возвращает для каждой подписки номер, виды и классы событий, ограничение частоты, длину очереди
+        и количество отправленных, выброшенных и пропущенных из-за ограничения частоты событий.
+
+        """
+        return [{
+            "id": subscriber.id,
+            "kinds": list(subscriber.kinds),
+            "classes": sorted(subscriber.classes) if subscriber.classes is not None else None,
+            "rate": subscriber.rate,
+            "queue_depth": subscriber.queue.depth(),
+            "sent": subscriber.n_sent,
+            "dropped": subscriber.queue.n_dropped,
+            "rate_limited": subscriber.n_limited,
+        } for subscriber in list(self.__subscribers.values())]
@@ -0,0 +1,153 @@
+"""
+Тесты кольцевого буфера камеры (`Camera`) на управляемом объекте захвата кадров.
+"""
+import threading
+import time
+
+import numpy as np
+
+from cam import Camera
+
+
+class _Capture:
+    """
+    Объект захвата, выдающий кадр на каждый вызов `allow`; кадр номер `n` заполнен значением `n`.
+    С `n_frames` после стольких кадров кадры заканчиваются (`finished`), с `fail` чтение всегда неудачно.
+
+    """
+    def __init__(self, n_frames=None, fail=False):
+        self.allowed = threading.Semaphore(0)
+        self.n_frames = n_frames
+        self.fail = fail
+        self.n_read = 0
+        self.released = False
+        self.stopped = False
+        if n_frames is not None:
+            self.finished = False
+
+    def allow(self, n=1):
+        for _ in range(n):
+            self.allowed.release()
+
+    def read(self, image=None):
+        if self.fail:
+            return False, None
+        if self.n_frames is not None and self.n_read >= self.n_frames:
+            self.finished = True
+            return False, None
+        while not self.allowed.acquire(timeout=0.05):
+            if self.stopped:
+                return False, None
+        self.n_read += 1
+        if image is None:
+            image = np.empty((4, 4, 3), dtype=np.uint8)
+        image[...] = self.n_read
+        return True, image
+
+    def release(self):
+        self.released = True
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def _close(camera, capture):
+    capture.stopped = True
+    camera.release()
+
+
+def test_frames_are_numbered_and_buffers_reused():
+    capture = _Capture()
+    camera = Camera(capture, buffer_size=3)
+    try:
+        assert camera.latest() == (0, None, 0.0)
+        capture.allow()
+        seq, frame, timestamp = camera.wait_frame(0, timeout=5)
+        assert seq == 1 and frame[0, 0, 0] == 1 and timestamp > 0
+        capture.allow(3)
+        assert _wait(lambda: camera.seq == 4)
+        seq, reused, _ = camera.latest()
+        assert seq == 4 and reused[0, 0, 0] == 4
+        # Кадр 4 записан в ту же ячейку кольца, что и кадр 1, без выделения нового массива.
+        assert reused is frame
+    finally:
+        _close(camera, capture)
+    assert capture.released
+
+
+def test_is_valid_ring_semantics():
+    capture = _Capture()
+    camera = Camera(capture, buffer_size=4)
+    try:
+        assert not camera.is_valid(0)
+        capture.allow()
+        assert _wait(lambda: camera.seq == 1)
+        assert camera.is_valid(1)
+        capture.allow(2)
+        assert _wait(lambda: camera.seq == 3)
+        # Поток чтения уже может писать в следующую ячейку, поэтому валидны `buffer_size - 1` последних кадров.
+        assert [camera.is_valid(seq) for seq in (1, 2, 3)] == [True, True, True]
+        capture.allow()
+        assert _wait(lambda: camera.seq == 4)
+        assert [camera.is_valid(seq) for seq in (1, 2, 3, 4)] == [False, True, True, True]
+    finally:
+        _close(camera, capture)
+
+
+def test_next_frame_counts_dropped_frames():
+    capture = _Capture()
+    camera = Camera(capture, buffer_size=8)
+    try:
+        capture.allow()
+        assert camera.next_frame(timeout=5)[0] == 1
+        capture.allow(3)
+        assert _wait(lambda: camera.seq == 4)
+        assert camera.next_frame(timeout=5)[0] == 4
+        assert camera.n_dropped == 2
+        assert camera.next_frame(timeout=0.05) == (4, None, 0.0)
+    finally:
+        _close(camera, capture)
+
+
+def test_on_frame_callback():
+    capture = _Capture()
+    seen = []
+    camera = Camera(capture, on_frame=seen.append)
+    try:
+        capture.allow(3)
+        assert _wait(lambda: len(seen) == 3)
+        assert seen == [1, 2, 3]
+    finally:
+        _close(camera, capture)
+
+
+def test_finite_source_ends_reader_thread():
+    capture = _Capture(n_frames=2)
+    camera = Camera(capture, buffer_size=4)
+    capture.allow(2)
+    started = time.monotonic()
+    frames = [seq for seq, _, _ in camera.frames(timeout=5)]
+    assert time.monotonic() - started < 2
+    assert frames[-1] == 2
+    assert camera.finished
+    assert _wait(lambda: capture.released)
+    assert camera.wait_frame(2, timeout=5) == (2, None, 0.0)
+    camera.release()
+
+
+def test_read_failures_back_off():
+    capture = _Capture(fail=True)
+    camera = Camera(capture, reopen_after=1000)
+    try:
+        time.sleep(0.5)
+        assert not camera.finished
+        # Без паузы между попытками за 0,5 с было бы около 50 неудач.
+        assert 0 < camera.n_read_errors < 12
+    finally:
+        camera.release()
@@ -0,0 +1,70 @@
+"""
+Тесты сглаживания результатов распознавания жестов (`GestureFilter`).
+"""
+from gesture_filter import GestureFilter
+
+
+def _feed(gesture_filter, results, start=0.0, step=0.1):
+    """
+    Передает фильтру результаты кадров с шагом `step` секунд и возвращает ответы фильтра.
+
+    """
+    return [gesture_filter.update(result, confidence, now=start + i * step)
+            for i, (result, confidence) in enumerate(results)]
+
+
+def test_command_needs_consecutive_frames():
+    gesture_filter = GestureFilter(window=5, min_consecutive=3, resend_interval=None)
+    assert _feed(gesture_filter, [("Forward", 0.9)] * 3) == [None, None, "Forward"]
+    assert gesture_filter.last_command == "Forward"
+    assert gesture_filter.n_frames == 3
+    assert gesture_filter.n_emitted == 1
+
+
+def test_flicker_is_suppressed():
+    gesture_filter = GestureFilter(window=5, min_consecutive=3)
+    results = [("Forward", 0.9), ("Left", 0.9)] * 5
+    assert _feed(gesture_filter, results) == [None] * 10
+    assert gesture_filter.n_emitted == 0
+
+
+def test_low_confidence_counts_as_no_gesture():
+    gesture_filter = GestureFilter(min_confidence=0.5, min_consecutive=2)
+    assert _feed(gesture_filter, [("Stop", 0.4)] * 5) == [None] * 5
+    assert _feed(gesture_filter, [("Stop", 0.6)] * 2, start=1.0)[-1] is None
+    assert gesture_filter.update("Stop", 0.6, now=2.0) == "Stop"
+
+
+def test_held_gesture_is_resent_after_interval():
+    gesture_filter = GestureFilter(window=5, min_consecutive=3, resend_interval=1.0)
+    responses = _feed(gesture_filter, [("Forward", 0.9)] * 15, step=0.1)
+    assert [i for i, command in enumerate(responses) if command is not None] == [2, 12]
+
+
+def test_held_gesture_without_resend_is_sent_once():
+    gesture_filter = GestureFilter(resend_interval=None)
+    responses = _feed(gesture_filter, [("Forward", 0.9)] * 50)
+    assert responses.count("Forward") == 1
+
+
+def test_gesture_change_emits_new_command():
+    gesture_filter = GestureFilter(window=5, majority=0.6, min_consecutive=3, resend_interval=None)
+    responses = _feed(gesture_filter, [("Forward", 0.9)] * 5 + [("Stop", 0.9)] * 5)
+    assert [command for command in responses if command is not None] == ["Forward", "Stop"]
+
+
+def test_gesture_shown_again_after_release_is_sent_again():
+    gesture_filter = GestureFilter(window=5, min_consecutive=3, resend_interval=None)
+    results = [("Forward", 0.9)] * 5 + [(None, 0.0)] * 5 + [("Forward", 0.9)] * 5
+    responses = _feed(gesture_filter, results)
+    assert responses.count("Forward") == 2
+    assert responses[5:10] == [None] * 5
+
+
+def test_reset_clears_state():
+    gesture_filter = GestureFilter(min_consecutive=2, resend_interval=None)
+    _feed(gesture_filter, [("Forward", 0.9)] * 3)
+    gesture_filter.reset()
+    assert gesture_filter.last_command is None
+    assert gesture_filter.n_frames == 0
+    assert _feed(gesture_filter, [("Forward", 0.9)] * 2) == [None, "Forward"]
@@ -0,0 +1,99 @@
+"""
+Тесты разбора выхода YOLOv8 в `OnnxRuntimeBackend` (`_letterbox`, `_decode`) и подавления немаксимумов (`nms`).
+"""
+import numpy as np
+
+from inference import Detection, OnnxRuntimeBackend, nms
+
+
+def _backend(conf=0.25, iou=0.7, max_det=300, imgsz=(640, 640), dynamic_shape=False):
+    """
+    Возвращает механизм выполнения без сессии ONNX Runtime: для разбора выхода она не нужна.
+
+    """
+    backend = OnnxRuntimeBackend.__new__(OnnxRuntimeBackend)
+    backend.conf, backend.iou, backend.max_det = conf, iou, max_det
+    backend.imgsz, backend.dynamic_shape = imgsz, dynamic_shape
+    return backend
+
+
+def _output(candidates, n_classes=3):
+    """
+    Собирает выход модели `(4 + n_classes, N)` из кандидатов `(cx, cy, w, h, class_id, score)`.
+
+    """
+    output = np.zeros((4 + n_classes, len(candidates)), dtype=np.float32)
+    for i, (cx, cy, w, h, class_id, score) in enumerate(candidates):
+        output[:4, i] = (cx, cy, w, h)
+        output[4 + class_id, i] = score
+    return output
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [0, 0, 10, 9]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.5, 0.8], dtype=np.float32)
+    keep = nms(boxes, scores, 0.5)
+    assert keep.tolist() == [1, 2]
+
+
+def test_nms_threshold_and_order():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [100, 100, 110, 110]], dtype=np.float32)
+    scores = np.array([0.5, 0.7, 0.9], dtype=np.float32)
+    # IoU первых двух рамок равна 1/3.
+    assert nms(boxes, scores, 0.3).tolist() == [2, 1]
+    assert nms(boxes, scores, 0.4).tolist() == [2, 1, 0]
+    assert nms(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), 0.5).tolist() == []
+
+
+def test_decode_filters_confidence_and_maps_to_frame():
+    backend = _backend(conf=0.25)
+    output = _output([
+        (320, 320, 100, 50, 1, 0.9),
+        (100, 100, 20, 20, 0, 0.2),
+    ])
+    # Кадр 1280x720 уменьшен вдвое и дополнен полями по 140 пикселей сверху и снизу.
+    detections = backend._decode(output, 0.5, (0, 140), (720, 1280, 3))
+    assert len(detections) == 1
+    detection = detections[0]
+    assert detection.class_id == 1
+    assert abs(detection.confidence - 0.9) < 1e-6
+    assert np.allclose(detection.box, (540.0, 310.0, 740.0, 410.0))
+
+
+def test_decode_suppresses_within_class_only():
+    backend = _backend(iou=0.5)
+    output = _output([
+        (100, 100, 50, 50, 0, 0.9),
+        (102, 102, 50, 50, 0, 0.8),
+        (102, 102, 50, 50, 2, 0.7),
+    ])
+    detections = backend._decode(output, 1.0, (0, 0), (640, 640, 3))
+    assert [(d.class_id, round(d.confidence, 2)) for d in detections] == [(0, 0.9), (2, 0.7)]
+
+
+def test_decode_clips_boxes_and_limits_count():
+    backend = _backend(max_det=1)
+    output = _output([(5, 5, 20, 20, 0, 0.9), (600, 600, 100, 100, 1, 0.8)])
+    detections = backend._decode(output, 1.0, (0, 0), (620, 630, 3))
+    assert detections == [Detection(0, detections[0].confidence, (0.0, 0.0, 15.0, 15.0))]
+    assert backend._decode(_output([]), 1.0, (0, 0), (640, 640, 3)) == []
+
+
+def test_letterbox_keeps_aspect_ratio():
+    backend = _backend(imgsz=(640, 640))
+    blob, ratio, pad = backend._letterbox(np.zeros((720, 1280, 3), dtype=np.uint8))
+    assert blob.shape == (1, 3, 640, 640) and blob.dtype == np.float32
+    assert ratio == 0.5
+    assert pad == (0, 140)
+    # Поля заполнены серым (114), сам кадр — черным.
+    assert np.isclose(blob[0, 0, 0, 0], 114 / 255) and blob[0, 0, 320, 320] == 0.0
+
+
+def test_letterbox_uses_requested_size_for_dynamic_models():
+    backend = _backend(imgsz=(640, 640), dynamic_shape=True)
+    blob, ratio, pad = backend._letterbox(np.zeros((240, 320, 3), dtype=np.uint8), imgsz=320)
+    assert blob.shape == (1, 3, 320, 320)
+    assert ratio == 1.0
+    assert pad == (0, 40)
+    static = _backend(imgsz=(640, 640))
+    assert static._letterbox(np.zeros((240, 320, 3), dtype=np.uint8), imgsz=320)[0].shape == (1, 3, 640, 640)
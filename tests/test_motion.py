@@ -0,0 +1,59 @@
+"""
+Тесты проверки движения перед распознаванием (`MotionGate`).
+"""
+import numpy as np
+
+from motion import MotionGate
+
+
+def _frame(value=0, box=None):
+    frame = np.full((240, 320, 3), value, dtype=np.uint8)
+    if box is not None:
+        x1, y1, x2, y2 = box
+        frame[y1:y2, x1:x2] = 255
+    return frame
+
+
+def test_first_frame_is_always_inferred():
+    gate = MotionGate()
+    assert gate.should_infer(_frame(), now=0.0)
+    assert gate.n_inferred == 1
+
+
+def test_static_scene_is_skipped_until_max_interval():
+    gate = MotionGate(max_interval=0.5, hold=1.0)
+    gate.should_infer(_frame(), now=0.0)
+    assert [gate.should_infer(_frame(), now=t) for t in (0.1, 0.2, 0.4)] == [False, False, False]
+    assert gate.should_infer(_frame(), now=0.5)
+    assert gate.n_skipped == 3
+    assert gate.n_inferred == 2
+    assert gate.last_motion == 0.0
+
+
+def test_motion_is_inferred_and_held():
+    gate = MotionGate(threshold=0.01, max_interval=10.0, hold=1.0)
+    gate.should_infer(_frame(), now=0.0)
+    assert gate.should_infer(_frame(box=(100, 80, 200, 160)), now=0.1)
+    assert gate.last_motion > 0.01
+    # Жест удерживается неподвижно: кадры распознаются в течение `hold` секунд после движения.
+    assert gate.should_infer(_frame(box=(100, 80, 200, 160)), now=0.6)
+    assert gate.last_motion == 0.0
+    assert not gate.should_infer(_frame(box=(100, 80, 200, 160)), now=1.2)
+
+
+def test_small_changes_below_threshold_are_ignored():
+    gate = MotionGate(threshold=0.05, pixel_delta=25, max_interval=10.0, hold=0.0)
+    gate.should_infer(_frame(100), now=0.0)
+    # Равномерное изменение яркости меньше `pixel_delta` (шум, автоэкспозиция) — не движение.
+    assert not gate.should_infer(_frame(120), now=0.1)
+    # Изменилось около 1% пикселей — меньше порога.
+    assert not gate.should_infer(_frame(100, box=(0, 0, 32, 24)), now=0.2)
+
+
+def test_reset_forces_inference():
+    gate = MotionGate(max_interval=10.0)
+    gate.should_infer(_frame(), now=0.0)
+    assert not gate.should_infer(_frame(), now=0.1)
+    gate.reset()
+    assert gate.n_skipped == 0
+    assert gate.should_infer(_frame(), now=0.2)
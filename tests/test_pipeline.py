@@ -0,0 +1,113 @@
+"""
+Тесты ограниченной очереди (`BoundedQueue`) и конвейера стадий (`Pipeline`).
+"""
+import threading
+import time
+
+from metrics import MetricsRegistry
+from pipeline import BoundedQueue, Pipeline
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_bounded_queue_drops_oldest():
+    queue = BoundedQueue(2)
+    for item in range(5):
+        assert queue.put(item)
+    assert queue.n_dropped == 3
+    assert queue.max_depth == 2
+    assert queue.get(timeout=0) == (True, 3)
+    assert queue.get(timeout=0) == (True, 4)
+    assert queue.get(timeout=0) == (False, None)
+
+
+def test_bounded_queue_blocks_when_not_dropping():
+    queue = BoundedQueue(1, drop_oldest=False)
+    queue.put("first")
+    done = threading.Event()
+    threading.Thread(target=lambda: (queue.put("second"), done.set()), daemon=True).start()
+    assert not done.wait(0.1)
+    assert queue.get(timeout=1) == (True, "first")
+    assert done.wait(1)
+    assert queue.get(timeout=1) == (True, "second")
+    assert queue.n_dropped == 0
+
+
+def test_bounded_queue_close_wakes_waiters():
+    queue = BoundedQueue(1)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(queue.get()))
+    thread.start()
+    queue.close()
+    thread.join(timeout=1)
+    assert result == [(False, None)]
+    assert not queue.put("late")
+
+
+def test_pipeline_runs_stages_in_order():
+    results = []
+    pipeline = Pipeline([
+        ("double", lambda x: x * 2, 16, False),
+        ("skip_odd", lambda x: x if x % 4 == 0 else None, 16, False),
+        ("collect", results.append, 16, False),
+    ])
+    try:
+        for item in range(6):
+            assert pipeline.submit(item)
+        assert _wait(lambda: len(results) == 3)
+        assert results == [0, 4, 8]
+        stats = pipeline.stats()
+        assert stats["double"]["processed"] == 6
+        assert stats["collect"]["processed"] == 3
+    finally:
+        pipeline.close()
+
+
+def test_pipeline_stage_error_skips_item_and_keeps_running():
+    results = []
+
+    def fail_on_two(x):
+        if x == 2:
+            raise RuntimeError("bad item")
+        return x
+
+    pipeline = Pipeline([("check", fail_on_two, 8, False), ("collect", results.append, 8, False)])
+    try:
+        for item in range(4):
+            pipeline.submit(item)
+        assert _wait(lambda: len(results) == 3)
+        assert results == [0, 1, 3]
+        assert pipeline.stats()["check"]["processed"] == 3
+    finally:
+        pipeline.close()
+
+
+def test_pipeline_drops_oldest_when_stage_is_slow():
+    release = threading.Event()
+    results = []
+
+    def slow(x):
+        release.wait(5)
+        return x
+
+    metrics = MetricsRegistry()
+    pipeline = Pipeline([("slow", slow, 2, True), ("collect", results.append, 8, False)], metrics=metrics)
+    try:
+        pipeline.submit(0)
+        assert _wait(lambda: pipeline.stats()["slow"]["queue_depth"] == 0)
+        for item in range(1, 6):
+            pipeline.submit(item)
+        release.set()
+        assert _wait(lambda: len(results) == 3)
+        assert results == [0, 4, 5]
+        assert pipeline.stats()["slow"]["dropped"] == 3
+        assert metrics.as_dict()["pipeline_dropped"] == {"stage=slow": 3, "stage=collect": 0}
+    finally:
+        pipeline.close()
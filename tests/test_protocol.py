@@ -0,0 +1,63 @@
+"""
+Тесты кадрирования и сообщений протокола обеих версий (`protocol`).
+"""
+import pytest
+
+import protocol
+
+
+def test_pop_frame_waits_for_complete_message():
+    frame = protocol.pack_frame(b"stats")
+    buffer = bytearray(frame[:6])
+    assert protocol.pop_frame(buffer) is None
+    assert protocol.pop_frame(bytearray(frame[:3])) is None
+    buffer.extend(frame[6:])
+    assert protocol.pop_frame(buffer) == b"stats"
+    assert buffer == bytearray()
+
+
+def test_pop_frame_keeps_pipelined_messages():
+    buffer = bytearray(protocol.pack_frame(b"enable") + protocol.pack_frame(b"") + protocol.pack_frame(b"st"))
+    assert protocol.pop_frame(buffer) == b"enable"
+    assert protocol.pop_frame(buffer) == b""
+    assert protocol.pop_frame(buffer) == b"st"
+    assert protocol.pop_frame(buffer) is None
+
+
+def test_v1_and_v2_are_told_apart_by_first_byte():
+    v2 = protocol.pop_frame(bytearray(protocol.pack_message(protocol.MSG_REQUEST, 7, b"ping")))
+    assert protocol.is_v2(v2)
+    assert not protocol.is_v2("привет".encode("utf-8"))
+    assert not protocol.is_v2(b"")
+    assert not protocol.is_v2(v2[:protocol.HEADER.size - 1])
+
+
+def test_message_round_trip():
+    payload = protocol.pop_frame(bytearray(
+        protocol.pack_message(protocol.MSG_RESPONSE, 2 ** 32 - 1, "готово".encode("utf-8"), protocol.FLAG_BINARY)))
+    message = protocol.unpack_message(payload)
+    assert message == protocol.Message(protocol.MSG_RESPONSE, 2 ** 32 - 1, protocol.FLAG_BINARY,
+                                       "готово".encode("utf-8"))
+
+
+def test_unpack_message_rejects_v1_and_unknown_version():
+    with pytest.raises(ValueError):
+        protocol.unpack_message(b"ping")
+    payload = bytes([protocol.MAGIC, protocol.VERSION + 1, protocol.MSG_REQUEST, 0]) + b"\0\0\0\1"
+    with pytest.raises(ValueError):
+        protocol.unpack_message(payload)
+
+
+def test_detections_round_trip():
+    detections = [(3, 0.5, (1.0, 2.0, 30.5, 40.25)), (0, 0.875, (0.0, 0.0, 640.0, 480.0))]
+    body = protocol.pack_detections(2, 1700000000.25, detections)
+    assert len(body) == protocol.DETECTIONS_HEADER.size + 2 * protocol.DETECTION.size
+    assert protocol.unpack_detections(body) == (2, 1700000000.25, detections)
+    assert protocol.unpack_detections(protocol.pack_detections(0, 0.0, [])) == (0, 0.0, [])
+
+
+def test_event_round_trip():
+    body = protocol.pack_event("command", 1, 42, 1700000000.5, 6, 0.75, (1.0, 2.0, 3.0, 4.0))
+    assert protocol.unpack_event(body) == ("command", 1, 42, 1700000000.5, 6, 0.75, (1.0, 2.0, 3.0, 4.0))
+    with pytest.raises(ValueError):
+        protocol.pack_event("unknown", 0, 0, 0.0, 0, 0.0, (0, 0, 0, 0))
@@ -0,0 +1,86 @@
+"""
+Тесты области интереса кадра (`RegionOfInterest`).
+"""
+import numpy as np
+
+from inference import Detection
+from roi import RegionOfInterest
+
+
+def _frame(width=640, height=480):
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def test_crop_default_region_is_left_half_without_copy():
+    frame = _frame()
+    region, offset, bounds = RegionOfInterest().crop(frame)
+    assert region.shape == (480, 320, 3)
+    assert np.shares_memory(region, frame)
+    assert offset == (0, 0)
+    assert bounds == (0, 0, 320, 480)
+
+
+def test_update_maps_boxes_to_frame_coordinates():
+    roi = RegionOfInterest(region=(0.5, 0.25, 1.0, 1.0))
+    _, offset, _ = roi.crop(_frame())
+    assert offset == (320, 120)
+    detections = roi.update([Detection(1, 0.9, (10.0, 20.0, 30.0, 40.0))], offset)
+    assert detections == [Detection(1, 0.9, (330.0, 140.0, 350.0, 160.0))]
+    assert roi.box is None
+
+
+def test_input_size_follows_crop():
+    roi = RegionOfInterest(region=(0.0, 0.0, 1.0, 1.0), min_input=320, max_input=640)
+    roi.crop(_frame(200, 100))
+    assert roi.input_size() == 320
+    roi.crop(_frame(500, 300))
+    assert roi.input_size() == 512
+    roi.crop(_frame(1920, 1080))
+    assert roi.input_size() == 640
+
+
+def test_adaptive_region_follows_hand_within_bounds():
+    roi = RegionOfInterest(adaptive=True, margin=0.5, min_input=128)
+    frame = _frame(1280, 720)
+    _, offset, bounds = roi.crop(frame)
+    roi.update([Detection(0, 0.9, (100.0, 100.0, 180.0, 200.0))], offset, bounds)
+    x0, y0, x1, y1 = roi.box
+    assert (x0, y0) == (40, 50)
+    assert (x1, y1) == (240, 250)
+
+    region, offset, _ = roi.crop(frame)
+    assert region.shape[:2] == (200, 200)
+    assert offset == (40, 50)
+    assert roi.n_tracked == 1
+
+    # Рамка у края основной области: область слежения не выходит за ее границы.
+    roi.update([Detection(0, 0.9, (10.0, 10.0, 150.0, 150.0))], offset, bounds)
+    x0, y0, x1, y1 = roi.box
+    assert x0 >= bounds[0] and y0 >= bounds[1] and x1 <= bounds[2] and y1 <= bounds[3]
+
+
+def test_update_uses_offset_of_its_own_crop():
+    roi = RegionOfInterest(region=(0.0, 0.0, 1.0, 1.0), adaptive=True, min_input=64)
+    frame = _frame()
+    _, first_offset, first_bounds = roi.crop(frame)
+    roi.update([Detection(0, 0.9, (300.0, 200.0, 340.0, 260.0))], first_offset, first_bounds)
+    _, second_offset, _ = roi.crop(frame)
+    assert second_offset != first_offset
+    # Результаты первого среза приходят после того, как вырезан второй.
+    mapped = roi.update([Detection(0, 0.9, (1.0, 2.0, 3.0, 4.0))], first_offset, first_bounds)
+    assert mapped[0].box == (1.0, 2.0, 3.0, 4.0)
+
+
+def test_adaptive_region_returns_after_misses():
+    roi = RegionOfInterest(adaptive=True, max_misses=2, min_input=64)
+    _, offset, bounds = roi.crop(_frame())
+    roi.update([Detection(0, 0.9, (100.0, 100.0, 140.0, 140.0))], offset, bounds)
+    assert roi.box is not None
+    roi.update([], offset, bounds)
+    assert roi.box is not None
+    roi.update([], offset, bounds)
+    assert roi.box is None
+    roi.update([Detection(0, 0.9, (100.0, 100.0, 140.0, 140.0))], offset, bounds)
+    roi.reset()
+    assert roi.box is None
+    assert roi.crop(_frame())[1] == (0, 0)
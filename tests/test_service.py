@@ -0,0 +1,221 @@
+"""
+Сквозные тесты сервисов `Service` и `AsyncService` на заглушках из `bench_common` по протоколам версий 1 и 2.
+"""
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import protocol
+from bench_common import AsyncStubService, StubService, free_port, send_request, wait_listening
+from client import MultiplexClient, ServiceClient
+from subscription import Event
+
+IP = "127.0.0.1"
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _is_open(sock):
+    sock.setblocking(False)
+    try:
+        return sock.recv(1) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.setblocking(True)
+
+
+def _event(seq):
+    return Event("detection", 0, seq, time.time(), "Forward", 0, 0.9)
+
+
+def _start(cls, attributes=None, **kwargs):
+    port = free_port()
+    service = cls(ip_=IP, port_=port, **kwargs)
+    for name, value in (attributes or {}).items():
+        setattr(service, name, value)
+    threading.Thread(target=service.start, daemon=True).start()
+    wait_listening(IP, port)
+    return service, port
+
+
+@pytest.fixture(params=[StubService, AsyncStubService], ids=["Service", "AsyncService"])
+def service_cls(request):
+    return request.param
+
+
+@pytest.fixture
+def service(service_cls):
+    service, port = _start(service_cls)
+    yield service, port
+    assert service.shutdown(10)
+
+
+def test_enable_disable_v1(service):
+    service, port = service
+    with ServiceClient(IP, port) as client:
+        assert client.request("disable") == "disable success"
+        assert not service.need_job_pause
+        assert client.request("enable") == "enable success"
+        assert service.need_job_pause
+        # Прочие запросы передаются обработчику `_request_handler`.
+        assert client.request("echo") == "echo"
+    assert send_request(IP, port, "disable") == "disable success"
+    assert not service.need_job_pause
+
+
+def test_enable_disable_v2(service):
+    service, port = service
+    with MultiplexClient(IP, port) as client:
+        assert client.request("disable") == "disable success"
+        assert not service.need_job_pause
+        futures = [client.submit(f"echo {i}") for i in range(5)]
+        assert client.request("enable") == "enable success"
+        assert service.need_job_pause
+        assert [future.result(5).body.decode("utf-8") for future in futures] == [f"echo {i}" for i in range(5)]
+
+
+def test_stats_v1_and_v2(service):
+    service, port = service
+    with MultiplexClient(IP, port) as client:
+        client.subscribe("subscribe commands Forward rate=2", lambda event: None)
+        stats = json.loads(client.request("stats"))
+    assert stats["subscriptions"][0]["kinds"] == ["command"]
+    assert stats["subscriptions"][0]["classes"] == ["forward"]
+    assert stats["request_errors_total"] == 0
+    stats = json.loads(send_request(IP, port, "stats"))
+    assert "subscriptions" in stats
+    assert "idle_connections_evicted_total" in stats
+    assert "# TYPE" in send_request(IP, port, "stats prometheus")
+
+
+def test_subscribe_unsubscribe_v1(service):
+    service, port = service
+    with ServiceClient(IP, port) as client:
+        subscription_id = client.subscribe("subscribe")
+        assert _wait(lambda: len(service.subscriptions.stats()) == 1)
+        service.subscriptions.publish(_event(1))
+        event = client.next_event(5)
+        assert (event["event"], event["seq"], event["class"]) == ("detection", 1, "Forward")
+        assert send_request(IP, port, f"unsubscribe {subscription_id}") == "unsubscribe success"
+        assert send_request(IP, port, f"unsubscribe {subscription_id}") == \
+            f"unsubscribe error: no subscription {subscription_id}"
+    assert _wait(lambda: service.subscriptions.stats() == [])
+
+
+def test_subscribe_unsubscribe_v2(service):
+    service, port = service
+    events = []
+    with MultiplexClient(IP, port) as client:
+        subscription_id = client.subscribe("subscribe", events.append)
+        service.subscriptions.publish(_event(1))
+        assert _wait(lambda: len(events) == 1)
+        assert events[0]["seq"] == 1
+        assert client.request(f"unsubscribe {subscription_id}") == "unsubscribe success"
+        service.subscriptions.publish(_event(2))
+        # Запрос после отмены подписки доходит, а событий больше нет.
+        assert client.request("ping") == "ping"
+        assert len(events) == 1
+        with pytest.raises(RuntimeError):
+            client.subscribe("subscribe drop=sideways", events.append)
+
+
+def test_subscribers_outlive_keepalive_timeout(service_cls):
+    service, port = _start(service_cls, attributes={"keepalive_timeout": 1})
+    try:
+        events_v1, events_v2 = [], []
+        multiplex = MultiplexClient(IP, port)
+        multiplex.subscribe("subscribe", events_v2.append)
+        client = ServiceClient(IP, port)
+        client.subscribe("subscribe")
+        assert _wait(lambda: len(service.subscriptions.stats()) == 2)
+        for seq in range(1, 4):
+            # Между событиями соединения простаивают дольше `keepalive_timeout`.
+            time.sleep(0.7)
+            service.subscriptions.publish(_event(seq))
+            events_v1.append(client.next_event(5)["seq"])
+        assert _wait(lambda: len(events_v2) == 3)
+        assert events_v1 == [1, 2, 3]
+        assert [event["seq"] for event in events_v2] == [1, 2, 3]
+
+        # Соединение без подписки закрывается по истечении времени простоя без ошибок.
+        idle = socket.create_connection((IP, port))
+        idle.sendall(protocol.pack_frame(b"ping"))
+        idle.recv(64)
+        assert _wait(lambda: not _is_open(idle), timeout=5)
+        idle.close()
+        assert service.metrics.as_dict()["request_errors_total"] == 0
+        multiplex.close()
+        client.close()
+    finally:
+        assert service.shutdown(10)
+
+
+def test_idle_connections_above_limit_are_evicted(service_cls):
+    service, port = _start(service_cls, attributes={"max_idle_conn": 3})
+    try:
+        events = []
+        subscriber = MultiplexClient(IP, port)
+        subscriber.subscribe("subscribe", events.append)
+        idle = []
+        for _ in range(5):
+            sock = socket.create_connection((IP, port))
+            sock.sendall(protocol.pack_frame(b"ping"))
+            sock.recv(64)
+            idle.append(sock)
+            time.sleep(0.05)
+        assert _wait(lambda: service.metrics.as_dict()["idle_connections_evicted_total"] >= 2)
+        # Закрыты самые старые простаивающие соединения; подписчик не затронут.
+        assert _wait(lambda: [_is_open(sock) for sock in idle] == [False, False, True, True, True])
+        service.subscriptions.publish(_event(1))
+        assert _wait(lambda: len(events) == 1)
+        assert service.metrics.as_dict()["request_errors_total"] == 0
+        subscriber.close()
+        for sock in idle:
+            sock.close()
+    finally:
+        assert service.shutdown(10)
+
+
+def test_requests_above_n_conn_are_queued():
+    current, peak = [0], [0]
+    lock = threading.Lock()
+
+    class SlowService(StubService):
+        def _request_handler(self, request):
+            with lock:
+                current[0] += 1
+                peak[0] = max(peak[0], current[0])
+            time.sleep(0.05)
+            with lock:
+                current[0] -= 1
+            return request
+
+    service, port = _start(SlowService, n_conn_=2, n_workers_=8)
+    try:
+        with MultiplexClient(IP, port) as client:
+            futures = [client.submit(f"v2 {i}") for i in range(4)]
+            results = []
+            threads = [threading.Thread(target=lambda i=i: results.append(send_request(IP, port, f"v1 {i}")))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            assert [future.result(10).body.decode("utf-8") for future in futures] == [f"v2 {i}" for i in range(4)]
+            for thread in threads:
+                thread.join(10)
+        assert sorted(results) == [f"v1 {i}" for i in range(4)]
+        assert peak[0] == 2
+    finally:
+        assert service.shutdown(10)
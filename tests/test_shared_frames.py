@@ -0,0 +1,119 @@
+"""
+Тесты публикации кадров и результатов распознавания в общей памяти (`SharedFramePublisher`, `SharedFrameReader`).
+"""
+import os
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+from inference import Detection
+from shared_frames import SharedFramePublisher, SharedFrameReader
+
+
+@pytest.fixture
+def publisher():
+    publisher = SharedFramePublisher(f"test_frames_{uuid.uuid4().hex[:12]}", max_frame_bytes=64 * 48 * 3, n_slots=4,
+                                     max_detections=2)
+    yield publisher
+    publisher.close()
+
+
+def _frame(seq):
+    return np.full((48, 64, 3), seq, dtype=np.uint8)
+
+
+def test_round_trip(publisher):
+    reader = SharedFrameReader(publisher.name)
+    try:
+        assert reader.latest() == (0, None, 0.0)
+        assert (reader.n_slots, reader.max_detections, reader.slot_bytes) == (4, 2, 64 * 48 * 3)
+        assert publisher.publish_frame(1, _frame(1), 1700000000.5)
+        seq, frame, timestamp = reader.latest()
+        assert seq == 1 and timestamp == 1700000000.5
+        assert frame.shape == (48, 64, 3) and frame.dtype == np.uint8
+        assert np.array_equal(frame, _frame(1))
+        assert not frame.flags.writeable
+        assert reader.is_valid(1)
+        assert reader.detections(1) is None
+
+        detections = [Detection(2, 0.75, (1.0, 2.0, 3.0, 4.0)), Detection(0, 0.5, (5.0, 6.0, 7.0, 8.0)),
+                      Detection(1, 0.25, (0.0, 0.0, 1.0, 1.0))]
+        assert publisher.publish_detections(1, detections)
+        assert reader.detections(1) == detections[:2]
+        assert reader.latest_detections() == (1, 1700000000.5, detections[:2])
+        del frame
+    finally:
+        reader.close()
+
+
+def test_grayscale_and_float_frames(publisher):
+    reader = SharedFrameReader(publisher.name)
+    try:
+        gray = np.arange(48 * 64, dtype=np.uint8).reshape(48, 64)
+        assert publisher.publish_frame(1, gray, 0.0)
+        _, frame, _ = reader.latest()
+        assert np.array_equal(frame, gray)
+        values = np.linspace(0, 1, 16 * 16, dtype=np.float32).reshape(16, 16)
+        assert publisher.publish_frame(2, values, 0.0)
+        _, frame, _ = reader.latest()
+        assert frame.dtype == np.float32 and np.array_equal(frame, values)
+        del frame
+    finally:
+        reader.close()
+
+
+def test_oversized_frame_is_not_published(publisher):
+    assert not publisher.publish_frame(1, np.zeros((49, 64, 3), dtype=np.uint8), 0.0)
+    assert publisher.n_oversized == 1
+    assert publisher.n_published == 0
+
+
+def test_ring_overwrite(publisher):
+    reader = SharedFrameReader(publisher.name)
+    try:
+        for seq in range(1, 6):
+            publisher.publish_frame(seq, _frame(seq), float(seq))
+        assert reader.seq() == 5
+        # Слот кадра 1 занят кадром 5.
+        assert not reader.is_valid(1)
+        assert not publisher.publish_detections(1, [])
+        assert [reader.is_valid(seq) for seq in (3, 4, 5)] == [True, True, True]
+        assert reader.next_frame(timeout=0)[0] == 5
+        assert reader.n_dropped == 4
+        assert reader.next_frame(timeout=0.01) == (5, None, 0.0)
+    finally:
+        reader.close()
+
+
+def test_reader_in_another_process(publisher):
+    publisher.publish_frame(7, _frame(7), 1700000000.0)
+    publisher.publish_detections(7, [Detection(3, 0.5, (1.0, 2.0, 3.0, 4.0))])
+    code = (
+        "import sys\n"
+        "from shared_frames import SharedFrameReader\n"
+        "reader = SharedFrameReader(sys.argv[1], timeout=5)\n"
+        "seq, frame, timestamp = reader.latest()\n"
+        "print(seq, int(frame.sum()), timestamp, reader.latest_detections()[2][0].class_id)\n"
+        "del frame\n"
+        "reader.close()\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", code, publisher.name], capture_output=True, text=True, env=env,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["7", str(7 * 48 * 64 * 3), "1700000000.0", "3"]
+    # Завершение читателя не удаляет память писателя.
+    SharedFrameReader(publisher.name).close()
+
+
+def test_close_removes_memory(publisher):
+    publisher.close()
+    publisher.close()
+    assert not publisher.publish_frame(1, _frame(1), 0.0)
+    with pytest.raises(FileNotFoundError):
+        SharedFrameReader(publisher.name)
+
@@ -0,0 +1,142 @@
+"""
+Тесты подписок на события распознавания (`subscription`): разбор команды `subscribe`, отбор событий,
+ограничение частоты и выбрасывание событий из заполненной очереди.
+"""
+import json
+
+import pytest
+
+import protocol
+import subscription
+from metrics import MetricsRegistry
+from subscription import Event, Subscriber, SubscriptionHub
+
+
+def _event(kind="detection", class_name="Forward", seq=1):
+    return Event(kind, 0, seq, 1700000000.0, class_name, 0, 0.9, (1.0, 2.0, 3.0, 4.0))
+
+
+def _drain(subscriber):
+    events = []
+    while True:
+        ok, event = subscriber.queue.get(timeout=0)
+        if not ok:
+            return events
+        events.append(event)
+
+
+def test_parse_defaults():
+    subscriber = Subscriber.parse("subscribe")
+    assert subscriber.kinds == ("detection",)
+    assert subscriber.classes is None
+    assert subscriber.rate is None
+    assert subscriber.queue.maxsize == 64
+    assert not subscriber.drop_newest
+    assert not subscriber.binary
+
+
+def test_parse_options():
+    subscriber = Subscriber.parse("SUBSCRIBE commands Forward stop rate=2.5 queue=3 drop=newest", binary=True)
+    assert subscriber.kinds == ("command",)
+    assert subscriber.classes == {"forward", "stop"}
+    assert subscriber.rate == 2.5
+    assert subscriber.queue.maxsize == 3
+    assert subscriber.drop_newest
+    assert subscriber.binary
+    assert Subscriber.parse("subscribe all").kinds == ("detection", "command")
+
+
+@pytest.mark.parametrize("request_", [
+    "stats",
+    "",
+    "subscribe speed=3",
+    "subscribe drop=middle",
+    "subscribe rate=0",
+    "subscribe rate=fast",
+    "subscribe queue=many",
+])
+def test_parse_rejects_invalid_commands(request_):
+    with pytest.raises(ValueError):
+        Subscriber.parse(request_)
+
+
+def test_offer_filters_kinds_and_classes():
+    subscriber = Subscriber.parse("subscribe commands forward")
+    assert not subscriber.offer(_event("detection", "Forward"))
+    assert not subscriber.offer(_event("command", "Stop"))
+    assert subscriber.offer(_event("command", "FORWARD"))
+    assert [event.class_name for event in _drain(subscriber)] == ["FORWARD"]
+
+
+def test_offer_rate_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(subscription.time, "monotonic", lambda: now[0])
+    subscriber = Subscriber.parse("subscribe rate=2")
+    assert subscriber.offer(_event(seq=1))
+    now[0] += 0.4
+    assert not subscriber.offer(_event(seq=2))
+    now[0] += 0.1
+    assert subscriber.offer(_event(seq=3))
+    assert subscriber.n_limited == 1
+    assert [event.seq for event in _drain(subscriber)] == [1, 3]
+
+
+def test_full_queue_drops_oldest_by_default():
+    subscriber = Subscriber.parse("subscribe queue=2")
+    for seq in range(1, 5):
+        assert subscriber.offer(_event(seq=seq))
+    assert subscriber.queue.n_dropped == 2
+    assert [event.seq for event in _drain(subscriber)] == [3, 4]
+
+
+def test_full_queue_drops_newest():
+    subscriber = Subscriber.parse("subscribe queue=2 drop=newest")
+    assert [subscriber.offer(_event(seq=seq)) for seq in range(1, 5)] == [True, True, False, False]
+    assert subscriber.queue.n_dropped == 2
+    assert [event.seq for event in _drain(subscriber)] == [1, 2]
+
+
+def test_closed_subscriber_gets_nothing():
+    subscriber = Subscriber.parse("subscribe")
+    subscriber.close()
+    assert subscriber.closed
+    assert not subscriber.offer(_event())
+    assert subscriber.queue.get(timeout=0) == (False, None)
+
+
+def test_event_encoding():
+    event = _event("command", "Stop", seq=7)
+    body = json.loads(event.encode())
+    assert body["event"] == "command"
+    assert body["class"] == "Stop"
+    assert body["seq"] == 7
+    assert protocol.unpack_event(event.encode(binary=True))[:3] == ("command", 0, 7)
+
+
+def test_hub_publishes_to_matching_subscribers():
+    metrics = MetricsRegistry()
+    hub = SubscriptionHub(metrics)
+    assert hub.publish(_event()) == 0
+    detections = hub.subscribe(Subscriber.parse("subscribe"))
+    commands = hub.subscribe(Subscriber.parse("subscribe commands"))
+    assert detections.id != commands.id
+    assert len(hub) == 2
+    assert hub.publish(_event("detection")) == 1
+    assert hub.publish(_event("command")) == 1
+    assert len(_drain(detections)) == 1
+    assert len(_drain(commands)) == 1
+    assert metrics.as_dict()["events_published_total"] == 2
+    assert metrics.as_dict()["subscribers"] == 2
+
+
+def test_hub_unsubscribe_and_close():
+    hub = SubscriptionHub()
+    first = hub.subscribe(Subscriber.parse("subscribe"))
+    second = hub.subscribe(Subscriber.parse("subscribe"))
+    assert hub.unsubscribe(first.id)
+    assert not hub.unsubscribe(first.id)
+    assert first.closed
+    assert [entry["id"] for entry in hub.stats()] == [second.id]
+    hub.close()
+    assert second.closed
+    assert len(hub) == 0